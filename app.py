@@ -1,107 +1,361 @@
 """ Flask app for Meklet Search Engine Web Client """
 
-from flask import Flask, request, jsonify, make_response, render_template
+import argparse
+import json
+import sys
+import time
+from flask import Flask, request, jsonify, make_response, render_template, Response
 from flask_cors import CORS
 import search_engine
-import pickle
-import time
-from pathlib import Path
+from search_engine.query_processing import get_normalizer
+from search_engine.settings import (
+    QUERY_WORKERS,
+    BATCH_MAX_QUERIES,
+    RESULTS_PER_PAGE,
+    MAX_PAGE_SIZE,
+    MAX_RESULTS,
+)
 from helper import (
     regular_search,
     advanced_search,
+    batch_search,
+    search_page,
     get_link_title_for_docId,
-    LRUCache,
     reconstruct,
 )
 
 
-# Initialize Flask app
-app = Flask(
-    __name__,
-    static_url_path="",
-    static_folder="search_client/static",
-    template_folder="search_client/templates",
-)
-CORS(app)
-app.config["DEBUG"] = True  # Change to False in Production
-id_dict = {}
+def create_app(index_reader=None, debug=False, cache=None, adv_cache=None):
+    """
+    Creates the Flask app, serving queries from `index_reader` (the index in
+    ./index_files by default).
 
-# Initialize Cache
-cache = LRUCache(100)
-adv_cache = LRUCache(100)
+    The index is memory mapped and the NLTK data loaded here, once per process.
+    When the app is created before forking workers (gunicorn --preload, see
+    wsgi.py) the workers share the pages of the index read-only.
 
+    Results are cached in a search_engine.ResultCache shared by all processes by
+    default, any cache with the interface of helper.LRUCache can be given instead.
+    The caches (and their stats()) are in app.config["RESULT_CACHES"].
+    """
+    app = Flask(
+        __name__,
+        static_url_path="",
+        static_folder="search_client/static",
+        template_folder="search_client/templates",
+    )
+    CORS(app)
+    app.config["DEBUG"] = debug
 
-@app.route("/", methods=["GET"])
-def home():
-    """ Route to serve home page of the Web App """
-    return render_template("index.html")
+    if index_reader is None:
+        index_reader = search_engine.IndexReader()
+    get_normalizer()  # Load stopwords and the stemmer before the first query.
 
+    # Initialize Cache
+    if cache is None:
+        cache = search_engine.ResultCache("regular")
+    if adv_cache is None:
+        adv_cache = search_engine.ResultCache("advanced")
+    app.config["RESULT_CACHES"] = {"regular": cache, "advanced": adv_cache}
 
-@app.route("/api/search-results", methods=["GET"])
-def api_search():
-    """
-    API Route for querying the backend.
+    # Regular queries over the shards of the index are evaluated in parallel.
+    shard_pool = None
+    if QUERY_WORKERS > 1:
+        shard_pool = search_engine.ShardPool()
+    app.config["SHARD_POOL"] = shard_pool
 
-        * Params - 1. advanced = {"true","false"}
-                   2.  query="<query_string>"
-        * Return Format - [(docID, tf-idf score, title, summary)]
+    @app.route("/", methods=["GET"])
+    def home():
+        """ Route to serve home page of the Web App """
+        return render_template("index.html")
 
-    Processes the query -> Looks in cache -> If results not found, Looks in Index -> Returns results
+    @app.route("/api/search-results", methods=["GET"])
+    def api_search():
+        """
+        API Route for querying the backend.
+
+            * Params - 1. advanced = {"true","false"}
+                       2.  query="<query_string>"
+                       3. debug = {"true","false"} (optional)
+                       4. offset = <first result, from 0> (optional, 0)
+                       5. limit = <number of results> (optional, RESULTS_PER_PAGE, at
+                          most MAX_PAGE_SIZE, offset + limit at most MAX_RESULTS)
+            * Return Format - [(docID, tf-idf score, title, link, summary)]
+              With debug=true - {"results": <results>, "debug": {"stages":
+              {<stage>: seconds}, "counts": {<counter>: n}, "cached": bool}}
+
+        Processes the query -> Looks in cache -> If results not found, Looks in Index -> Returns results
+
+        The cache holds a ranked list of results deeper than a page (see
+        search_engine.ranked_list), next pages are served from it.
+        """
+
+        params = request.args
+        advanced = params["advanced"]
+        query = params["query"]
+        debug = params.get("debug") == "true"
+
+        # Validate Request Parameters
+        try:
+            assert type(advanced) == str
+            assert type(query) == str
+            if advanced not in ["true", "false"]:
+                raise AssertionError()
+            offset = int(params.get("offset", 0))
+            limit = int(params.get("limit", RESULTS_PER_PAGE))
+            if (
+                offset < 0
+                or not 0 < limit <= MAX_PAGE_SIZE
+                or offset + limit > MAX_RESULTS
+            ):
+                raise AssertionError()
+        except (AssertionError, ValueError):
+            response = make_response("Invalid Request Parameters", 400)
+            return response
+
+        start = time.perf_counter()
+        if debug:
+            search_engine.metrics.start_breakdown()
+
+        # Pick up incremental updates of the index.
+        index_reader.refresh()
+        snapshot = index_reader.snapshot
+        doc_store = snapshot.doc_store
+
+        # Keys hold the version of the index, so that results of an older
+        # index are never served.
+        if advanced == "true":
+            separated_query, operators = search_engine.process_boolean_query(query)
+            cache_query = (snapshot.version, reconstruct(separated_query, operators))
+            results, cached = search_page(
+                lambda k: advanced_search(separated_query, operators, index_reader, k),
+                adv_cache,
+                cache_query,
+                offset,
+                limit,
+            )
+        else:
+            processed_query = search_engine.process_string(query)
+            cache_query = (snapshot.version, reconstruct(processed_query))
+            results, cached = search_page(
+                lambda k: regular_search(processed_query, index_reader, shard_pool, k),
+                cache,
+                cache_query,
+                offset,
+                limit,
+            )
+
+        results_with_data = []
+        with search_engine.metrics.stage("metadata"):
+            for docId, tf_idf in results:
+                title, link, summary = get_link_title_for_docId(docId, doc_store)
+                results_with_data.append((docId, tf_idf, title, link, summary))
+
+        search_engine.metrics.observe("request", time.perf_counter() - start)
+        if debug:
+            breakdown = search_engine.metrics.end_breakdown()
+            breakdown["stages"]["request"] = time.perf_counter() - start
+            breakdown["cached"] = cached
+            return jsonify({"results": results_with_data, "debug": breakdown})
+
+        # Convert the list of results to JSON format.
+        return jsonify(results_with_data)
+
+    @app.route("/api/batch-search", methods=["POST"])
+    def api_batch_search():
+        """
+        API Route for searching many queries in one request.
+
+            * Body - {"queries": [{"query": "<query_string>", "advanced": bool}, ...],
+              "offset": int, "limit": int}, "advanced" is optional (false), the page of
+              results (offset, limit) is optional, like for /api/search-results. At
+              most BATCH_MAX_QUERIES queries.
+            * Return Format - NDJSON, one line per query in the order queries finish:
+              {"id": <position in queries>, "results": [(docID, tf-idf score, title,
+              link, summary)]}
+
+        Duplicate queries are evaluated once, see helper.batch_search().
+        """
+        body = request.get_json(silent=True)
+
+        # Validate Request Parameters
+        try:
+            assert type(body) == dict and type(body.get("queries")) == list
+            queries = []
+            for item in body["queries"]:
+                assert type(item) == dict and type(item.get("query")) == str
+                assert type(item.get("advanced", False)) == bool
+                queries.append((item["query"], item.get("advanced", False)))
+            if len(queries) > BATCH_MAX_QUERIES:
+                raise AssertionError()
+            offset = body.get("offset", 0)
+            limit = body.get("limit", RESULTS_PER_PAGE)
+            assert type(offset) == int and type(limit) == int
+            if (
+                offset < 0
+                or not 0 < limit <= MAX_PAGE_SIZE
+                or offset + limit > MAX_RESULTS
+            ):
+                raise AssertionError()
+        except AssertionError:
+            response = make_response("Invalid Request Parameters", 400)
+            return response
+
+        # Pick up incremental updates of the index, the batch reads one snapshot.
+        index_reader.refresh()
+        batch_reader = search_engine.BatchReader(index_reader)
+        doc_store = batch_reader.snapshot.doc_store
+        results = batch_search(
+            queries,
+            batch_reader,
+            shard_pool,
+            app.config["RESULT_CACHES"],
+            offset=offset,
+            limit=limit,
+        )
+
+        def lines():
+            for position, query_results in results:
+                results_with_data = []
+                for docId, tf_idf in query_results:
+                    title, link, summary = get_link_title_for_docId(docId, doc_store)
+                    results_with_data.append((docId, tf_idf, title, link, summary))
+                yield json.dumps({"id": position, "results": results_with_data}) + "\n"
+
+        return Response(lines(), mimetype="application/x-ndjson")
+
+    @app.route("/api/suggest", methods=["GET"])
+    def api_suggest():
+        """
+        API Route for autocompletion of the last word of a query.
+
+            * Params - query="<query_string>"
+            * Return Format - ["<query_string with its last word completed>"]
+
+        Completions are the words of the index terms (the most frequent word of each stem),
+        by decreasing document frequency.
+        """
+        query = request.args.get("query", "")
+        start = time.perf_counter()
+        words = query.split()
+        if not words or query[-1].isspace():
+            return jsonify([])
+        prefix = words[-1]
+        index_reader.refresh()
+        completions = search_engine.complete(prefix.lower(), index_reader)
+        head = query[: len(query) - len(prefix)]
+        search_engine.metrics.observe("suggest", time.perf_counter() - start)
+        return jsonify([head + completion for completion in completions])
+
+    @app.teardown_request
+    def end_breakdown(exception):
+        """ Stops the breakdown of a debug request, also when it failed """
+        search_engine.metrics.end_breakdown()
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        """ Search metrics of this process in the Prometheus text format """
+        return Response(
+            search_engine.metrics.render(app.config["RESULT_CACHES"]),
+            mimetype="text/plain; version=0.0.4",
+        )
+
+    return app
+
+
+def load_warm_up_queries(path):
+    """
+    Reads the queries of a warm-up file, one per line. Empty lines and lines starting
+    with "#" are skipped, queries holding a '"' are advanced (boolean) queries.
     """
+    with open(path, encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith("#")]
 
-    params = request.args
-    advanced = params["advanced"]
-    query = params["query"]
 
-    # Validate Request Parameters
+def warm_up(app, queries):
+    """
+    Replays `queries` (see load_warm_up_queries) through the search API of `app` before
+    it serves traffic, loading the pages of the index they read, the postings and stems
+    of their words and their results. Workers forked afterwards (wsgi.py) inherit them.
+    Warm-up requests are not recorded in the metrics.
+    """
+    client = app.test_client()
+    enabled = search_engine.metrics.enabled
+    search_engine.metrics.enabled = False
+    start = time.perf_counter()
     try:
-        assert type(advanced) == str
-        assert type(query) == str
-        if advanced not in ["true", "false"]:
-            raise AssertionError()
-    except AssertionError:
-        response = make_response("Invalid Request Parameters", 400)
-        return response
-
-    if advanced == "true":
-        separated_query, operators = search_engine.process_boolean_query(query)
-        cache_query = reconstruct(separated_query, operators)
-        cache_search = adv_cache.get(cache_query)
-        if cache_search != -1:
-            results = cache_search
-        else:
-            results = advanced_search(separated_query, operators)
-            adv_cache.put(cache_query, results)
-    else:
-        processed_query = search_engine.process_string(query)
-        cache_query = reconstruct(processed_query)
-        cache_search = cache.get(cache_query)
-        if cache_search != -1:
-            results = cache_search
-        else:
-            results = regular_search(processed_query)
-            cache.put(cache_query, results)
+        for query in queries:
+            advanced = "true" if '"' in query else "false"
+            client.get(
+                "/api/search-results",
+                query_string={"advanced": advanced, "query": query},
+            )
+    finally:
+        search_engine.metrics.enabled = enabled
+        # Worker processes started by the queries can not be shared with forked
+        # server processes, they are started again on first use.
+        if app.config["SHARD_POOL"] is not None:
+            app.config["SHARD_POOL"].close()
+    print(
+        f"Warmed up with {len(queries)} queries in {time.perf_counter() - start:.2f}s"
+    )
 
-    results_with_data = []
-    for docId, tf_idf in results:
-        data = get_link_title_for_docId(docId, id_dict)
-        results_with_data.append((docId, tf_idf, data[0], data[1]))
 
-    # Convert the list of results to JSON format.
-    return jsonify(results_with_data)
+def parse_args():
+    parser = argparse.ArgumentParser(description="Runs the Meklet development server.")
+    parser.add_argument(
+        "--index",
+        choices=["ask", "keep", "update", "rebuild"],
+        default="ask" if sys.stdin.isatty() else "keep",
+        help="what to do with an existing index: ask at the prompt (default on a terminal),"
+        " use it as is (default otherwise), update it with changes of the corpus or rebuild it."
+        " A missing index is always built.",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="never download NLTK data, fail if it is not installed",
+    )
+    parser.add_argument(
+        "--warm-up",
+        metavar="FILE",
+        help="replay the queries of FILE, one per line, before serving",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
+    args = parse_args()
 
-    # Download Required Dependencies
-    search_engine.download_nltk_deps()
+    # Download Required Dependencies, if they are not installed yet.
+    search_engine.download_nltk_deps(offline=args.offline)
 
     # Check if index needs to be created
-    if not Path("./index_files/index.db").exists():
+    update = False
+    if not search_engine.index_exists():
         create = True
+    elif args.index == "ask":
+        print(
+            "Do you want to recreate the index (y), update it with changes of the corpus (u) or use it as is (n)?"
+        )
+        answer = input().lower()
+        create = answer not in ("n", "u")
+        update = answer == "u"
     else:
-        print("Do you want to recreate the index? (y/n)")
-        create = False if input().lower() == "n" else True
+        create = args.index == "rebuild"
+        update = args.index == "update"
+
+    if update:
+        try:
+            no_added, no_removed = search_engine.update_index()
+            print(
+                f"Index Updated! Added {no_added} and removed {no_removed} documents."
+            )
+        except Exception as e:
+            print(e)
+            print("Aborting! Please Try Again.")
+            exit()
 
     if create:
         try:
@@ -113,9 +367,13 @@ if __name__ == "__main__":
             print("Aborting! Please Try Again.")
             exit()
 
-    # Load docId dict in memory
-    file = open("./index_files/docId.pkl", "rb")
-    id_dict = pickle.load(file)
+    # Open the index once, it is shared by all requests.
+    app = create_app(debug=True)  # Development server, see wsgi.py for production.
+    if args.warm_up:
+        warm_up(app, load_warm_up_queries(args.warm_up))
+
+    # Merge the segments of incremental updates in the background.
+    search_engine.Compactor().start()
 
     # Start the Server process
-    app.run(use_reloader=False)
+    app.run(use_reloader=False, threaded=True)
@@ -0,0 +1,9 @@
+"""
+*Benchmarks*
+
+Performance benchmarks of the search engine, see __main__.py for usage.
+
+    * corpus.py writes a synthetic Wikipedia-like corpus.
+    * indexing.py times the phases of index construction and their peak memory.
+    * queries.py measures the latency of regular and advanced (boolean) queries.
+"""
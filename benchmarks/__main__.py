@@ -0,0 +1,179 @@
+"""
+Runs the benchmark suite and writes its results as JSON.
+
+Usage - python -m benchmarks [--docs 10000] [--output benchmark.json] ...
+
+A synthetic corpus is generated at CORPUS_PATH in <work dir> (unless it already exists,
+or --corpus is given), indexed in <work dir>/index_files, and queried. With CORPUS_PATH
+set to a .tar or .jsonl bundle, the generated documents are packed into it. Run it
+from the root of the project, see python -m benchmarks --help for all options.
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+from search_engine import settings
+from search_engine.corpus import open_corpus, DirectoryCorpus
+from search_engine.settings import CORPUS_PATH
+from .corpus import generate_corpus, write_bundle
+from .indexing import benchmark_indexing
+from .queries import benchmark_queries
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+def _corpus_stats(corpus_path):
+    """ Returns the number of documents the indexer reads at `corpus_path`, and their size. """
+    corpus = open_corpus(corpus_path)
+    names = corpus.names()
+    if isinstance(corpus, DirectoryCorpus):
+        size = sum(os.path.getsize(os.path.join(corpus_path, name)) for name in names)
+    else:
+        size = sum(os.path.getsize(bundle) for bundle in corpus.paths)
+    return {"documents": len(names), "bytes": size}
+
+
+def _copy_corpus(source, corpus_path):
+    """
+    Copies the corpus at `source`, a directory or a bundle file (or a glob pattern of
+    bundle files if CORPUS_PATH is one too), to `corpus_path`.
+    """
+    if os.path.isdir(source):
+        shutil.rmtree(corpus_path, ignore_errors=True)
+        shutil.copytree(source, corpus_path)
+        return
+    bundles = sorted(glob.glob(source))
+    if not bundles:
+        raise Exception("Error- Corpus not found: " + source)
+    if glob.has_magic(corpus_path):
+        target_dir = os.path.dirname(corpus_path)
+        os.makedirs(target_dir, exist_ok=True)
+        for path in glob.glob(corpus_path):
+            os.remove(path)
+        for bundle in bundles:
+            shutil.copy(bundle, target_dir)
+    elif len(bundles) == 1:
+        shutil.copy(bundles[0], corpus_path)
+    else:
+        raise Exception(
+            "Error- Several bundles can only be copied to a glob CORPUS_PATH."
+        )
+
+
+def _generate_corpus(corpus_path, args):
+    """ Generates the synthetic corpus at `corpus_path`, packed if it is a bundle file. """
+    if glob.has_magic(corpus_path):
+        raise Exception("Error- Give --corpus to benchmark CORPUS_PATH " + CORPUS_PATH)
+    if os.path.splitext(corpus_path)[1]:
+        corpus_dir = os.path.join(args.work_dir, "generated")
+        generate_corpus(
+            corpus_dir, args.docs, args.vocabulary, args.doc_length, args.seed
+        )
+        write_bundle(corpus_dir, corpus_path)
+        shutil.rmtree(corpus_dir)
+    else:
+        generate_corpus(
+            corpus_path, args.docs, args.vocabulary, args.doc_length, args.seed
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks", description=__doc__.split("\n")[1]
+    )
+    parser.add_argument(
+        "--work-dir", default="benchmark_run", help="directory of the corpus and index"
+    )
+    parser.add_argument(
+        "--corpus",
+        help="copy this corpus (directory or bundles) instead of generating one",
+    )
+    parser.add_argument("--docs", type=int, default=10000, help="documents to generate")
+    parser.add_argument(
+        "--vocabulary", type=int, default=50000, help="distinct words to generate"
+    )
+    parser.add_argument(
+        "--doc-length", type=int, default=300, help="mean words per document"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="parse_docs workers (PARSE_WORKERS by default), or build_shards workers",
+    )
+    parser.add_argument(
+        "--shards", type=int, default=1, help="build the index as shards"
+    )
+    parser.add_argument(
+        "--query-workers",
+        type=int,
+        default=0,
+        help="evaluate regular queries over shards",
+    )
+    parser.add_argument("--queries", type=int, default=200, help="queries of each kind")
+    parser.add_argument("--warm-passes", type=int, default=3)
+    parser.add_argument(
+        "--skip-indexing", action="store_true", help="query the existing index"
+    )
+    parser.add_argument("--output", default="benchmark.json")
+    args = parser.parse_args(argv)
+
+    # The indexer reads CORPUS_PATH relative to the work dir.
+    corpus_path = os.path.join(args.work_dir, CORPUS_PATH)
+    results = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "arguments": vars(args),
+        "settings": {
+            name: value for name, value in vars(settings).items() if name.isupper()
+        },
+    }
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    if args.corpus:
+        _copy_corpus(args.corpus, corpus_path)
+    elif not glob.glob(corpus_path):
+        _generate_corpus(corpus_path, args)
+    results["corpus"] = _corpus_stats(corpus_path)
+
+    if not args.skip_indexing:
+        results["indexing"] = benchmark_indexing(
+            args.work_dir, args.workers, args.shards
+        )
+    index_dir = os.path.join(args.work_dir, "index_files")
+    results["index_bytes"] = sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(index_dir)
+        for name in files
+    )
+
+    output = os.path.abspath(args.output)
+    results["queries"] = benchmark_queries(
+        args.work_dir, args.queries, args.warm_passes, args.seed, args.query_workers
+    )
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,104 @@
+"""
+Generates a synthetic corpus in the layout of the Wikipedia dataset -
+
+    <link>
+    <blank line>
+    <title>
+    <blank line>
+    <body>
+
+Documents are named <Title_Words>_<no>.txt. Words of the body follow a Zipf
+distribution over a vocabulary of made up words, mixed with English stopwords, so
+that postings lengths are skewed like in natural text. write_bundle() packs the
+generated documents into a tar or JSON lines bundle (see search_engine/corpus.py).
+"""
+
+import gzip
+import json
+import os
+import random
+import tarfile
+from itertools import accumulate
+from search_engine.corpus import open_corpus, JSONL_EXTENSIONS
+
+SYLLABLES = [
+    consonant + vowel
+    for consonant in "bcdfghklmnprstvwz"
+    for vowel in ("a", "e", "i", "o", "u", "ai", "ou")
+]
+ENDINGS = ["", "", "", "s", "ing", "ed", "er", "ly", "tion"]
+STOPWORDS = "the a of and to in is was it for on with as by at from that this".split()
+
+# Fraction of stopwords in the body, and of words ending a sentence.
+STOPWORD_RATIO = 0.3
+SENTENCE_END_RATIO = 0.06
+
+
+def make_vocabulary(size, rng):
+    """ Returns `size` distinct made up words. """
+    words = set()
+    while len(words) < size:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4)))
+        words.add(word + rng.choice(ENDINGS))
+    words = sorted(words)
+    rng.shuffle(words)  # Word rank in the Zipf distribution.
+    return words
+
+
+def generate_corpus(
+    corpus_dir, no_docs=10000, vocabulary_size=50000, mean_length=300, seed=1
+):
+    """
+    Writes `no_docs` documents of about `mean_length` words to `corpus_dir`.
+    The same arguments always generate the same corpus. Returns the number of
+    bytes written.
+    """
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(vocabulary_size, rng)
+    cum_weights = list(
+        accumulate(1 / rank ** 1.07 for rank in range(1, vocabulary_size + 1))
+    )
+    os.makedirs(corpus_dir, exist_ok=True)
+    total_bytes = 0
+    for doc_no in range(1, no_docs + 1):
+        print(f"Generating {doc_no} of {no_docs}", end="\r")
+        title = " ".join(
+            word.capitalize()
+            for word in rng.choices(vocabulary[:2000], k=rng.randint(1, 3))
+        )
+        name = f"{title.replace(' ', '_')}_{doc_no}"
+        length = max(5, int(rng.lognormvariate(0, 0.6) * mean_length))
+        body = rng.choices(vocabulary, cum_weights=cum_weights, k=length)
+        for pos in range(length):
+            chance = rng.random()
+            if chance < STOPWORD_RATIO:
+                body[pos] = rng.choice(STOPWORDS)
+            elif chance > 1 - SENTENCE_END_RATIO:
+                body[pos] += "."
+        text = f"https://en.wikipedia.org/wiki/{name}\n\n{title}\n\n{' '.join(body)}\n"
+        with open(os.path.join(corpus_dir, name + ".txt"), "w") as f:
+            total_bytes += f.write(text)
+    print()
+    return total_bytes
+
+
+def write_bundle(corpus_dir, path):
+    """
+    Packs the documents of `corpus_dir` into the bundle file `path`, a JSON lines file of
+    {"name", "text"} records or a tar archive, compressed as its extension says.
+    """
+    corpus = open_corpus(corpus_dir)
+    names = sorted(corpus.names())
+    if path.endswith(JSONL_EXTENSIONS):
+        with (gzip.open if path.endswith(".gz") else open)(
+            path, "wt", encoding="utf-8"
+        ) as f:
+            for name, text in corpus.read(names):
+                f.write(json.dumps({"name": name, "text": text}) + "\n")
+        return
+    compression = {"gz": "gz", "tgz": "gz", "bz2": "bz2", "xz": "xz"}.get(
+        path.rsplit(".")[-1]
+    )
+    with tarfile.open(path, "w:" + compression if compression else "w") as tar:
+        for name in names:
+            tar.add(os.path.join(corpus_dir, name), arcname=name)
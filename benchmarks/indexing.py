@@ -0,0 +1,103 @@
+"""
+Times every phase of index construction (as run by start_indexing()), of a single
+index or of a sharded one (built by build_shards()).
+
+Each phase runs in a fresh process, since phases only communicate through the files in
+./index_files. Its peak resident memory is therefore the memory of that phase alone
+(and of its largest worker process, for parse_docs with several workers and for
+build_shards).
+"""
+
+import contextlib
+import multiprocessing
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, peak memory is not measured.
+    resource = None
+
+PHASES = [
+    "assign_docId",
+    "parse_docs",
+    "merge_indices",
+    "construct_index",
+    "reset_segments",
+]
+SHARDED_PHASES = ["assign_docId", "build_shards", "reset_segments"]
+
+
+def _peak_rss(children=False):
+    """ Returns the peak resident memory (in bytes) of this process or its largest child. """
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _run_phase(phase, work_dir, kwargs):
+    """ Runs a phase of the indexer in `work_dir`, returns its time and peak memory. """
+    from search_engine import index
+
+    os.chdir(work_dir)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        getattr(index, phase)(**kwargs)
+        seconds = time.perf_counter() - start
+    result = {"seconds": seconds, "peak_rss_bytes": _peak_rss()}
+    if phase == "build_shards" or (kwargs.get("workers") or 1) > 1:
+        result["peak_worker_rss_bytes"] = _peak_rss(children=True)
+    return result
+
+
+def _phase_process(phase, work_dir, kwargs, connection):
+    """ Sends the result of _run_phase(), or its exception, through `connection`. """
+    try:
+        result = _run_phase(phase, work_dir, kwargs)
+    except Exception as error:
+        result = error
+    connection.send(result)
+
+
+def _phase_kwargs(phase, workers, shards):
+    """ Returns the arguments of a phase, the defaults of the indexer unless given. """
+    kwargs = {}
+    if phase in ("parse_docs", "build_shards") and workers:
+        kwargs["workers"] = workers
+    if phase in ("build_shards", "reset_segments") and shards > 1:
+        kwargs["shards"] = shards
+    return kwargs
+
+
+def benchmark_indexing(work_dir, workers=None, shards=1):
+    """
+    Builds the index of the corpus in `work_dir`/corpus, as `shards` shards, returns a
+    dictionary mapping each phase to its {"seconds", "peak_rss_bytes"} (None where it
+    can not be measured). `workers` is passed on to parse_docs (PARSE_WORKERS by
+    default), or to build_shards (one per shard by default).
+    """
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for phase in SHARDED_PHASES if shards > 1 else PHASES:
+        print(f"Indexing phase {phase}", end="\r")
+        kwargs = _phase_kwargs(phase, workers, shards)
+        # Not a Pool process, daemonic processes can not start the workers of a phase.
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(
+            target=_phase_process,
+            args=(phase, os.path.abspath(work_dir), kwargs, sender),
+        )
+        process.start()
+        sender.close()
+        result = receiver.recv()
+        process.join()
+        if isinstance(result, Exception):
+            raise result
+        results[phase] = result
+    results["total_seconds"] = sum(result["seconds"] for result in results.values())
+    print()
+    return results
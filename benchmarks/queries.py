@@ -0,0 +1,129 @@
+"""
+Measures the latency of regular and advanced (boolean) queries, from query processing
+to the top 10 results, like an uncached request of the app.
+
+    * cold - every query is evaluated once, on a new IndexReader and with an empty
+      stem cache.
+    * warm - the queries are evaluated again on the same reader, after the cold pass.
+
+With query workers, regular queries are evaluated over the shards of the index by a
+search_engine.ShardPool (like the app with QUERY_WORKERS), whose processes are started
+before the cold pass.
+
+Queries are sampled from the text of random documents of the corpus (CORPUS_PATH, read
+like the indexer reads it), so that they mix common and rare terms and quoted
+sub-queries are often phrases of the corpus.
+"""
+
+import os
+import random
+import statistics
+import time
+import search_engine
+from search_engine.corpus import open_corpus
+from search_engine.query_processing import get_normalizer
+from search_engine.settings import CORPUS_PATH
+from helper import regular_search, advanced_search
+
+OPERATORS = ["and", "or", "and not"]
+
+# Number of documents queries are sampled from, read in one pass over the corpus.
+SAMPLED_DOCUMENTS = 1000
+
+
+def _windows(corpus_path, rng):
+    """ Yields the words of random windows of 1 to 3 words of the corpus. """
+    corpus = open_corpus(corpus_path)
+    names = corpus.names()
+    # Documents are read in corpus order, bundles are read once.
+    sample = sorted(rng.sample(range(len(names)), min(SAMPLED_DOCUMENTS, len(names))))
+    texts = [text for _, text in corpus.read([names[no] for no in sample])]
+    while True:
+        text = rng.choice(texts)
+        words = [word.strip(".") for word in text.split("\n", 4)[-1].split()]
+        if words:
+            start = rng.randrange(len(words))
+            yield words[start : start + rng.randint(1, 3)]
+
+
+def sample_queries(corpus_path=CORPUS_PATH, no_queries=200, seed=1):
+    """ Returns (regular queries, advanced queries) sampled from the corpus. """
+    rng = random.Random(seed)
+    windows = _windows(corpus_path, rng)
+    regular = [" ".join(next(windows)) for _ in range(no_queries)]
+    advanced = []
+    for _ in range(no_queries):
+        query = '"' + " ".join(next(windows)) + '"'
+        for _ in range(rng.randint(1, 3)):
+            query += f' {rng.choice(OPERATORS)} "{" ".join(next(windows))}"'
+        advanced.append(query)
+    return regular, advanced
+
+
+def latency_stats(latencies):
+    """ Returns the count, mean, p50, p95, p99 and max of latencies, in milliseconds. """
+    milliseconds = sorted(latency * 1000 for latency in latencies)
+    if len(milliseconds) < 2:
+        milliseconds = milliseconds * 2
+    percentiles = statistics.quantiles(milliseconds, n=100, method="inclusive")
+    return {
+        "count": len(latencies),
+        "mean_ms": statistics.mean(milliseconds),
+        "p50_ms": percentiles[49],
+        "p95_ms": percentiles[94],
+        "p99_ms": percentiles[98],
+        "max_ms": milliseconds[-1],
+    }
+
+
+def _search(kind, query, reader, shard_pool=None):
+    if kind == "regular":
+        return regular_search(search_engine.process_string(query), reader, shard_pool)
+    return advanced_search(*search_engine.process_boolean_query(query), reader)
+
+
+def _timed_pass(kind, queries, reader, shard_pool=None):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        _search(kind, query, reader, shard_pool)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def benchmark_queries(work_dir, no_queries=200, warm_passes=3, seed=1, query_workers=0):
+    """
+    Runs the query benchmarks on the index in `work_dir`/index_files, of the corpus at
+    CORPUS_PATH in `work_dir`. Returns a dictionary mapping "regular" and "advanced"
+    to the latency statistics of their "cold" and "warm" runs. Regular queries are
+    evaluated by a ShardPool of `query_workers` processes if there are more than one.
+    """
+    os.chdir(work_dir)
+    queries = dict(
+        zip(("regular", "advanced"), sample_queries(CORPUS_PATH, no_queries, seed))
+    )
+    shard_pool = None
+    if query_workers > 1:
+        shard_pool = search_engine.ShardPool(query_workers)
+    results = {}
+    try:
+        for kind, kind_queries in queries.items():
+            print(f"Running {kind} queries", end="\r")
+            get_normalizer().stem_word.cache_clear()
+            reader = search_engine.IndexReader()
+            pool = shard_pool if kind == "regular" else None
+            if pool is not None:
+                # Starts the workers, their start up is not a query latency.
+                _search(kind, kind_queries[0], reader, pool)
+                get_normalizer().stem_word.cache_clear()
+                reader = search_engine.IndexReader()
+            cold = _timed_pass(kind, kind_queries, reader, pool)
+            warm = []
+            for _ in range(warm_passes):
+                warm += _timed_pass(kind, kind_queries, reader, pool)
+            results[kind] = {"cold": latency_stats(cold), "warm": latency_stats(warm)}
+    finally:
+        if shard_pool is not None:
+            shard_pool.close()
+    print()
+    return results
@@ -0,0 +1,20 @@
+""" gunicorn settings for serving wsgi:app, see wsgi.py """
+
+import multiprocessing
+import os
+
+bind = os.environ.get("MEKLET_BIND", "127.0.0.1:5000")
+
+# Scoring is CPU bound, so throughput grows with processes rather than threads.
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+threads = 2
+
+# Open the index in the master process, before forking the workers.
+preload_app = True
+
+
+def when_ready(server):
+    """ Merges the segments of incremental updates in the master process only. """
+    import search_engine
+
+    search_engine.Compactor().start()
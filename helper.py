@@ -1,19 +1,24 @@
 """ Contains helper classes/functions for searching results in index """
 
 import search_engine
-import pickle
-import sys
-from pathlib import Path
+import threading
+import time
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from search_engine.ranked_list import RankedList, list_depth
+from search_engine.settings import BATCH_WORKERS, RESULTS_PER_PAGE
 
 
 class LRUCache:
-    """ Class to implement LRU Cache """
+    """ Class to implement LRU Cache, safe to share between threads """
 
     def __init__(self, capacity: int):
         """ Initializes an Ordered Dictionary and cache capacity """
         self.cache = OrderedDict()
         self.capacity = capacity
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
 
     def get(self, key: int) -> int:
         """
@@ -21,11 +26,14 @@ class LRUCache:
         is not found in dict / cache. Moves the key to the end to mark that it
         was recently used.
         """
-        if key not in self.cache:
-            return -1
-        else:
-            self.cache.move_to_end(key)
-            return self.cache[key]
+        with self.lock:
+            if key not in self.cache:
+                self.misses += 1
+                return -1
+            else:
+                self.hits += 1
+                self.cache.move_to_end(key)
+                return self.cache[key]
 
     def put(self, key: int, value: int) -> None:
         """
@@ -33,10 +41,25 @@ class LRUCache:
         that it was recently used. Checks whether the length of our ordered dictionary
         has exceeded the cache capacity, If so then removes the first key (least recently used)
         """
-        self.cache[key] = value
-        self.cache.move_to_end(key)
-        if len(self.cache) > self.capacity:
-            self.cache.popitem(last=False)
+        with self.lock:
+            self.cache[key] = value
+            self.cache.move_to_end(key)
+            if len(self.cache) > self.capacity:
+                self.cache.popitem(last=False)
+
+    def clear(self) -> None:
+        """ Removes all keys, used when the index changes """
+        with self.lock:
+            self.cache.clear()
+
+    def stats(self) -> dict:
+        """ Returns the number of hits, misses and entries of the cache """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.cache),
+            }
 
 
 def reconstruct(query, operators=None):
@@ -51,6 +74,8 @@ def reconstruct(query, operators=None):
             for piece in query[itr]:
                 temp_query += piece + " "
             temp_query = temp_query.strip()
+            if getattr(query[itr], "slop", 0):
+                temp_query += f"~{query[itr].slop}"
             if operators[itr] != "":
                 recons_query += operators[itr] + " " + temp_query + " "
             else:
@@ -58,98 +83,135 @@ def reconstruct(query, operators=None):
     return recons_query.strip()
 
 
-def get_link_title_for_docId(docId, id_dict):
-    "Given a docId returns the document title and Wikipedia link."
-    doc_name = id_dict[docId]
-    file = open("./corpus/" + doc_name, "r")
-    lines = file.readlines()
-    title = lines[2].strip()
-    link = "https://en.wikipedia.org/wiki/" + Path(doc_name).stem
-    return title, link
+def get_link_title_for_docId(docId, doc_store):
+    """
+    Given a docId returns the document title, Wikipedia link and summary,
+    read from the search_engine.DocStore built by the indexer.
+    """
+    title, link, summary = doc_store.get(docId)
+    return title, link, summary
 
 
-def regular_search(processed_query):
-    """ Takes in a query and returns a list of corresponding (docId,freq) pairs """
-    res = sorted(
-        search_engine.calculate_query_tf_idf(processed_query),
-        key=lambda x: x[1],
-        reverse=True,
-    )[:10]
+def regular_search(processed_query, reader=None, shard_pool=None, k=10):
+    """
+    Takes in a query and returns a list of the k best corresponding (docId,freq) pairs.
+    `reader` is the search_engine.IndexReader to search in, its shards are searched
+    in parallel by `shard_pool` (a search_engine.ShardPool) if given.
+    """
+    processed_query = search_engine.expand_wildcards(processed_query, reader)
+    if shard_pool is not None:
+        return shard_pool.top_k(processed_query, reader, k)
+    res = search_engine.top_k_documents(processed_query, reader, k)
     return res
 
 
-def merge(list_a, list_b, operator="and"):
-    """ Takes in two sorted lists and returns a single sorted merged list """
-    list_c = []
-    i = 0
-    j = 0
-    while i < len(list_a) and j < len(list_b):
-        if list_a[i][0] == list_b[j][0]:
-            score = (
-                list_a[i][1] + list_b[j][1]
-                if operator == "and"
-                else max(list_a[i][1], list_b[j][1])
-            )  # Add scores for "and", take highest for "or"
-            list_c.append((list_a[i][0], score))
-            i += 1
-            j += 1
-        elif list_a[i][0] < list_b[j][0]:
-            if operator != "and":
-                list_c.append(list_a[i])
-            i += 1
-        else:
-            if operator != "and":
-                list_c.append(list_b[j])
-            j += 1
-
-    while i < len(list_a) and operator == "or":
-        list_c.append(list_a[i])
-        i += 1
-    while j < len(list_b) and operator == "or":
-        list_c.append(list_b[j])
-        j += 1
-    return list_c
+def advanced_search(separated_query, operators, reader=None, k=10):
+    """
+    Takes in a boolean query and returns the k best (docId, score) pairs, evaluated
+    with streaming postings iterators using Optimal Merge Pattern Algorithm.
+    `reader` is the search_engine.IndexReader to search in.
+    """
+    return search_engine.boolean_search(separated_query, operators, reader, k)
 
 
-def advanced_search(separated_query, operators):
+def search_page(search, cache, cache_query, offset=0, limit=RESULTS_PER_PAGE):
     """
-    Takes in a boolean query and returns results evaluated using
-    Optimal Merge Pattern Algorithm
+    Returns the (docId, score) pairs of the page (offset, limit) of a query, and
+    whether it was served from `cache`. The cache holds a search_engine RankedList per
+    `cache_query`, deeper than a page, and `search(k)` returns the k best results of
+    the query when the list is missing or not deep enough.
     """
-    results = []
-    for query in separated_query:
-        results.append(
-            sorted(
-                search_engine.calculate_query_tf_idf(query),
-                key=lambda x: x[0],
-            )
-        )  # Add list (sorted according to docId) to the 2D-List
-
-    and_present = 1 if "and" in operators else 0
-
-    # First Merges list with "and" operator
-    while and_present:
-        smallest = (
-            sys.maxsize,
-            sys.maxsize,
-        )  # Find lists with smallest length and separated by "and"
-        pos = 0
-        for i in range(len(results)):
-            if operators[i] == "and":
-                if len(results[i - 1]) + len(results[i]) < smallest[0] + smallest[1]:
-                    smallest = (len(results[i - 1]), len(results[i]))
-                    pos = i
-        merged_list = merge(results[pos - 1], results[pos])  # Merge smallest lists
-        # Remove relevant lists and operator "and", and add merged list
-        results = results[: pos - 1] + [merged_list] + results[pos + 1 :]
-        operators = operators[:pos] + operators[pos + 1 :]
-        and_present = 1 if "and" in operators else 0
-
-    # Only "or" operator would have been left
-    final_result = []
-    for result in results:
-        result.sort(key=lambda x: x[0])
-        final_result = merge(final_result, result, operator="or")
-
-    res = sorted(final_result, key=lambda x: x[1], reverse=True)[:10]
-    return res
+    ranked_list = cache.get(cache_query)
+    if not isinstance(ranked_list, RankedList):
+        ranked_list = None  # A miss, or results of an older version.
+    elif ranked_list.covers(offset + limit):
+        return ranked_list.page(offset, limit), True
+    depth = list_depth(offset + limit, ranked_list)
+    ranked_list = RankedList(search(depth), depth)
+    cache.put(cache_query, ranked_list)
+    return ranked_list.page(offset, limit), False
+
+
+def batch_search(
+    queries,
+    reader=None,
+    shard_pool=None,
+    caches=None,
+    workers=BATCH_WORKERS,
+    offset=0,
+    limit=RESULTS_PER_PAGE,
+):
+    """
+    Searches many queries at once. `queries` is a list of (query string, advanced)
+    pairs, advanced queries being boolean queries. Yields a (position in `queries`,
+    results) pair per query, in the order queries finish, results being the page
+    (offset, limit) of the results of regular_search() or advanced_search().
+
+        * Queries with the same normalized form (see reconstruct()) are evaluated once.
+        * All queries read the index through one search_engine.BatchReader (`reader`
+          is wrapped in one unless it is one), so they see the same index and the
+          postings of the terms they share are read once.
+        * Queries are scored in `workers` threads, regular queries over shards in
+          `shard_pool` if given.
+        * Ranked lists of results are looked up in and added to `caches`,
+          {"regular": cache, "advanced": cache} like app.config["RESULT_CACHES"], if
+          given (see search_page()).
+    """
+    if reader is None:
+        reader = search_engine.index_lookup.get_default_reader()
+    if not isinstance(reader, search_engine.BatchReader):
+        reader = search_engine.BatchReader(reader)
+    version = reader.snapshot.version
+    start = time.perf_counter()
+
+    # Normalized queries -> positions in `queries`, in order of first appearance.
+    positions = OrderedDict()
+    for position, (query, advanced) in enumerate(queries):
+        if advanced:
+            separated_query, operators = search_engine.process_boolean_query(query)
+            key = ("advanced", reconstruct(separated_query, operators))
+            processed = (separated_query, operators)
+            positions.setdefault(key, (processed, []))[1].append(position)
+        else:
+            processed_query = search_engine.process_string(query)
+            key = ("regular", reconstruct(processed_query))
+            positions.setdefault(key, (processed_query, []))[1].append(position)
+    search_engine.metrics.count("batch_queries", len(queries))
+    search_engine.metrics.count("batch_duplicates", len(queries) - len(positions))
+
+    def search(key, processed):
+        def evaluate(k):
+            if key[0] == "advanced":
+                return advanced_search(*processed, reader, k)
+            return regular_search(processed, reader, shard_pool, k)
+
+        if not caches:
+            return evaluate(offset + limit)[offset:]
+        cache_query = (version, key[1])
+        results, _ = search_page(evaluate, caches[key[0]], cache_query, offset, limit)
+        return results
+
+    try:
+        if workers <= 1:
+            for key, (processed, query_positions) in positions.items():
+                results = search(key, processed)
+                for position in query_positions:
+                    yield position, results
+            return
+        executor = ThreadPoolExecutor(workers)
+        futures = {
+            executor.submit(search, key, processed): query_positions
+            for key, (processed, query_positions) in positions.items()
+        }
+        try:
+            for future in as_completed(futures):
+                results = future.result()
+                for position in futures[future]:
+                    yield position, results
+        finally:
+            # Queries not started yet are dropped when the caller stops early.
+            for future in futures:
+                future.cancel()
+            executor.shutdown()
+    finally:
+        search_engine.metrics.observe("batch", time.perf_counter() - start)
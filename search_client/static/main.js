@@ -1,18 +1,61 @@
 "use strict";
 let serverUrl = "http://localhost:5000";
 
-const get_summary = async (title) => {
-  const route = `https://en.wikipedia.org/w/api.php?format=json&action=query&prop=extracts&exintro&explaintext&redirects=1&titles=${title}&origin=*`;
-  fetch(route)
-    .then((res) => res.json())
-    .then((res) => {
-      const pageId = Object.keys(res.query.pages)[0];
-      // console.log(res.query.pages[pageId].extract);
-      let summary = res.query.pages[pageId].extract;
-      summary = summary.substr(0, 400) + "...";
-      document.getElementById(title).innerText = summary;
-      document.getElementById(title).classList.remove("loading-grad");
-    });
+// Number of results fetched per page.
+let pageSize = 10;
+let currentSearch;
+
+let fetchPage = (searchParams, offset) => {
+  let url = new URL(serverUrl + "/api/search-results");
+  url.search = new URLSearchParams({
+    ...searchParams,
+    offset: offset,
+    limit: pageSize,
+  }).toString();
+  return fetch(url).then((res) => {
+    if (res.ok) {
+      // Change search bar position
+      let changeInitStyle = Array.from(
+        document.getElementsByClassName("init")
+      );
+      for (let element of changeInitStyle) {
+        element.classList.remove("init");
+      }
+      return res.json();
+    }
+    // Past the last page the server can return, see MAX_RESULTS.
+    return [];
+  });
+};
+
+let showResults = (data) => {
+  let container = document.getElementsByClassName("search-results-container")[0];
+  let moreButton = document.getElementById("more-results");
+  if (moreButton) moreButton.remove();
+  if (data.length == 0 && currentSearch.offset == 0) {
+    container.innerHTML = "<h2>No Results</h2>";
+    return;
+  }
+  data.forEach((result) => {
+    let resultItem = document.createElement("div");
+    resultItem.className = "result-item";
+    // Result format - [docId, score, title, link, summary]
+    let title = result[2];
+    let resultLink = result[3];
+    resultItem.innerHTML = `<a href="${resultLink}"><h2>${title}</h2><small>${resultLink}</small></a><p class="summary"></p><hr/>`;
+    resultItem.getElementsByClassName("summary")[0].innerText = result[4];
+    container.appendChild(resultItem);
+  });
+  currentSearch.offset += data.length;
+  if (data.length == pageSize) {
+    // There may be more results, the next page is fetched on demand.
+    moreButton = document.createElement("button");
+    moreButton.id = "more-results";
+    moreButton.className = "search-button";
+    moreButton.innerText = "More results";
+    moreButton.addEventListener("click", handleMore);
+    container.appendChild(moreButton);
+  }
 };
 
 let handleSearch = (e) => {
@@ -28,46 +71,49 @@ let handleSearch = (e) => {
     advanced: flag,
     query: document.getElementsByClassName("search-input")[0].value,
   };
-  let url = new URL(serverUrl + "/api/search-results");
-  url.search = new URLSearchParams(searchParams).toString();
-  fetch(url)
-    .then((res) => {
-      if (res.ok) {
-        // Change search bar position
-        let changeInitStyle = Array.from(
-          document.getElementsByClassName("init")
-        );
-        for (let element of changeInitStyle) {
-          element.classList.remove("init");
-        }
-      }
-      return res.json();
-    })
-    .then((data) => {
-      // Clear previous results
-      document.getElementsByClassName("search-results-container")[0].innerHTML =
-        "";
-      if (data.length == 0) {
-        document.getElementsByClassName(
-          "search-results-container"
-        )[0].innerHTML = "<h2>No Results</h2>";
-      } else {
-        data.forEach((result) => {
-          let resultItem = document.createElement("div");
-          resultItem.className = "result-item";
-          // Use data from result once API is complete
-          let title = result[2];
-          get_summary(title);
-          let resultLink = result[3];
-          resultItem.innerHTML = `<a href="${resultLink}"><h2>${title}</h2><small>${resultLink}</small></a><p id="${title}" class="summary loading-grad"></p><hr/>`;
-          document
-            .getElementsByClassName("search-results-container")[0]
-            .appendChild(resultItem);
+  let search = { params: searchParams, offset: 0 };
+  currentSearch = search;
+  fetchPage(searchParams, 0).then((data) => {
+    if (search !== currentSearch) return; // A newer search was started.
+    // Clear previous results
+    document.getElementsByClassName("search-results-container")[0].innerHTML =
+      "";
+    showResults(data);
+  });
+};
+
+let handleMore = () => {
+  let search = currentSearch;
+  fetchPage(search.params, search.offset).then((data) => {
+    if (search === currentSearch) showResults(data);
+  });
+};
+
+// Suggest completions of the last word while typing.
+let suggestTimer;
+let handleInput = (e) => {
+  clearTimeout(suggestTimer);
+  let query = e.target.value;
+  suggestTimer = setTimeout(() => {
+    let url = new URL(serverUrl + "/api/suggest");
+    url.search = new URLSearchParams({ query: query }).toString();
+    fetch(url)
+      .then((res) => res.json())
+      .then((data) => {
+        let suggestions = document.getElementById("suggestions");
+        suggestions.innerHTML = "";
+        data.forEach((suggestion) => {
+          let option = document.createElement("option");
+          option.value = suggestion;
+          suggestions.appendChild(option);
         });
-      }
-    });
+      });
+  }, 100);
 };
 
 document
   .getElementsByClassName("search-form")[0]
   .addEventListener("submit", handleSearch);
+document
+  .getElementsByClassName("search-input")[0]
+  .addEventListener("input", handleInput);
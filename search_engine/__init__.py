@@ -1,5 +1,20 @@
 """ Search Engine Package """
 from .index import start_indexing
-from .query_processing import process_string, process_boolean_query, download_nltk_deps
-from .index_lookup import lookup_term
+from .query_processing import (
+    process_string,
+    process_boolean_query,
+    download_nltk_deps,
+    Normalizer,
+)
+from .index_lookup import lookup_term, IndexReader, BatchReader
+from .doc_store import DocStore
 from .tf_idf_calculation import calculate_query_tf_idf
+from .top_k import top_k_documents
+from . import vector_scoring
+from .boolean_query import boolean_search
+from .manifest import index_exists
+from .segments import update_index, compact_segments, Compactor
+from .result_cache import ResultCache
+from . import metrics
+from .scatter_gather import ShardPool
+from .suggest import complete, expand_wildcards
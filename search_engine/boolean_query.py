@@ -0,0 +1,504 @@
+"""
+*Boolean Queries*
+
+Evaluates boolean queries (quoted sub-queries joined by "and", "or" and "not") over
+lazy postings iterators instead of fully scored result lists.
+
+    * A sub-query matches the documents containing any of its terms, scored by the sum
+      of their tf-idf weights (like calculate_query_tf_idf()).
+    * "and" intersects two results adding their scores, "or" unites them taking the
+      highest score, "not" (also "and not" / "or not") removes the documents of its
+      right side from its left side.
+    * "and" and "not" are evaluated first, smallest results first (Optimal Merge Pattern),
+      then "or" from left to right. "not" negates the sub-query right after it, so
+      `"a" not "b" and "c"` is a and c without b.
+    * Every iterator supports advance_to(docId). Term iterators jump over blocks of
+      postings with the skip pointers of the index (galloping search), so intersecting
+      a rare sub-query with a common one costs about as much as the rare side.
+    * When the index has positions, a sub-query of several terms is a phrase: its terms
+      must appear in order, next to each other, or with at most `slop` terms between
+      consecutive ones for `"a b"~slop`. Positions are only decoded for the documents
+      containing all terms.
+
+When NumPy is installed and a query without phrases would visit most of its postings
+anyway (large unions), it is evaluated with vector_scoring.py instead.
+"""
+
+import heapq
+from bisect import bisect_left
+from itertools import accumulate
+from math import log10
+from .index_lookup import get_default_reader
+from .weighting import LOG_WEIGHTS
+from .top_k import END
+from . import vector_scoring
+from . import metrics
+
+# Operators evaluated before "or".
+AND_OPERATORS = ("and", "not")
+
+# Approximate cost of visiting a document with the iterators relative to scoring a
+# posting with NumPy, used to choose between both.
+STREAMING_COST = 32
+
+
+def normalize_operator(operator):
+    """ Maps an operator parsed by process_boolean_query() to "and", "or" or "not". """
+    words = operator.lower().split()
+    if "not" in words:
+        return "not"
+    if "and" in words:
+        return "and"
+    return "or"
+
+
+def merge_by_operators(results, operators, merge, size=len):
+    """
+    Takes in the (docId sorted) results of the subqueries of a boolean query and
+    merges them using Optimal Merge Pattern Algorithm. `merge(a, b, operator)` merges
+    two results and `size` returns the (estimated) number of documents in a result.
+    `operators` are normalized ones, the first one is ignored.
+
+    A negated result (preceded by "not") is never the left side of a merge, as
+    "not" is not associative.
+    """
+    operators = [""] + list(operators[1:])
+    and_present = any(operator in AND_OPERATORS for operator in operators)
+
+    # First Merges results with "and" and "not" operators, smallest first.
+    while and_present:
+        smallest = None
+        pos = 0
+        for i in range(1, len(results)):
+            if operators[i] in AND_OPERATORS and operators[i - 1] != "not":
+                pair_size = size(results[i - 1]) + size(results[i])
+                if smallest is None or pair_size < smallest:
+                    smallest = pair_size
+                    pos = i
+        merged = merge(results[pos - 1], results[pos], operators[pos])
+        # Remove relevant results and operator, and add merged result
+        results = results[: pos - 1] + [merged] + results[pos + 1 :]
+        operators = operators[:pos] + operators[pos + 1 :]
+        and_present = any(operator in AND_OPERATORS for operator in operators)
+
+    # Only "or" operator would have been left
+    if not results:
+        return None
+    final_result = results[0]
+    for result in results[1:]:
+        final_result = merge(final_result, result, "or")
+    return final_result
+
+
+class SegmentPostings:
+    """
+    Cursor over the postings of a term in one segment. Postings are decoded one block
+    (of the skip interval) at a time.
+    """
+
+    def __init__(self, deltas, freqs, skips, skip_interval, positions=None):
+        self.deltas = deltas
+        self.freqs = freqs
+        self.skips = skips
+        self.block_positions, self.position_deltas = positions or (None, None)
+        self.count = len(deltas)
+        # Postings without skip pointers are a single block.
+        self.block_size = skip_interval if len(skips) else max(self.count, 1)
+        self._load(0)
+
+    def _load(self, block):
+        """ Decodes `block` and moves to its first posting. """
+        start = block * self.block_size
+        self.block = block
+        if start >= self.count:
+            self.pos = self.count
+            self.doc = END
+            return
+        end = min(start + self.block_size, self.count)
+        base = self.skips[block - 1] if block else 0
+        self.block_docs = list(accumulate(self.deltas[start:end], initial=base))[1:]
+        self.block_start = start
+        self.block_end = end
+        self.pos = start
+        self.doc = self.block_docs[0]
+
+    def next(self):
+        """ Moves to the next posting. """
+        self.pos += 1
+        if self.pos < self.block_end:
+            self.doc = self.block_docs[self.pos - self.block_start]
+        else:
+            self._load(self.block + 1)
+
+    def advance_to(self, docId):
+        """ Moves to the first posting with docId >= `docId`, returns its docId (END if none). """
+        if self.doc >= docId:
+            return self.doc
+        if self.block_docs[-1] < docId:
+            skips = self.skips
+            if not len(skips):
+                self._load(1)  # Past the only block.
+                return self.doc
+            # Gallop over the skip pointers, then binary search the last range.
+            block = self.block
+            step = 1
+            while block + step < len(skips) and skips[block + step] < docId:
+                step *= 2
+            lo = block + step // 2 + 1
+            hi = min(block + step + 1, len(skips))
+            self._load(bisect_left(skips, docId, lo, hi))
+            if self.doc >= docId:
+                return self.doc
+        i = bisect_left(self.block_docs, docId, self.pos - self.block_start)
+        self.pos = self.block_start + i
+        self.doc = self.block_docs[i]
+        return self.doc
+
+    def freq(self):
+        return self.freqs[self.pos]
+
+    def positions(self):
+        """ Returns the positions of the term in the current document. """
+        freqs = self.freqs
+        start = self.block_positions[self.block]
+        for pos in range(self.block_start, self.pos):
+            start += freqs[pos]
+        return list(accumulate(self.position_deltas[start : start + freqs[self.pos]]))
+
+
+class TermIterator:
+    """ Postings of a term over all segments of the index, without deleted documents. """
+
+    def __init__(self, parts, idf, deleted, size):
+        self.parts = parts
+        self.part = 0
+        self.idf = idf
+        self.deleted = deleted
+        self.size = size  # Number of postings, an upper bound of the matches.
+        self._settle()
+
+    def _settle(self):
+        """ Moves past exhausted segments and deleted documents. """
+        parts = self.parts
+        while self.part < len(parts):
+            postings = parts[self.part]
+            if postings.doc == END:
+                self.part += 1
+            elif postings.doc in self.deleted:
+                postings.next()
+            else:
+                self.doc = postings.doc
+                return
+        self.doc = END
+
+    def next(self):
+        self.parts[self.part].next()
+        self._settle()
+
+    def advance_to(self, docId):
+        if self.doc >= docId:
+            return self.doc
+        parts = self.parts
+        while self.part < len(parts) and parts[self.part].advance_to(docId) == END:
+            self.part += 1
+        self._settle()
+        return self.doc
+
+    def score(self):
+        """ Returns the tf-idf weight of the term in the current document. """
+        freq = self.parts[self.part].freq()
+        if freq < len(LOG_WEIGHTS):
+            return LOG_WEIGHTS[freq] * self.idf
+        return (1 + log10(freq)) * self.idf
+
+    def positions(self):
+        return self.parts[self.part].positions()
+
+
+class SubQueryIterator:
+    """ Documents containing any term of a sub-query, scored by the sum of their weights. """
+
+    def __init__(self, terms):
+        # In query order, a repeated term is scored once per occurrence.
+        self.terms = terms
+        self.unique = list({id(term): term for term in terms}.values())
+        self.size = sum(term.size for term in self.unique)
+        self.doc = min([term.doc for term in self.unique], default=END)
+
+    def next(self):
+        doc = self.doc
+        for term in self.unique:
+            if term.doc == doc:
+                term.next()
+        self.doc = min([term.doc for term in self.unique])
+
+    def advance_to(self, docId):
+        if self.doc < docId:
+            for term in self.unique:
+                term.advance_to(docId)
+            self.doc = min([term.doc for term in self.unique])
+        return self.doc
+
+    def score(self):
+        score = 0.0
+        for term in self.terms:
+            if term.doc == self.doc:
+                score += term.score()
+        return score
+
+
+class PhraseIterator:
+    """
+    Documents containing the terms of a sub-query in order, with at most `slop` other
+    terms between consecutive ones. Scored like SubQueryIterator.
+    """
+
+    def __init__(self, terms, slop=0):
+        self.terms = terms  # In query order.
+        self.unique = list({id(term): term for term in terms}.values())
+        self.slop = slop
+        self.size = min(term.size for term in self.unique)
+        self.lead = min(self.unique, key=lambda term: term.size)
+        self._find(self.lead.doc)
+
+    def _matches(self):
+        """ Checks the positions of the terms in the current document. """
+        positions = {id(term): term.positions() for term in self.unique}
+        reachable = positions[id(self.terms[0])]
+        for term in self.terms[1:]:
+            following = []
+            for position in positions[id(term)]:
+                # Any reachable position in [position - slop - 1, position - 1].
+                i = bisect_left(reachable, position - self.slop - 1)
+                if i < len(reachable) and reachable[i] < position:
+                    following.append(position)
+            if not following:
+                return False
+            reachable = following
+        return True
+
+    def _find(self, doc):
+        """ Moves to the first matching document from `doc`. """
+        while doc != END:
+            for term in self.unique:
+                other = term.advance_to(doc)
+                if other != doc:
+                    doc = self.lead.advance_to(other)
+                    break
+            else:
+                if self._matches():
+                    break
+                self.lead.next()
+                doc = self.lead.doc
+        self.doc = doc
+
+    def next(self):
+        self.lead.next()
+        self._find(self.lead.doc)
+
+    def advance_to(self, docId):
+        if self.doc < docId:
+            self._find(self.lead.advance_to(docId))
+        return self.doc
+
+    def score(self):
+        score = 0.0
+        for term in self.terms:
+            score += term.score()
+        return score
+
+
+class AndIterator:
+    """ Documents in both results, scores are added. The smaller result leads. """
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        if left.size <= right.size:
+            self.lead, self.follow = left, right
+        else:
+            self.lead, self.follow = right, left
+        self.size = self.lead.size
+        self._align(self.lead.doc)
+
+    def _align(self, doc):
+        """ Leapfrogs both iterators to their next common document, from `doc`. """
+        while doc != END:
+            other = self.follow.advance_to(doc)
+            if other == doc:
+                break
+            doc = self.lead.advance_to(other)
+        self.doc = doc
+
+    def next(self):
+        self.lead.next()
+        self._align(self.lead.doc)
+
+    def advance_to(self, docId):
+        if self.doc < docId:
+            self._align(self.lead.advance_to(docId))
+        return self.doc
+
+    def score(self):
+        return self.left.score() + self.right.score()
+
+
+class OrIterator:
+    """ Documents in either result, the highest score is taken. """
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self.size = left.size + right.size
+        self.doc = min(left.doc, right.doc)
+
+    def next(self):
+        doc = self.doc
+        if self.left.doc == doc:
+            self.left.next()
+        if self.right.doc == doc:
+            self.right.next()
+        self.doc = min(self.left.doc, self.right.doc)
+
+    def advance_to(self, docId):
+        if self.doc < docId:
+            self.doc = min(self.left.advance_to(docId), self.right.advance_to(docId))
+        return self.doc
+
+    def score(self):
+        if self.left.doc != self.doc:
+            return self.right.score()
+        if self.right.doc != self.doc:
+            return self.left.score()
+        return max(self.left.score(), self.right.score())
+
+
+class NotIterator:
+    """ Documents of the left result missing in the right one, streaming difference. """
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self.size = left.size
+        self._skip_excluded()
+
+    def _skip_excluded(self):
+        left = self.left
+        while left.doc != END and self.right.advance_to(left.doc) == left.doc:
+            left.next()
+        self.doc = left.doc
+
+    def next(self):
+        self.left.next()
+        self._skip_excluded()
+
+    def advance_to(self, docId):
+        if self.doc < docId:
+            self.left.advance_to(docId)
+            self._skip_excluded()
+        return self.doc
+
+    def score(self):
+        return self.left.score()
+
+
+ITERATORS = {"and": AndIterator, "or": OrIterator, "not": NotIterator}
+
+
+def _combine(left, right, operator):
+    return ITERATORS[operator](left, right)
+
+
+def term_iterator(term, reader):
+    """ Returns a TermIterator over the postings of `term`, None if it is absent. """
+    snapshot = reader.snapshot
+    parts = []
+    size = 0
+    for index in snapshot.segments:
+        ordinal = index.find(term)
+        if ordinal == -1:
+            continue
+        deltas, freqs = index.postings(ordinal)
+        positions = index.positions(ordinal) if index.has_positions else None
+        parts.append(
+            SegmentPostings(
+                deltas, freqs, index.skips(ordinal), index.skip_interval, positions
+            )
+        )
+        size += len(deltas)
+    if not parts:
+        return None
+    return TermIterator(parts, reader.idf(term), snapshot.deleted, size)
+
+
+def is_phrase(query, reader):
+    """ Checks whether a sub-query is matched as a phrase, that needs term positions. """
+    segments = reader.snapshot.segments
+    return len(query) > 1 and all(index.has_positions for index in segments)
+
+
+def sub_query_iterator(query, reader):
+    iterators = {}
+    for term in query:
+        if term not in iterators:
+            iterators[term] = term_iterator(term, reader)
+    if is_phrase(query, reader):
+        if not all(iterators.values()):
+            return SubQueryIterator([])  # A term is absent, nothing matches.
+        return PhraseIterator(
+            [iterators[term] for term in query], getattr(query, "slop", 0)
+        )
+    return SubQueryIterator([iterators[term] for term in query if iterators[term]])
+
+
+def _stream_top_k(iterator, k):
+    heap = []  # (score, -docId) of the best k documents so far.
+    while iterator.doc != END:
+        entry = (iterator.score(), -iterator.doc)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+        iterator.next()
+    return [(-docId, score) for score, docId in sorted(heap, reverse=True)]
+
+
+def boolean_search(separated_query, operators, reader=None, k=10):
+    """
+    Takes in a boolean query processed by process_boolean_query() and returns the k
+    (docId, score) pairs with highest score, sorted by decreasing score. Ties are
+    broken by lower docId.
+    """
+    if reader is None:
+        reader = get_default_reader()
+    if not separated_query:
+        return []
+    operators = [normalize_operator(operator) for operator in operators]
+    with metrics.stage("lookup"):
+        sub_queries = [sub_query_iterator(query, reader) for query in separated_query]
+    iterator = merge_by_operators(
+        sub_queries, operators, _combine, size=lambda iterator: iterator.size
+    )
+
+    total_postings = sum(sub_query.size for sub_query in sub_queries)
+    streaming = any(is_phrase(query, reader) for query in separated_query)
+    if (
+        vector_scoring.available()
+        and not streaming
+        and iterator.size * STREAMING_COST >= total_postings
+    ):
+        results = [
+            vector_scoring.query_scores(query, reader) for query in separated_query
+        ]
+        with metrics.stage("merge"):
+            final_result = merge_by_operators(
+                results,
+                operators,
+                vector_scoring.merge_scores,
+                size=lambda result: len(result[0]),
+            )
+        return vector_scoring.top_k(final_result, k)
+    # Postings are read and scored while the iterators are merged.
+    metrics.count("postings", total_postings)
+    with metrics.stage("merge"):
+        return _stream_top_k(iterator, k)
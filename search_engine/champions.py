@@ -0,0 +1,355 @@
+"""
+*Champion Lists*
+
+Regular queries on frequent terms are answered from the champion lists of their terms
+(see index_file.py), a tier of their postings of highest frequency, before reading
+their full postings -
+
+    * The highest frequency left out of the champion list of a term bounds the weight
+      of the term in any document outside the list.
+    * The documents of the champion lists (and of the full postings of terms without
+      one) are the candidates. Their known weights add up to a lower bound of their
+      score, adding the bounds of the terms they miss gives an upper bound.
+    * If the bounds of all terms add up to less than the k-th best lower bound, no
+      other document can enter the top k. Candidates whose upper bound reaches it get
+      their missing weights from the full postings, only the blocks (of the skip
+      pointers) holding them are decoded. The other candidates can not enter the top k.
+    * Otherwise the top k is not settled by the champion lists, and the query is
+      evaluated over the full postings.
+
+essential_top_k() applies the same evaluation to queries on terms without champion
+lists (MaxScore over whole terms): the terms of lowest score bounds and longest
+postings are left out, only their bound is known, and the documents of the other terms
+are the candidates.
+
+Candidates are scored with NumPy when it is installed (see vector_scoring.py).
+Results and scores are the same as the ones of the full evaluation. Indexes with
+deleted documents are evaluated in full, their idfs are counted on the full postings.
+"""
+
+import heapq
+from bisect import bisect_left
+from collections import Counter
+from itertools import accumulate
+from math import log10
+from .weighting import LOG_WEIGHTS
+from .settings import MAXSCORE_MIN_POSTINGS
+from . import vector_scoring
+from . import metrics
+
+# Relative slack on upper bounds, guards pruning against floating point rounding.
+BOUND_SLACK = 1e-9
+
+# Approximate cost of probing the full postings of a term for a document relative to
+# scoring a posting with NumPy. With NumPy, the full postings are scored instead when
+# probing the candidates would cost more.
+PROBE_COST = 128
+
+
+def _weight(freq, idf):
+    if freq < len(LOG_WEIGHTS):
+        return LOG_WEIGHTS[freq] * idf
+    return (1 + log10(freq)) * idf
+
+
+class TermTier:
+    """ Postings of a query term read from the champion lists and short postings. """
+
+    def __init__(self, idf):
+        self.idf = idf
+        self.parts = []  # (docId deltas, freqs) read, one per segment.
+        # (index, ordinal) of the segments where only champions were read.
+        self.tails = []
+        self.bound = 0.0  # Upper bound of the weight of the term in documents not read.
+        self.size = 0  # Number of postings of the term.
+
+    def freqs(self):
+        """ Returns {docId: freq} of the postings read. """
+        freqs = {}
+        for deltas, part_freqs in self.parts:
+            freqs.update(zip(accumulate(deltas), part_freqs))
+        return freqs
+
+
+def _probe(index, ordinal, docIds):
+    """
+    Returns {docId: freq} of the `docIds` (sorted) found in the postings of the term
+    at `ordinal` of a segment, decoding only the blocks that may hold them.
+    """
+    deltas, freqs = index.postings(ordinal)
+    skips = index.skips(ordinal)
+    block_size = index.skip_interval if len(skips) else len(deltas)
+    found = {}
+    block = -1
+    for docId in docIds:
+        curr = bisect_left(skips, docId) if len(skips) else 0
+        if curr * block_size >= len(deltas):
+            break  # Past the last posting, so are the next docIds.
+        if curr != block:
+            block = curr
+            start = block * block_size
+            base = skips[block - 1] if block else 0
+            block_docs = list(
+                accumulate(deltas[start : start + block_size], initial=base)
+            )
+        pos = bisect_left(block_docs, docId, 1)
+        if pos < len(block_docs) and block_docs[pos] == docId:
+            found[docId] = freqs[start + pos - 1]
+    return found
+
+
+def _read_tiers(query, reader):
+    """
+    Returns the TermTier of every distinct term of `query`, None if no term has a
+    champion list (its full postings are then read only once, by the caller).
+    """
+    snapshot = reader.snapshot
+    entries = {}  # term -> [(index, ordinal, champions)]
+    for term in query:
+        if term not in entries:
+            entries[term] = []
+            for index in snapshot.segments:
+                ordinal = index.find(term)
+                if ordinal != -1:
+                    entries[term].append((index, ordinal, index.champions(ordinal)))
+    if not any(champions for parts in entries.values() for _, _, champions in parts):
+        return None
+
+    tiers = {}
+    no_postings = 0
+    for term, parts in entries.items():
+        tier = TermTier(reader.idf(term))
+        for index, ordinal, champions in parts:
+            tier.size += index.document_frequencies[ordinal]
+            if champions is None:
+                deltas, freqs = index.postings(ordinal)
+            else:
+                tail_frequency, (deltas, freqs) = champions
+                tier.tails.append((index, ordinal))
+                tier.bound = max(tier.bound, _weight(tail_frequency, tier.idf))
+            if len(deltas):
+                tier.parts.append((deltas, freqs))
+                no_postings += len(deltas)
+        tiers[term] = tier
+    metrics.count("postings", no_postings)
+    return tiers
+
+
+def _read_essential_tiers(query, reader):
+    """
+    Returns the TermTier of every distinct term of `query` for essential_top_k(), None
+    if no term is left out. Terms are ordered by the bound of their score, the first
+    ones holding at least MAXSCORE_MIN_POSTINGS postings are left out (all but the
+    last term at most): their postings are not read, only probed. None as well when
+    the other terms have too many postings for probing to be cheaper.
+    """
+    snapshot = reader.snapshot
+    entries = {}  # term -> [(index, ordinal)]
+    tiers = {}
+    for term in query:
+        if term not in entries:
+            ordinals = [(index, index.find(term)) for index in snapshot.segments]
+            entries[term] = [
+                (index, ordinal) for index, ordinal in ordinals if ordinal != -1
+            ]
+            tier = TermTier(reader.idf(term))
+            max_frequency = 0
+            for index, ordinal in entries[term]:
+                tier.size += index.document_frequencies[ordinal]
+                max_frequency = max(max_frequency, index.max_frequencies[ordinal])
+            tier.bound = _weight(max_frequency, tier.idf) if max_frequency else 0.0
+            tiers[term] = tier
+
+    counts = Counter(query)
+    ordered = sorted(
+        (term for term in tiers if tiers[term].size),
+        key=lambda term: tiers[term].bound * counts[term],
+    )
+    left_out = set()
+    for term in ordered[:-1]:
+        if tiers[term].size < MAXSCORE_MIN_POSTINGS:
+            break
+        left_out.add(term)
+    if not left_out:
+        return None
+    # Every document of the other terms may have to be probed.
+    read = sum(tier.size for term, tier in tiers.items() if term not in left_out)
+    if read * PROBE_COST > sum(tiers[term].size for term in left_out):
+        return None
+
+    no_postings = 0
+    for term, tier in tiers.items():
+        if term in left_out:
+            tier.tails = entries[term]
+            continue
+        tier.bound = 0.0
+        for index, ordinal in entries[term]:
+            deltas, freqs = index.postings(ordinal)
+            tier.parts.append((deltas, freqs))
+            no_postings += len(deltas)
+    metrics.count("postings", no_postings)
+    return tiers
+
+
+def _probe_tails(tiers, unsettled, known):
+    """
+    Reads the frequencies of the `unsettled` docIds (sorted) missing in `known`
+    ({term: {docId: freq}}) from the full postings of the terms.
+    """
+    probed = 0
+    for term, tier in tiers.items():
+        if tier.tails:
+            docIds = [docId for docId in unsettled if docId not in known[term]]
+            for index, ordinal in tier.tails:
+                known[term].update(_probe(index, ordinal, docIds))
+            probed += len(docIds)
+    metrics.count("champion_probes", probed)
+
+
+def _exact_score(query, tiers, known, docId):
+    """ Returns the score of a document whose frequencies are all in `known`. """
+    score = 0.0
+    for term in query:
+        freq = known[term].get(docId)
+        if freq is not None:
+            score += _weight(freq, tiers[term].idf)
+    return score
+
+
+def _python_top_k(query, tiers, outside, k):
+    known = {term: tier.freqs() for term, tier in tiers.items()}
+    scores = {}  # docId -> (known score, bound of the missing weights)
+    for docId in set().union(*known.values()):
+        score = 0.0
+        missing = 0.0
+        for term in query:
+            freq = known[term].get(docId)
+            if freq is not None:
+                score += _weight(freq, tiers[term].idf)
+            else:
+                missing += tiers[term].bound
+        scores[docId] = score, missing
+    if len(scores) < k:
+        return None
+    threshold = heapq.nlargest(k, (score for score, _ in scores.values()))[-1]
+    if outside * (1 + BOUND_SLACK) >= threshold:
+        return None
+
+    # Candidates that may enter the top k, their missing weights are read.
+    unsettled = sorted(
+        docId
+        for docId, (score, missing) in scores.items()
+        if missing and (score + missing) * (1 + BOUND_SLACK) >= threshold
+    )
+    _probe_tails(tiers, unsettled, known)
+    results = [
+        (docId, score) for docId, (score, missing) in scores.items() if not missing
+    ]
+    results.extend(
+        (docId, _exact_score(query, tiers, known, docId)) for docId in unsettled
+    )
+    return heapq.nsmallest(k, results, key=lambda result: (-result[1], result[0]))
+
+
+def _vector_top_k(query, tiers, outside, k):
+    np = vector_scoring.np
+    arrays = {}  # term -> (docIds, freqs) arrays of the postings read.
+    for term, tier in tiers.items():
+        docIds = [
+            np.cumsum(np.asarray(deltas), dtype=np.int64) for deltas, _ in tier.parts
+        ]
+        freqs = [np.asarray(freqs) for _, freqs in tier.parts]
+        if len(docIds) == 1:
+            arrays[term] = docIds[0], freqs[0]
+        elif docIds:
+            arrays[term] = np.concatenate(docIds), np.concatenate(freqs)
+        else:
+            arrays[term] = vector_scoring.EMPTY[0], vector_scoring.EMPTY[0]
+    docIds, scores = vector_scoring.combine_scores(
+        [
+            (
+                arrays[term][0],
+                vector_scoring._log_weights(arrays[term][1]) * tiers[term].idf,
+            )
+            for term in query
+        ]
+    )
+    if len(docIds) < k:
+        return None
+    with metrics.stage("score"):
+        missing = np.zeros(len(docIds))
+        for term in query:
+            if tiers[term].bound:
+                found = np.isin(docIds, arrays[term][0], assume_unique=True)
+                missing += np.where(found, 0.0, tiers[term].bound)
+        threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+        if outside * (1 + BOUND_SLACK) >= threshold:
+            return None
+
+        # Candidates that may enter the top k, their missing weights are read.
+        unsettled = docIds[
+            (missing > 0) & ((scores + missing) * (1 + BOUND_SLACK) >= threshold)
+        ]
+        no_probes = sum(len(unsettled) for tier in tiers.values() if tier.tails)
+        if no_probes * PROBE_COST > sum(tiers[term].size for term in query):
+            return None
+        known = {}
+        for term, (term_docIds, freqs) in arrays.items():
+            found = np.isin(term_docIds, unsettled, assume_unique=True)
+            known[term] = dict(zip(term_docIds[found].tolist(), freqs[found].tolist()))
+        unsettled = unsettled.tolist()
+        _probe_tails(tiers, unsettled, known)
+        settled = missing == 0
+        exact = [_exact_score(query, tiers, known, docId) for docId in unsettled]
+    return vector_scoring.top_k(
+        (
+            np.concatenate((docIds[settled], np.array(unsettled, dtype=np.int64))),
+            np.concatenate((scores[settled], np.array(exact))),
+        ),
+        k,
+    )
+
+
+def top_k(query, reader, k=10):
+    """
+    Takes in a query (a list of words that is obtained after normalization) and returns
+    the k (docId, tf-idf weight) pairs with highest weight, like top_k_documents(),
+    from the champion lists of its terms. Returns None if they do not settle the top k.
+    """
+    snapshot = reader.snapshot
+    if k <= 0 or snapshot.deleted:
+        return None
+    if not any(index.has_champions for index in snapshot.segments):
+        return None
+    with metrics.stage("lookup"):
+        tiers = _read_tiers(query, reader)
+    if tiers is None:
+        return None
+    # Upper bound of the score of a document that is not a candidate.
+    outside = sum(tiers[term].bound for term in query)
+    if vector_scoring.available():
+        return _vector_top_k(query, tiers, outside, k)
+    with metrics.stage("score"):
+        return _python_top_k(query, tiers, outside, k)
+
+
+def essential_top_k(query, reader, k=10):
+    """
+    Takes in a query (a list of words that is obtained after normalization) and returns
+    the k (docId, tf-idf weight) pairs with highest weight, like top_k_documents(),
+    without reading the postings of its terms of longest postings and lowest bounds
+    (see _read_essential_tiers). Returns None if the query has no such terms or if
+    the other terms do not settle the top k.
+    """
+    if k <= 0 or reader.snapshot.deleted:
+        return None
+    with metrics.stage("lookup"):
+        tiers = _read_essential_tiers(query, reader)
+    if tiers is None:
+        return None
+    # Upper bound of the score of a document holding only terms left out.
+    outside = sum(tiers[term].bound for term in query)
+    if vector_scoring.available():
+        return _vector_top_k(query, tiers, outside, k)
+    with metrics.stage("score"):
+        return _python_top_k(query, tiers, outside, k)
@@ -0,0 +1,247 @@
+"""
+*Corpus Readers*
+
+The indexer reads the documents of the corpus as (name, text) pairs through a reader -
+
+    * DirectoryCorpus --> one file per document in a directory (./corpus by default).
+    * BundleCorpus --> many documents packed in each of a few large files, read
+      sequentially in bulk -
+        * tar archives (.tar, .tar.gz, .tgz, .tar.bz2, .tar.xz), a member per document.
+        * JSON lines (.jsonl, .jsonl.gz), a document per line. A line is either
+          {"name": <name>, "text": <text in the layout of corpus files>}, or a
+          {"title", "url", "text"} record of a Wikipedia dump (as written by
+          WikiExtractor --json), named after its title.
+
+open_corpus() picks the reader for CORPUS_PATH. Documents are only read while
+indexing, search results are rendered from the document store.
+"""
+
+import glob
+import gzip
+import json
+import os
+import pathlib
+import re
+import tarfile
+from itertools import groupby
+from .settings import CORPUS_PATH
+
+TAR_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+JSONL_EXTENSIONS = (".jsonl", ".jsonl.gz")
+
+
+class DirectoryCorpus:
+    """ Corpus of one file per document, named after the file. """
+
+    def __init__(self, path):
+        self.path = path
+
+    def names(self):
+        """ Returns the names of the documents, in corpus order. """
+        return os.listdir(self.path)
+
+    def sort(self, names):
+        """ Returns `names` in corpus order, any order can be read. """
+        return list(names)
+
+    def subset(self, names):
+        """ Returns a reader of `names`, any reader of the directory reads them. """
+        return self
+
+    def read(self, names):
+        """ Yields the (name, text) of each of `names`, which must be in corpus order. """
+        for name in names:
+            yield name, pathlib.Path(self.path, name).read_text()
+
+
+def _record_document(record):
+    """ Returns the (name, text) of a JSON lines record. """
+    if "name" in record:
+        return record["name"], record["text"]
+    title = record["title"]
+    # The link of a result is made from the name, see document_metadata().
+    return (
+        title.replace(" ", "_") + ".txt",
+        f"{record.get('url', '')}\n\n{title}\n\n{record['text']}",
+    )
+
+
+# Name and title keys of a JSON lines record, found without decoding the whole record.
+# Quotes inside JSON strings are escaped, so a quote right after "{" or "," opens a key.
+NAME_KEY = re.compile(rb'[{,]\s*"name"\s*:\s*("(?:[^"\\]|\\.)*")')
+TITLE_KEY = re.compile(rb'[{,]\s*"title"\s*:\s*("(?:[^"\\]|\\.)*")')
+
+
+def _record_name(line):
+    """ Returns the name of the document of a JSON lines record (bytes), like _record_document(). """
+    if b'"name"' in line:
+        match = NAME_KEY.search(line)
+        if match:
+            return json.loads(match.group(1))
+    elif b'"title"' in line:
+        match = TITLE_KEY.search(line)
+        if match:
+            return json.loads(match.group(1)).replace(" ", "_") + ".txt"
+    return _record_document(json.loads(line))[0]
+
+
+class BundleCorpus:
+    """
+    Corpus packed in bundle files, documents are in the order of the files then of
+    their contents. A name repeated in the corpus is the document seen first.
+
+    names() records the location of every document, (bundle no., record no., byte
+    offset, size), so that read() seeks straight to the documents of uncompressed
+    bundles (.tar, .jsonl). Compressed bundles are decompressed from their start, but
+    the documents before the ones read are skipped without being decoded.
+    """
+
+    def __init__(self, paths):
+        for path in paths:
+            if not path.endswith(TAR_EXTENSIONS + JSONL_EXTENSIONS):
+                raise Exception("Error- Unknown corpus bundle format: " + path)
+        self.paths = paths
+        self.locations = {}  # name -> location of the documents listed by names().
+
+    def _scan(self, bundle_no, wanted=()):
+        """
+        Yields the (name, location, text) of the documents of a bundle, text is only
+        decoded for the names in `wanted` (None otherwise).
+        """
+        path = self.paths[bundle_no]
+        record_no = -1
+        if path.endswith(TAR_EXTENSIONS):
+            seekable = path.endswith(".tar")
+            # Streaming mode reads the archive sequentially, without seeking.
+            with tarfile.open(path, "r|*") as archive:
+                for member in archive:
+                    if not member.isfile():
+                        continue
+                    record_no += 1
+                    offset = member.offset_data if seekable else None
+                    text = None
+                    if member.name in wanted:
+                        text = archive.extractfile(member).read().decode("utf-8")
+                    yield member.name, (bundle_no, record_no, offset, member.size), text
+        else:
+            seekable = not path.endswith(".gz")
+            opener = gzip.open if path.endswith(".gz") else open
+            with opener(path, "rb") as f:
+                end = 0
+                for line in f:
+                    start = end
+                    end += len(line)
+                    if not line.strip():
+                        continue
+                    record_no += 1
+                    name = _record_name(line)
+                    text = None
+                    if name in wanted:
+                        name, text = _record_document(json.loads(line))
+                    offset = start if seekable else None
+                    yield name, (bundle_no, record_no, offset, len(line)), text
+
+    def _documents(self, wanted=()):
+        seen = set()
+        for bundle_no in range(len(self.paths)):
+            for name, location, text in self._scan(bundle_no, wanted):
+                if name not in seen:
+                    seen.add(name)
+                    yield name, location, text
+
+    def names(self):
+        """ Returns the names of the documents, in corpus order. """
+        self.locations = {name: location for name, location, _ in self._documents()}
+        return list(self.locations)
+
+    def sort(self, names):
+        """ Returns `names` in corpus order, names missing in the corpus last. """
+        order = {name: no for no, name in enumerate(self.names())}
+        return sorted(names, key=lambda name: order.get(name, len(order)))
+
+    def subset(self, names):
+        """
+        Returns a reader of the same bundles knowing only the locations of `names`,
+        cheap to send to a worker process reading them.
+        """
+        corpus = BundleCorpus(self.paths)
+        corpus.locations = {
+            name: self.locations[name] for name in names if name in self.locations
+        }
+        return corpus
+
+    def read(self, names):
+        """
+        Yields the (name, text) of each of `names`, which must be in corpus order.
+        Without the locations of all of them (see names()), the bundles are read from
+        the start up to the last of `names`.
+        """
+        names = list(names)
+        if not names:
+            return
+        if all(name in self.locations for name in names):
+            for bundle_no, group in groupby(
+                names, lambda name: self.locations[name][0]
+            ):
+                yield from self._read_bundle(bundle_no, list(group))
+            return
+        wanted = set(names)
+        for name, _, text in self._documents(wanted):
+            if name in wanted:
+                yield name, text
+                wanted.discard(name)
+                if not wanted:
+                    return
+
+    def _read_bundle(self, bundle_no, names):
+        """ Yields the (name, text) of `names` of one bundle, from their locations. """
+        path = self.paths[bundle_no]
+        if self.locations[names[0]][2] is None:
+            # Compressed, the records before the last one read are skipped undecoded.
+            records = {self.locations[name][1] for name in names}
+            last = max(records)
+            record_no = -1
+            if path.endswith(TAR_EXTENSIONS):
+                with tarfile.open(path, "r|*") as archive:
+                    for member in archive:
+                        if not member.isfile():
+                            continue
+                        record_no += 1
+                        if record_no in records:
+                            text = archive.extractfile(member).read().decode("utf-8")
+                            yield member.name, text
+                        if record_no == last:
+                            return
+            else:
+                with gzip.open(path, "rb") as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        record_no += 1
+                        if record_no in records:
+                            yield _record_document(json.loads(line))
+                        if record_no == last:
+                            return
+            return
+        with open(path, "rb") as f:
+            for name in names:
+                _, _, offset, size = self.locations[name]
+                f.seek(offset)
+                data = f.read(size)
+                if path.endswith(TAR_EXTENSIONS):
+                    yield name, data.decode("utf-8")
+                else:
+                    yield _record_document(json.loads(data))
+
+
+def open_corpus(path=CORPUS_PATH):
+    """
+    Returns the reader of the corpus at `path`, a directory of documents, a bundle
+    file or a glob pattern of bundle files (e.g. "dumps/*.jsonl.gz").
+    """
+    if os.path.isdir(path):
+        return DirectoryCorpus(path)
+    paths = sorted(glob.glob(path))
+    if not paths:
+        raise Exception("Error- Corpus not found: " + path)
+    return BundleCorpus(paths)
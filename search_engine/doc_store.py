@@ -0,0 +1,167 @@
+"""
+*Document Store*
+
+    * Holds the title, Wikipedia link and a short summary of every document, so that
+      search results are rendered without reading the corpus.
+    * Built by the indexer while parsing the documents (docs.bin), and memory mapped
+      by the server.
+
+Layout:
+
+    <magic> <version> <first docId> <no. of docs> <offsets position>   (4s + uint32 + 3 x uint64)
+    <records, one per docId: title, link and summary separated by "\\0", utf-8, the
+     fields themselves hold no "\\0">
+    <record offsets>                                    (uint64 array, no. of docs + 1, 8 byte aligned)
+
+"""
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from .index_file import INDEX_DIR
+from .settings import SUMMARY_LENGTH
+
+DOC_STORE_FILE = "docs.bin"
+MAGIC = b"MKDS"
+VERSION = 1
+HEADER = struct.Struct("<4sIQQQ")
+
+
+def document_metadata(doc_name, doc_text):
+    """
+    Given a document's file name and its text, returns its (title, link, summary).
+    The title is the third line of the document, the summary is the start of its body.
+    """
+    lines = doc_text.split("\n")
+    title = lines[2].strip() if len(lines) > 2 else ""
+    link = "https://en.wikipedia.org/wiki/" + Path(doc_name).stem
+    summary = " ".join(" ".join(lines[3:]).split())
+    if len(summary) > SUMMARY_LENGTH:
+        summary = summary[:SUMMARY_LENGTH] + "..."
+    return title, link, summary
+
+
+class DocStoreWriter:
+    """ Writes the metadata of documents, added in increasing docId order, to a store. """
+
+    def __init__(self, filename, first_docId=1):
+        self.filename = filename
+        self.file = open(filename, "wb")
+        self.file.write(bytes(HEADER.size))  # Header is written on close.
+        self.first_docId = first_docId
+        self.offsets = array("Q", [HEADER.size])
+
+    def add(self, title, link, summary):
+        # NUL separates the fields, it is dropped from the text of documents.
+        fields = (field.replace("\0", "") for field in (title, link, summary))
+        self.add_record("\0".join(fields).encode("utf-8"))
+
+    def add_record(self, record):
+        self.file.write(record)
+        self.offsets.append(self.offsets[-1] + len(record))
+
+    def close(self):
+        offsets_position = self.offsets[-1] + (-self.offsets[-1] % 8)
+        self.file.write(bytes(offsets_position - self.offsets[-1]))
+        offsets = array("Q", self.offsets)
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        self.file.write(offsets.tobytes())
+        self.file.seek(0)
+        no_docs = len(self.offsets) - 1
+        self.file.write(
+            HEADER.pack(MAGIC, VERSION, self.first_docId, no_docs, offsets_position)
+        )
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class DocStore:
+    """ Read only, memory mapped document store. Can be shared between threads. """
+
+    def __init__(self, filename=os.path.join(INDEX_DIR, DOC_STORE_FILE)):
+        with open(filename, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, first_docId, no_docs, offsets_position = HEADER.unpack_from(
+            self.map
+        )
+        if magic != MAGIC or version != VERSION:
+            raise Exception(
+                "Error- Unsupported document store! Please recreate the index."
+            )
+        self.first_docId = first_docId
+        self.no_docs = no_docs
+        offsets = memoryview(self.map)[
+            offsets_position : offsets_position + 8 * (no_docs + 1)
+        ]
+        if sys.byteorder == "big":
+            self.offsets = array("Q", bytes(offsets))
+            self.offsets.byteswap()
+        else:
+            self.offsets = offsets.cast("Q")
+
+    def __contains__(self, docId):
+        return 0 <= docId - self.first_docId < self.no_docs
+
+    def __len__(self):
+        return self.no_docs
+
+    def record(self, docId):
+        """ Returns the raw record of `docId`. """
+        pos = docId - self.first_docId
+        return self.map[self.offsets[pos] : self.offsets[pos + 1]]
+
+    def get(self, docId):
+        """ Returns the (title, link, summary) of `docId`. """
+        return tuple(self.record(docId).decode("utf-8").split("\0", 2))
+
+
+class SegmentedDocStore:
+    """ Document stores of the segments of an index, looked up by docId. """
+
+    def __init__(self, stores):
+        self.stores = stores
+        self.first_docIds = [store.first_docId for store in stores]
+
+    def _store(self, docId):
+        pos = bisect_right(self.first_docIds, docId) - 1
+        if pos < 0 or docId not in self.stores[pos]:
+            raise KeyError(docId)
+        return self.stores[pos]
+
+    def __contains__(self, docId):
+        pos = bisect_right(self.first_docIds, docId) - 1
+        return pos >= 0 and docId in self.stores[pos]
+
+    def __len__(self):
+        return sum(len(store) for store in self.stores)
+
+    def record(self, docId):
+        return self._store(docId).record(docId)
+
+    def get(self, docId):
+        return self._store(docId).get(docId)
+
+
+def concatenate_stores(filenames, filename):
+    """
+    Concatenates document stores covering consecutive docId ranges into one store,
+    deleting the input stores.
+    """
+    first_docId = DocStore(filenames[0]).first_docId if filenames else 1
+    with DocStoreWriter(filename, first_docId) as writer:
+        for part_name in filenames:
+            part = DocStore(part_name)
+            for docId in range(part.first_docId, part.first_docId + len(part)):
+                writer.add_record(part.record(docId))
+            del part
+            os.remove(part_name)
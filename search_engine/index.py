@@ -4,69 +4,147 @@
     * Assigns a docID to each document in the corpus.
     * Parses The documents to create intermediate inverted indices.
     * Uses Block Sort and Merge Algorithm to generate an unified inverted index.
-    * Finally, creates a shelf containing term as key and list of (docId,freq) as value.
+    * Finally, writes a term dictionary and a postings file holding the (docId,freq)
+      pairs of every term, and the positions of the terms in each document when
+      STORE_POSITIONS is set.
+
+Every step takes the directory to build in (index_dir), the same steps build the
+segments of incremental updates (see segments.py).
+
+With SHARDS > 1 the corpus is partitioned into contiguous docId ranges, and every
+shard is built (parsed, merged and written) by its own process, in
+index_files/shards/<no>. Shards have their own statistics, queries combine them
+into global ones (see IndexReader and scatter_gather.py).
 
 """
 
 import pickle
-import shelve
 import os
 import sys
-import pathlib
-from .query_processing import process_string
-from .settings import BLOCK_SIZE
+import multiprocessing
+import heapq
+import shutil
+from collections import Counter
+from .query_processing import get_normalizer
+from .corpus import open_corpus
+from .doc_store import (
+    DocStoreWriter,
+    DOC_STORE_FILE,
+    concatenate_stores,
+    document_metadata,
+)
+from .index_file import (
+    IndexWriter,
+    IndexFile,
+    write_stats,
+    INDEX_DIR,
+    LEXICON_FILE,
+    POSTINGS_FILE,
+    STATS_FILE,
+    POSITIONS_FILE,
+    CHAMPIONS_FILE,
+)
+from .weighting import inverse_document_frequency
+from .manifest import (
+    load_manifest,
+    save_manifest,
+    new_manifest,
+    manifest_lock,
+    shard_ranges,
+    SEGMENTS_DIR,
+    SHARDS_DIR,
+)
+from .suggest import (
+    write_completions,
+    write_form_counts,
+    remove_form_counts,
+    COMPLETIONS_FILE,
+)
+from .run_file import RunWriter, read_blocks, read_run, write_run
+from .settings import (
+    INDEX_MEMORY_BUDGET,
+    RUN_BLOCK_BYTES,
+    PARSE_WORKERS,
+    STORE_POSITIONS,
+    CHAMPION_LIST_SIZE,
+    CHAMPION_MIN_POSTINGS,
+    SHARDS,
+)
 
 
 # Helper functions for the Block Sort Based Indexing Algorithm -
-# open_file() --> opens new index files as and when required.
-# sort_list() --> sorts a given list of tuples first by term then by docID.
-# write_to_file() --> dumps index to disk.
-# find_smallest() --> returns the smallest tuple and updates object_list accordingly.
+# run_name() --> returns the path of an intermediate index (run) file.
+# sort_block() --> flattens a term -> {docId: freq} (or {docId: positions}) block into
+#                  tuples sorted by term then docID.
+# is_run_file() --> checks whether a file in index_files is an intermediate run.
 
+# Approximate CPython memory cost of the in-memory block of parse_doc_range():
+# a new term costs its string plus an inner dict and a slot in the block dict,
+# a new (term, docId) posting costs a slot in the inner dict, and a position costs its
+# slot in the positions list of the posting (and the int for large positions).
+# The estimate only predicts when to measure the block (see block_memory()), it is
+# 15 to 50% below the measured size without positions and up to 2x with positions.
+TERM_BYTES = 200
+POSTING_BYTES = 40
+POSITION_BYTES = 16
 
-def open_file(curr_file_no=None, filename=None):
-    if curr_file_no:
-        filename = "./index_files/temp_index" + str(curr_file_no) + ".pkl"
-    file_obj = open(filename, "wb")
-    return file_obj
+# The block is spilled once its measured size is within 1/SPILL_MARGIN of the budget.
+SPILL_MARGIN = 8
 
+# A run being merged holds its raw, decompressed and decoded block in memory, each of
+# at most about RUN_BLOCK_BYTES (see run_file.py), with some slack for the last posting.
+RUN_READ_BYTES = 4 * RUN_BLOCK_BYTES
 
-def sort_list(unsorted_list):
-    return sorted(unsorted_list, key=lambda x: (x[0], x[1]))
+# Number of documents normalized at once by parse_doc_range(), the distinct words of a
+# batch are filtered and stemmed once (see Normalizer.normalize_many()).
+NORMALIZE_BATCH = 64
 
 
-def write_to_file(index_obj, curr_list):
-    for entry in curr_list:
-        pickle.dump(entry, index_obj, pickle.HIGHEST_PROTOCOL)
+def run_name(curr_file_no="", index_dir=INDEX_DIR):
+    return os.path.join(index_dir, "temp_index" + str(curr_file_no) + ".run")
 
 
-def find_smallest(obj_list):
-    smallest = ()
-    small_ptr = None  # stores the file pointer containing the smallest tuple.
-    for obj, ptr in obj_list:
-        if not smallest or obj[0] < smallest[0]:
-            smallest = obj
-            small_ptr = ptr
-        elif obj[0] == smallest[0] and obj[1] < smallest[1]:
-            smallest = obj
-            small_ptr = ptr
-    obj_list.remove((smallest, small_ptr))
-    try:
-        new_obj = pickle.load(
-            small_ptr
-        )  # Increase the file pointer to point to next tuple
-        obj_list.append((new_obj, small_ptr))
-    except EOFError:
-        small_ptr.close()  # Close the file if no more tuples are available.
-    return (smallest, obj_list)
+def sort_block(block):
+    # Terms are popped as they are written, so memory is released while spilling.
+    for term in sorted(block):
+        for docId, freq in sorted(block.pop(term).items()):
+            if type(freq) is list:  # Positions of the term in the document.
+                yield (term, docId, len(freq), freq)
+            else:
+                yield (term, docId, freq)
+
+
+def block_memory(block):
+    """
+    Returns the memory (in bytes) of a term -> {docId: freq} (or {docId: positions})
+    block, measured with sys.getsizeof. Small ints shared by CPython are counted too,
+    so it is an upper bound.
+    """
+    getsizeof = sys.getsizeof
+    size = getsizeof(block)
+    for term, postings in block.items():
+        size += getsizeof(term) + getsizeof(postings)
+        for docId, freq in postings.items():
+            size += getsizeof(docId) + getsizeof(freq)
+            if type(freq) is list:
+                size += sum(map(getsizeof, freq))
+    return size
+
+
+def is_run_file(filename):
+    return filename.startswith("temp_index") and filename.endswith(".run")
 
 
 def assign_docId():
-    """Assigns an id number to each document in the corpus"""
+    """
+    Assigns an id number to each document in the corpus, in corpus order. Returns the
+    corpus reader, which knows where every document is (see corpus.py).
+    """
     print("Assigning Doc ID")
     id_dict = {}
     curr_id = 1
-    file_list = os.listdir("corpus")
+    corpus = open_corpus()
+    file_list = corpus.names()
     if not file_list:
         raise Exception("Error- Corpus is Empty! Add some documents.")
     for filename in file_list:
@@ -80,166 +158,439 @@ def assign_docId():
     with open("./index_files/docId.pkl", "wb") as f:
         pickle.dump(id_dict, f, pickle.HIGHEST_PROTOCOL)
     print("Done assigning Doc ID")
+    return corpus
 
 
-def parse_docs():
+def _normalized_docs(id_items, documents, doc_store, forms):
+    """
+    Yields the (docId, normalized terms) of the (docId, name) pairs, reading their text
+    from `documents` and adding their metadata to `doc_store`. Documents are normalized
+    NORMALIZE_BATCH at a time, their words are counted in `forms`.
+    """
+    normalize_many = get_normalizer().normalize_many
+    for start in range(0, len(id_items), NORMALIZE_BATCH):
+        batch = id_items[start : start + NORMALIZE_BATCH]
+        texts = []
+        for docId, name in batch:
+            # Get document text as String.
+            read_name, doc_text = next(documents, (None, None))
+            if read_name != name:
+                raise Exception("Error- Document not found in the corpus: " + name)
+            doc_store.add(*document_metadata(name, doc_text))
+            texts.append(doc_text.replace("\n", " "))
+        # Get list of terms in every document after normalization.
+        for (docId, _), doc_terms in zip(batch, normalize_many(texts, forms)):
+            yield docId, doc_terms
+
+
+def parse_doc_range(
+    id_items,
+    run_prefix="",
+    show_progress=True,
+    memory_budget=INDEX_MEMORY_BUDGET,
+    doc_store=os.path.join(INDEX_DIR, DOC_STORE_FILE),
+    index_dir=INDEX_DIR,
+    store_positions=STORE_POSITIONS,
+    corpus=None,
+):
+    """
+    Normalizes the given (docId, name) pairs (in corpus order, see corpus.py) and
+    writes their sorted (term, docId, freq) tuples (with the positions of the term in
+    the document if `store_positions`) to intermediate runs named
+    <index_dir>/temp_index<run_prefix><no>.run.
+    The title, link and summary of the documents are written to `doc_store`,
+    docIds must be consecutive. Documents are read with the `corpus` reader, a new
+    reader of the corpus by default. The words of each stem are counted in
+    <index_dir>/temp_forms<run_prefix>.pkl, for completions (see suggest.py).
+
+    Term frequencies are aggregated in memory (SPIMI), so every run holds one
+    posting per (term, docId) instead of one per token occurrence. The block is
+    spilled once its size, measured by block_memory(), nears `memory_budget` bytes.
+    The size is measured when the estimate of TERM_BYTES, POSTING_BYTES and
+    POSITION_BYTES (scaled by the error of the last measurement) is halfway to the
+    budget, then halfway again, so a block is measured a few times.
+    """
+    curr_file_no = 1
+    # Maps term -> {docId: freq} (or {docId: [positions]}) for the current intermediate index.
+    curr_block = {}
+    block_bytes = 0  # Estimated memory used by curr_block.
+    scale = 1.0  # Measured size / estimated size, as of the last measurement.
+    next_check = memory_budget / 2  # Predicted size of the next measurement.
+    id_dict_len = len(id_items)
+    doc_store = DocStoreWriter(doc_store, id_items[0][0] if id_items else 1)
+    forms = Counter()
+    if corpus is None:
+        corpus = open_corpus()
+    documents = corpus.read([name for _, name in id_items])
+    for docId, doc_terms in _normalized_docs(id_items, documents, doc_store, forms):
+        if show_progress:
+            print(f"Processing {docId} of {id_dict_len}", end="\r")
+
+        if store_positions:
+            for position, term in enumerate(doc_terms):
+                if not term:  # normalize returns [""] for documents without terms.
+                    continue
+                postings = curr_block.get(term)
+                if postings is None:
+                    postings = curr_block[term] = {}
+                    block_bytes += TERM_BYTES + sys.getsizeof(term)
+                if docId in postings:
+                    postings[docId].append(position)
+                else:
+                    postings[docId] = [position]
+                    block_bytes += POSTING_BYTES
+            block_bytes += POSITION_BYTES * len(doc_terms)
+        else:
+            for term in doc_terms:
+                if not term:  # normalize returns [""] for documents without terms.
+                    continue
+                postings = curr_block.get(term)
+                if postings is None:
+                    postings = curr_block[term] = {}
+                    block_bytes += TERM_BYTES + sys.getsizeof(term)
+                if docId in postings:
+                    postings[docId] += 1
+                else:
+                    postings[docId] = 1
+                    block_bytes += POSTING_BYTES
+
+        # Spill only between documents, so a (term, docId) pair is never split across runs.
+        if block_bytes * scale < next_check:
+            continue
+        measured = block_memory(curr_block)
+        scale = measured / max(block_bytes, 1)
+        if measured < memory_budget - memory_budget / SPILL_MARGIN:
+            next_check = (measured + memory_budget) / 2
+            continue
+        write_run(
+            run_name(run_prefix + str(curr_file_no), index_dir), sort_block(curr_block)
+        )
+        curr_block = {}
+        block_bytes = 0
+        next_check = memory_budget / 2
+        curr_file_no += 1
+    if curr_block:
+        write_run(
+            run_name(run_prefix + str(curr_file_no), index_dir), sort_block(curr_block)
+        )
+    doc_store.close()
+    write_form_counts(forms, index_dir, run_prefix)
+
+
+def _parse_worker(args):
+    """ Entry point of a parsing process, parses one contiguous range of documents. """
+    worker_no, id_items, memory_budget, index_dir, store_positions, corpus = args
+    parse_doc_range(
+        id_items,
+        run_prefix=str(worker_no) + "_",
+        show_progress=False,
+        memory_budget=memory_budget,
+        doc_store=doc_store_part(worker_no, index_dir),
+        index_dir=index_dir,
+        store_positions=store_positions,
+        corpus=corpus,
+    )
+    return worker_no
+
+
+def doc_store_part(worker_no, index_dir=INDEX_DIR):
+    return os.path.join(index_dir, "temp_docs" + str(worker_no) + ".bin")
+
+
+def parse_docs(
+    workers=PARSE_WORKERS,
+    index_dir=INDEX_DIR,
+    id_items=None,
+    store_positions=STORE_POSITIONS,
+    corpus=None,
+):
     """
     After normalization of documents, parses them to construct
     intermediate inverted indices.
 
-        * temp_index<no>.pkl store the intermediate indices
+        * temp_index<no>.run store the intermediate indices
+        * With workers > 1 the corpus is split into contiguous docId ranges which
+          are parsed in a process pool, each worker writing its own runs
+          (temp_index<worker>_<no>.run). The merged index is identical to the
+          serial one since runs are sorted by (term, docId).
+        * INDEX_MEMORY_BUDGET bounds the memory of the in-memory blocks, it is
+          shared evenly between the workers.
+        * The title, link and summary of every document are saved in docs.bin,
+          workers write a part each which are concatenated in docId order.
+        * id_items is the list of (docId, name) pairs to parse, all documents
+          in docId.pkl by default.
+        * With store_positions the runs also hold the positions of every term
+          in each document, for phrase queries.
+        * Documents are read with the `corpus` reader returned by assign_docId(),
+          so that workers read their range of bundle corpora without reading the
+          bundles from the start.
 
     """
     print("Parsing Docs")
-    # Load the id dictionary.
-    id_dict = {}
-    with open("./index_files/docId.pkl", "rb") as f:
-        id_dict = pickle.load(f)
-        curr_file_no = 1
-        # Stores (termId,docId) pairs for current intermediate index.
-        curr_list = []
-        id_dict_len = len(id_dict)
-        for docId, name in id_dict.items():
-            print(f"Processing {docId} of {id_dict_len}", end="\r")
-            # Get document text as String.
-            doc_text = pathlib.Path("./corpus/" + name).read_text().replace("\n", " ")
+    if id_items is None:
+        # Load the id dictionary.
+        with open("./index_files/docId.pkl", "rb") as f:
+            id_items = list(pickle.load(f).items())
+    if corpus is None:
+        corpus = open_corpus()
+        corpus.names()  # Locates the documents.
+    remove_form_counts(index_dir)
+
+    if workers <= 1 or len(id_items) < 2:
+        parse_doc_range(
+            id_items,
+            doc_store=os.path.join(index_dir, DOC_STORE_FILE),
+            index_dir=index_dir,
+            store_positions=store_positions,
+            corpus=corpus,
+        )
+    else:
+        workers = min(workers, len(id_items))
+        memory_budget = INDEX_MEMORY_BUDGET // workers
+        chunk_size = -(-len(id_items) // workers)  # ceil division
+        chunks = [
+            (
+                worker_no + 1,
+                id_items[start : start + chunk_size],
+                memory_budget,
+                index_dir,
+                store_positions,
+                corpus.subset(name for _, name in id_items[start : start + chunk_size]),
+            )
+            for worker_no, start in enumerate(range(0, len(id_items), chunk_size))
+        ]
+        with multiprocessing.Pool(workers) as pool:
+            for worker_no in pool.imap_unordered(_parse_worker, chunks):
+                print(f"Parsed chunk {worker_no} of {len(chunks)}", end="\r")
+        concatenate_stores(
+            [doc_store_part(chunk[0], index_dir) for chunk in chunks],
+            os.path.join(index_dir, DOC_STORE_FILE),
+        )
+    print("Done parsing Docs")
 
-            # Get list of terms in document after normalization.
-            doc_terms = process_string(doc_text)
 
-            for term in doc_terms:
-                curr_list.append((term, docId))
-                if len(curr_list) >= BLOCK_SIZE:
-                    curr_list = sort_list(
-                        curr_list
-                    )  # sort the list before writing to disk.
-                    index_obj = open_file(curr_file_no=curr_file_no)
-                    write_to_file(index_obj, curr_list)
-                    curr_list = []
-                    index_obj.close()
-                    curr_file_no += 1
-        if curr_list:
-            curr_list = sort_list(curr_list)
-            index_obj = open_file(curr_file_no=curr_file_no)
-            write_to_file(index_obj, curr_list)
-            index_obj.close()
-    print("Done parsing Docs")
+def merge_runs(file_list, filename):
+    """ Merges the given runs into a single run using a heap based k-way merge. """
+    runs = [read_run(run_file) for run_file in file_list]
+    with RunWriter(filename) as writer:
+        writer.write(heapq.merge(*runs))
 
 
-def merge_indices():
-    """ Merges the intermediate indices using k-way merge to get an unified inverted index. """
+def merge_indices(index_dir=INDEX_DIR):
+    """
+    Merges the intermediate indices using a heap based k-way merge to get an
+    unified inverted index. Runs are read and written block by block.
+
+    If the read buffers of all runs do not fit in INDEX_MEMORY_BUDGET, runs are
+    first merged in groups over several passes.
+    """
 
     print("Merging indices")
-    file_list = os.listdir("index_files")
-    temp_index_obj = open_file(filename="./index_files/temp_index.pkl")
-    ptrs = []  # List of file pointers for all intermediate indices.
-    curr_list = []  # Stores list to tuples to be written to the unified index.
-    obj_list = []  # List of (tuple,ptr) pair for every file.
-    for filename in file_list:
-        if filename not in ["docId.pkl", "termId.pkl", "temp_index.pkl", "index.db"]:
-            ptrs.append(open("./index_files/" + filename, "rb"))
-    for ptr in ptrs:
-        obj = pickle.load(ptr)
-        obj_list.append((obj, ptr))
-
-    # Until all intermediate indices are parsed , find smallest and write to unified index.
-    slash_value = 0
-    while obj_list:
-        if slash_value:
-            print("Merging /", end="\r")
-        else:
-            print("Merging \\", end="\r")
-        slash_value = not slash_value
-        req_obj, obj_list = find_smallest(obj_list)
-        curr_list.append(req_obj)
-        if len(curr_list) > BLOCK_SIZE:
-            write_to_file(temp_index_obj, curr_list)
-            curr_list = []
-    if curr_list:
-        write_to_file(temp_index_obj, curr_list)
-    temp_index_obj.close()
+    file_list = [
+        os.path.join(index_dir, filename)
+        for filename in os.listdir(index_dir)
+        if is_run_file(filename) and filename != "temp_index.run"
+    ]
+    # Budget is shared by the read buffers of the runs and the write buffer.
+    fan_in = max(2, INDEX_MEMORY_BUDGET // RUN_READ_BYTES - 1)
+    pass_no = 0
+    while len(file_list) > fan_in:
+        pass_no += 1
+        print(f"Merging pass {pass_no} over {len(file_list)} runs", end="\r")
+        merged_list = []
+        for group_no, start in enumerate(range(0, len(file_list), fan_in)):
+            merged_name = run_name(f"_pass{pass_no}_{group_no}", index_dir)
+            merge_runs(file_list[start : start + fan_in], merged_name)
+            for run_file in file_list[start : start + fan_in]:
+                os.remove(run_file)
+            merged_list.append(merged_name)
+        file_list = merged_list
+    merge_runs(file_list, run_name(index_dir=index_dir))
     print("Done Merging indices")
 
 
-def construct_index():
+def construct_index(
+    index_dir=INDEX_DIR, total_number_of_docs=None, store_positions=STORE_POSITIONS
+):
     """
-    Constructs the final index in the form of a shelf
-    where the key is each term in the corpus and the value is
-    a dictionary containing docId,freq as the key-value pairs.
+    Constructs the final index, a sorted term dictionary (lexicon.bin) pointing
+    into a file of compressed postings (postings.bin) holding the docId,freq pairs
+    of each term in the corpus, and their positions (positions.bin) if
+    `store_positions`, and the champion lists of frequent terms (champions.bin).
+    See index_file.py for the format. The completions of term prefixes are saved
+    in completions.pkl (see suggest.py).
+
+    Corpus statistics (number of documents, document frequency, maximum frequency
+    and idf of every term) are saved along with it in stats.bin. The number of
+    documents is taken from docId.pkl unless given.
     """
 
     print("Starting to Index")
-    index_obj = shelve.open("./index_files/index.db")
-    with open("./index_files/temp_index.pkl", "rb") as temp_index:
-        # Dict of docId,freq as key-value pairs for the current term.
-        term_dict = {}
-        prev_term = ""
-        prev_docId = -1
-        freq = 0  # Frequency value for a term in a particular document.
-        slash_value = 0
-        while True:
-            try:
-                term, docId = pickle.load(temp_index)
-                if slash_value:
-                    print("Indexing /", end="\r")
-                else:
-                    print("Indexing \\", end="\r")
-                slash_value = not slash_value
-                if term == prev_term:
-                    if docId == prev_docId:
-                        freq += 1
-                    else:  # new docId for same term.
-                        if prev_docId != -1:
-                            term_dict[prev_docId] = freq
-                        prev_docId = docId
-                        freq = 1
-                else:  # new term.
-                    if prev_term != "":
-                        term_dict[prev_docId] = freq
-                        index_obj[prev_term] = term_dict
+    if total_number_of_docs is None:
+        with open("./index_files/docId.pkl", "rb") as f:
+            total_number_of_docs = len(pickle.load(f))
+    with IndexWriter(
+        index_dir, store_positions, CHAMPION_LIST_SIZE, CHAMPION_MIN_POSTINGS
+    ) as index_obj:
+        # docIds, their frequencies and the positions in them for the current term.
+        docIds = []
+        freqs = []
+        positions = [] if store_positions else None
+        prev_term = None
+        block_no = 0
+        for block in read_blocks(run_name(index_dir=index_dir)):
+            block_no += 1
+            print(f"Indexing block {block_no}", end="\r")
+            for term, docId, freq, *doc_positions in block:
+                if term != prev_term:  # new term.
+                    if prev_term is not None:
+                        index_obj.add(prev_term, docIds, freqs, positions)
                     prev_term = term
-                    prev_docId = docId
-                    freq = 1
-                    term_dict = {}
-            except EOFError:
-                term_dict[prev_docId] = freq
-                index_obj[prev_term] = term_dict
-                index_obj.close()
-                break
+                    docIds = []
+                    freqs = []
+                    positions = [] if store_positions else None
+                docIds.append(docId)
+                freqs.append(freq)
+                if store_positions:
+                    positions.extend(doc_positions[0])
+        if prev_term is not None:
+            index_obj.add(prev_term, docIds, freqs, positions)
+
+    document_frequencies = index_obj.document_frequencies
+    idfs = [
+        inverse_document_frequency(total_number_of_docs, document_frequency)
+        for document_frequency in document_frequencies
+    ]
+    write_stats(
+        total_number_of_docs,
+        document_frequencies,
+        index_obj.max_frequencies,
+        idfs,
+        index_dir,
+    )
+    write_completions(index_dir)
 
     # Delete temporary files
     print("Deleting Temporary Files")
-    no_files = len(os.listdir("./index_files")) - 2
+    run_files = [name for name in os.listdir(index_dir) if is_run_file(name)]
+    no_files = len(run_files)
     count = 1
-    for file_name in os.listdir("./index_files"):
-        if file_name[:10] == "temp_index":
-            print(f"Deleting file {count} of {no_files}", end="\r")
-            os.remove("./index_files/" + file_name)
-            count += 1
+    for file_name in run_files:
+        print(f"Deleting file {count} of {no_files}", end="\r")
+        os.remove(os.path.join(index_dir, file_name))
+        count += 1
     print("Done Deleting Temporary files")
 
 
-# Temporary function to print pickle files. To be removed later.
+# Temporary function to print index files. To be removed later.
 def display(final_index=True):
     if final_index:
-        ptr = shelve.open("./index_files/index.db")
-        for key in ptr.keys():
-            print(key, ptr[key], sep=" ")
-        ptr.close()
+        for term, docIds, freqs in IndexFile():
+            print(term, dict(zip(docIds, freqs)), sep=" ")
         return
     else:
-        with open("./index_files/temp_index.pkl", "rb") as openfile:
-            while True:
-                try:
-                    print(pickle.load(openfile))
-                except EOFError:
-                    break
-
-
-def start_indexing():
-    assign_docId()
-    parse_docs()
-    merge_indices()
-    construct_index()
+        for entry in read_run(run_name()):
+            print(entry)
+
+
+def _build_shard(args):
+    """ Entry point of a shard building process, builds one shard from start to end. """
+    shard_no, id_items, memory_budget, shard_dir, store_positions, corpus = args
+    os.makedirs(shard_dir)
+    parse_doc_range(
+        id_items,
+        show_progress=False,
+        memory_budget=memory_budget,
+        doc_store=os.path.join(shard_dir, DOC_STORE_FILE),
+        index_dir=shard_dir,
+        store_positions=store_positions,
+        corpus=corpus,
+    )
+    merge_indices(shard_dir)
+    construct_index(shard_dir, len(id_items), store_positions)
+    return shard_no
+
+
+def build_shards(
+    shards=SHARDS, workers=None, store_positions=STORE_POSITIONS, corpus=None
+):
+    """
+    Builds the index as `shards` shards over contiguous docId ranges, in
+    index_files/shards/<no>, with `workers` processes (one per shard by default,
+    at most one per core). Every shard gets its share of INDEX_MEMORY_BUDGET.
+    Documents are read with the `corpus` reader returned by assign_docId().
+    """
+    with open("./index_files/docId.pkl", "rb") as f:
+        id_dict = pickle.load(f)
+    if corpus is None:
+        corpus = open_corpus()
+        corpus.names()  # Locates the documents.
+    ranges = shard_ranges(len(id_dict), shards)
+    if workers is None:
+        workers = min(len(ranges), os.cpu_count() or 1)
+    workers = max(1, min(workers, len(ranges)))
+    jobs = [
+        (
+            shard_no,
+            [(docId, id_dict[docId]) for docId in docIds],
+            INDEX_MEMORY_BUDGET // workers,
+            os.path.join(INDEX_DIR, SHARDS_DIR, str(shard_no)),
+            store_positions,
+            corpus.subset(id_dict[docId] for docId in docIds),
+        )
+        for shard_no, docIds in enumerate(ranges, 1)
+    ]
+    print(f"Building {len(jobs)} shards")
+    shutil.rmtree(os.path.join(INDEX_DIR, SHARDS_DIR), ignore_errors=True)
+    with multiprocessing.Pool(workers) as pool:
+        for shard_no in pool.imap_unordered(_build_shard, jobs):
+            print(f"Built shard {shard_no} of {len(jobs)}")
+
+
+def reset_segments(shards=1):
+    """
+    Replaces the manifest by one holding only the freshly built index (of `shards`
+    shards) and deletes the segments of incremental updates, and the files of the
+    previous build when its layout differs.
+    """
+    with open("./index_files/docId.pkl", "rb") as f:
+        no_docs = len(pickle.load(f))
+    with manifest_lock():
+        manifest = load_manifest()
+        if manifest is None:
+            manifest = new_manifest(no_docs, shards=shards)
+        else:
+            # Keep increasing the generation, so that open readers notice the change.
+            manifest = new_manifest(
+                no_docs, manifest["generation"] + 1, manifest["next_segment"], shards
+            )
+        save_manifest(manifest)
+    shutil.rmtree(os.path.join(INDEX_DIR, SEGMENTS_DIR), ignore_errors=True)
+    if manifest["shards"] > 1:
+        index_files = (
+            LEXICON_FILE,
+            POSTINGS_FILE,
+            STATS_FILE,
+            POSITIONS_FILE,
+            CHAMPIONS_FILE,
+            COMPLETIONS_FILE,
+            DOC_STORE_FILE,
+        )
+        for filename in index_files:
+            if os.path.exists(os.path.join(INDEX_DIR, filename)):
+                os.remove(os.path.join(INDEX_DIR, filename))
+    else:
+        shutil.rmtree(os.path.join(INDEX_DIR, SHARDS_DIR), ignore_errors=True)
+
+
+def start_indexing(shards=SHARDS):
+    corpus = assign_docId()
+    if shards > 1:
+        build_shards(shards, corpus=corpus)
+    else:
+        parse_docs(corpus=corpus)
+        merge_indices()
+        construct_index()
+    reset_segments(shards)
     # Uncomment during development.
     # display()
@@ -0,0 +1,498 @@
+"""
+*Index Files*
+
+The inverted index is stored in three (up to five) memory-mappable files -
+
+    * lexicon.bin --> sorted term dictionary, with the offset of every term's postings.
+    * postings.bin --> postings of every term, docIds are delta encoded and both docIds
+      and frequencies are packed in arrays of the smallest width (1, 2 or 4 bytes)
+      that fits them.
+    * stats.bin --> corpus statistics, the number of documents along with the document
+      frequency, maximum frequency in a document and idf of every term (in lexicon order).
+    * positions.bin --> optional, positions of every term in each document of its
+      postings, used by phrase and proximity queries.
+    * champions.bin --> optional, the champion list of every long postings list, its
+      postings of highest frequency (see champions.py).
+
+Lexicon layout:
+
+    <magic> <version> <no. of terms> <skip interval> <flags>   (4s + 4 x uint32, padded to 24)
+    <term offsets into the term bytes>                    (uint64 array, no. of terms + 1)
+    <postings offsets into postings.bin>                  (uint64 array, no. of terms + 1)
+    <positions offsets into positions.bin>                (uint64 array, if flags & HAS_POSITIONS)
+    <champions offsets into champions.bin>                (uint64 array, if flags & HAS_CHAMPIONS)
+    <terms in sorted order, utf-8>
+
+Postings record of a term (8 byte aligned):
+
+    <no. of postings> <docId width> <freq width>          (uint32 + 2 x uint8, padded to 8)
+    <docId deltas>                                        (array of docId width)
+    <frequencies>                                         (array of freq width, padded to 4)
+    <skip pointers>                                       (uint32 array)
+
+Skip pointers hold the last docId of every block of <skip interval> postings, so that
+a reader can jump to the block holding a docId without decoding the ones before it
+(see boolean_query.py). Terms with at most <skip interval> postings have none.
+
+Positions record of a term (8 byte aligned):
+
+    <no. of blocks> <no. of positions> <width>            (2 x uint32 + uint8, padded to 12)
+    <index of the first position of every block>         (uint32 array, one per block of
+                                                           <skip interval> postings)
+    <positions>                                           (array of width)
+
+Positions are given posting after posting, the first position of a posting is absolute
+and the following ones are the gaps from the previous position.
+
+Champions record of a term (8 byte aligned, empty for terms without a champion list):
+
+    <highest frequency of the postings left out>          (uint32, padded to 8)
+    <postings record of the champion postings>            (absent if there are none)
+
+The champion postings of a term are all its postings with a frequency above the
+(champion size + 1)th highest one, in docId order, so no posting left out has a
+higher frequency than any champion. A term whose postings all have that frequency has
+no champions, only the frequency.
+
+Stats layout:
+
+    <magic> <version> <no. of documents> <no. of terms>   (4s + uint32 + 2 x uint64)
+    <document frequencies>                                (uint32 array)
+    <maximum frequency of the term in any document>       (uint32 array, padded to 8)
+    <idf>                                                 (float64 array)
+
+All integers are little endian. On little endian machines postings are read
+straight out of the memory map with `memoryview.cast`, without copying.
+"""
+
+import heapq
+import mmap
+import os
+import struct
+import sys
+from array import array
+from itertools import accumulate
+
+LEXICON_FILE = "lexicon.bin"
+POSTINGS_FILE = "postings.bin"
+STATS_FILE = "stats.bin"
+POSITIONS_FILE = "positions.bin"
+CHAMPIONS_FILE = "champions.bin"
+INDEX_DIR = "./index_files"
+
+MAGIC = b"MKLX"
+VERSION = 6
+LEXICON_HEADER = struct.Struct("<4sIIII4x")
+POSTINGS_HEADER = struct.Struct("<IBB2x")
+POSITIONS_HEADER = struct.Struct("<IIB3x")
+CHAMPIONS_HEADER = struct.Struct("<I4x")
+HAS_POSITIONS = 1
+HAS_CHAMPIONS = 2
+STATS_MAGIC = b"MKST"
+STATS_HEADER = struct.Struct("<4sIQQ")
+
+# Number of postings per skip pointer.
+SKIP_INTERVAL = 128
+
+# Array typecode for each width in bytes.
+TYPECODES = {1: "B", 2: "H", 4: "I", 8: "Q"}
+
+
+def _width(max_value):
+    """ Returns the smallest width in bytes able to store `max_value`. """
+    if max_value < 1 << 8:
+        return 1
+    if max_value < 1 << 16:
+        return 2
+    return 4
+
+
+def _pack(values, width):
+    arr = array(TYPECODES[width], values)
+    if sys.byteorder == "big" and width > 1:
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _view(buffer, width, typecode=None):
+    """ Returns the little endian integers in `buffer` as a sequence, without copying. """
+    typecode = typecode or TYPECODES[width]
+    if sys.byteorder == "big" and width > 1:
+        arr = array(typecode, bytes(buffer))
+        arr.byteswap()
+        return arr
+    return memoryview(buffer).cast(typecode)
+
+
+def _padding(length, alignment=8):
+    return -length % alignment
+
+
+def _no_skips(count, skip_interval):
+    return -(-count // skip_interval) if count > skip_interval else 0
+
+
+def encode_postings(docIds, freqs, skip_interval=SKIP_INTERVAL):
+    """ Encodes increasing docIds and their frequencies into a postings record. """
+    deltas = [docId - prev for docId, prev in zip(docIds, [0] + docIds[:-1])]
+    docId_width = _width(max(deltas))
+    freq_width = _width(max(freqs))
+    record = b"".join(
+        [
+            POSTINGS_HEADER.pack(len(docIds), docId_width, freq_width),
+            _pack(deltas, docId_width),
+            _pack(freqs, freq_width),
+        ]
+    )
+    if _no_skips(len(docIds), skip_interval):
+        skips = docIds[skip_interval - 1 :: skip_interval]
+        if len(docIds) % skip_interval:
+            skips.append(docIds[-1])
+        record += bytes(_padding(len(record), 4)) + _pack(skips, 4)
+    return record + bytes(_padding(len(record)))
+
+
+def decode_postings(buffer):
+    """
+    Given a buffer starting with a postings record, returns a (docId deltas, freqs)
+    pair of sequences that view `buffer` without copying.
+    """
+    count, docId_width, freq_width = POSTINGS_HEADER.unpack_from(buffer)
+    buffer = memoryview(buffer)
+    start = POSTINGS_HEADER.size
+    mid = start + count * docId_width
+    end = mid + count * freq_width
+    return _view(buffer[start:mid], docId_width), _view(buffer[mid:end], freq_width)
+
+
+def encode_positions(freqs, positions, skip_interval=SKIP_INTERVAL):
+    """
+    Encodes the positions of a term, `positions` are the increasing positions in each
+    document of its postings concatenated, `freqs` the number of positions per document.
+    """
+    deltas = [
+        position - prev for position, prev in zip(positions, [0] + positions[:-1])
+    ]
+    block_starts = []
+    start = 0
+    for no, freq in enumerate(freqs):
+        if no % skip_interval == 0:
+            block_starts.append(start)
+        # The first position of a document is absolute.
+        deltas[start] = positions[start]
+        start += freq
+    width = _width(max(deltas))
+    record = b"".join(
+        [
+            POSITIONS_HEADER.pack(len(block_starts), len(deltas), width),
+            _pack(block_starts, 4),
+            _pack(deltas, width),
+        ]
+    )
+    return record + bytes(_padding(len(record)))
+
+
+def decode_positions(buffer):
+    """
+    Given a buffer starting with a positions record, returns a (block starts, positions)
+    pair of sequences that view `buffer` without copying.
+    """
+    no_blocks, no_positions, width = POSITIONS_HEADER.unpack_from(buffer)
+    buffer = memoryview(buffer)
+    start = POSITIONS_HEADER.size
+    mid = start + 4 * no_blocks
+    return (
+        _view(buffer[start:mid], 4),
+        _view(buffer[mid : mid + no_positions * width], width),
+    )
+
+
+def encode_champions(docIds, freqs, size, min_postings=0):
+    """
+    Encodes the champion list of a term, at most `size` of its postings, b"" if the
+    term has at most `min_postings` (or `size`) postings.
+    """
+    if len(docIds) <= max(size, min_postings):
+        return b""
+    tail_frequency = heapq.nlargest(size + 1, freqs)[-1]
+    champions = [pos for pos, freq in enumerate(freqs) if freq > tail_frequency]
+    if not champions:
+        return CHAMPIONS_HEADER.pack(tail_frequency)
+    return CHAMPIONS_HEADER.pack(tail_frequency) + encode_postings(
+        [docIds[pos] for pos in champions], [freqs[pos] for pos in champions]
+    )
+
+
+def decode_champions(buffer):
+    """
+    Given a buffer holding a champions record, returns the highest frequency of the
+    postings left out and (docId deltas, freqs) views of the champion postings.
+    """
+    (tail_frequency,) = CHAMPIONS_HEADER.unpack_from(buffer)
+    if len(buffer) == CHAMPIONS_HEADER.size:
+        return tail_frequency, ((), ())
+    return tail_frequency, decode_postings(memoryview(buffer)[CHAMPIONS_HEADER.size :])
+
+
+def decode_skips(buffer, skip_interval=SKIP_INTERVAL):
+    """
+    Given a buffer starting with a postings record, returns the skip pointers of the
+    record (the last docId of every block of `skip_interval` postings), without copying.
+    """
+    count, docId_width, freq_width = POSTINGS_HEADER.unpack_from(buffer)
+    no_skips = _no_skips(count, skip_interval)
+    start = POSTINGS_HEADER.size + count * (docId_width + freq_width)
+    start += _padding(start, 4)
+    return _view(memoryview(buffer)[start : start + 4 * no_skips], 4)
+
+
+class IndexWriter:
+    """
+    Writes terms and their postings, added in sorted term order, to the index files.
+    With a `champion_size`, terms with more than `champion_min_postings` postings get
+    a champion list of at most `champion_size` postings.
+    """
+
+    def __init__(
+        self,
+        index_dir=INDEX_DIR,
+        store_positions=False,
+        champion_size=0,
+        champion_min_postings=0,
+    ):
+        self.index_dir = index_dir
+        self.postings_file = open(os.path.join(index_dir, POSTINGS_FILE), "wb")
+        self.positions_file = None
+        if store_positions:
+            self.positions_file = open(os.path.join(index_dir, POSITIONS_FILE), "wb")
+            self.positions_offsets = array("Q", [0])
+        self.champions_file = None
+        if champion_size:
+            self.champions_file = open(os.path.join(index_dir, CHAMPIONS_FILE), "wb")
+            self.champions_offsets = array("Q", [0])
+            self.champion_size = champion_size
+            self.champion_min_postings = champion_min_postings
+        self.terms = bytearray()
+        self.term_offsets = array("Q", [0])
+        self.postings_offsets = array("Q", [0])
+        self.document_frequencies = array("I")
+        self.max_frequencies = array("I")
+
+    def add(self, term, docIds, freqs, positions=None):
+        """
+        Adds a term with its list of increasing docIds and their frequencies, along with
+        the positions of the term in each document (concatenated) if positions are stored.
+        """
+        self.postings_file.write(encode_postings(docIds, freqs))
+        if self.positions_file is not None:
+            self.positions_file.write(encode_positions(freqs, positions))
+            self.positions_offsets.append(self.positions_file.tell())
+        if self.champions_file is not None:
+            self.champions_file.write(
+                encode_champions(
+                    docIds, freqs, self.champion_size, self.champion_min_postings
+                )
+            )
+            self.champions_offsets.append(self.champions_file.tell())
+        self.document_frequencies.append(len(docIds))
+        self.max_frequencies.append(max(freqs))
+        self.terms += term.encode("utf-8")
+        self.term_offsets.append(len(self.terms))
+        self.postings_offsets.append(self.postings_file.tell())
+
+    def close(self):
+        self.postings_file.close()
+        flags = 0
+        if self.positions_file is not None:
+            self.positions_file.close()
+            flags |= HAS_POSITIONS
+        if self.champions_file is not None:
+            self.champions_file.close()
+            flags |= HAS_CHAMPIONS
+        with open(os.path.join(self.index_dir, LEXICON_FILE), "wb") as lexicon:
+            lexicon.write(
+                LEXICON_HEADER.pack(
+                    MAGIC, VERSION, len(self.term_offsets) - 1, SKIP_INTERVAL, flags
+                )
+            )
+            lexicon.write(_pack(self.term_offsets, 8))
+            lexicon.write(_pack(self.postings_offsets, 8))
+            if flags & HAS_POSITIONS:
+                lexicon.write(_pack(self.positions_offsets, 8))
+            if flags & HAS_CHAMPIONS:
+                lexicon.write(_pack(self.champions_offsets, 8))
+            lexicon.write(self.terms)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_stats(
+    no_docs, document_frequencies, max_frequencies, idfs, index_dir=INDEX_DIR
+):
+    """ Writes the corpus statistics, per-term values are given in lexicon order. """
+    with open(os.path.join(index_dir, STATS_FILE), "wb") as stats:
+        stats.write(STATS_HEADER.pack(STATS_MAGIC, VERSION, no_docs, len(idfs)))
+        packed = _pack(document_frequencies, 4) + _pack(max_frequencies, 4)
+        stats.write(packed + bytes(_padding(len(packed))))
+        idfs = array("d", idfs)
+        if sys.byteorder == "big":
+            idfs.byteswap()
+        stats.write(idfs.tobytes())
+
+
+def _map(filename):
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class IndexFile:
+    """ Read only, memory mapped view of the index files. """
+
+    def __init__(self, index_dir=INDEX_DIR):
+        self.lexicon = _map(os.path.join(index_dir, LEXICON_FILE))
+        self.postings_map = _map(os.path.join(index_dir, POSTINGS_FILE))
+        magic, version, no_terms, skip_interval, flags = LEXICON_HEADER.unpack_from(
+            self.lexicon
+        )
+        if magic != MAGIC or version != VERSION:
+            raise Exception(
+                "Error- Unsupported index format! Please recreate the index."
+            )
+        self.no_terms = no_terms
+        self.skip_interval = skip_interval
+        self.has_positions = bool(flags & HAS_POSITIONS)
+        self.has_champions = bool(flags & HAS_CHAMPIONS)
+        lexicon = memoryview(self.lexicon)
+        start = LEXICON_HEADER.size
+        offsets_size = 8 * (no_terms + 1)
+        self.term_offsets = _view(lexicon[start : start + offsets_size], 8)
+        start += offsets_size
+        self.postings_offsets = _view(lexicon[start : start + offsets_size], 8)
+        start += offsets_size
+        if self.has_positions:
+            self.positions_offsets = _view(lexicon[start : start + offsets_size], 8)
+            self.positions_map = _map(os.path.join(index_dir, POSITIONS_FILE))
+            start += offsets_size
+        if self.has_champions:
+            self.champions_offsets = _view(lexicon[start : start + offsets_size], 8)
+            self.champions_map = _map(os.path.join(index_dir, CHAMPIONS_FILE))
+            start += offsets_size
+        self.terms = lexicon[start:]
+
+        self.stats = _map(os.path.join(index_dir, STATS_FILE))
+        magic, version, no_docs, no_terms = STATS_HEADER.unpack_from(self.stats)
+        if magic != STATS_MAGIC or version != VERSION or no_terms != self.no_terms:
+            raise Exception(
+                "Error- Corpus statistics do not match the index! Please recreate the index."
+            )
+        self.no_docs = no_docs
+        stats = memoryview(self.stats)
+        start = STATS_HEADER.size
+        end = start + 4 * no_terms
+        self.document_frequencies = _view(stats[start:end], 4)
+        start, end = end, end + 4 * no_terms
+        self.max_frequencies = _view(stats[start:end], 4)
+        start = end + _padding(end)
+        self.idfs = _view(stats[start : start + 8 * no_terms], 8, "d")
+
+    def term(self, ordinal):
+        """ Returns the term at position `ordinal` of the sorted term dictionary. """
+        return str(
+            self.terms[self.term_offsets[ordinal] : self.term_offsets[ordinal + 1]],
+            "utf-8",
+        )
+
+    def find(self, term):
+        """ Binary searches the term dictionary, returns the ordinal of `term` or -1. """
+        key = term.encode("utf-8")
+        terms = self.terms
+        offsets = self.term_offsets
+        lo, hi = 0, self.no_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            curr = bytes(terms[offsets[mid] : offsets[mid + 1]])
+            if curr == key:
+                return mid
+            if curr < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return -1
+
+    def _bisect(self, key):
+        """ Returns the ordinal of the first term not lower than `key` (utf-8 bytes). """
+        terms = self.terms
+        offsets = self.term_offsets
+        lo, hi = 0, self.no_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if bytes(terms[offsets[mid] : offsets[mid + 1]]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def prefix_range(self, prefix):
+        """ Returns the (start, stop) ordinals of the terms starting with `prefix`. """
+        key = prefix.encode("utf-8")
+        # 0xff never occurs in utf-8, so it sorts after every term starting with `key`.
+        return self._bisect(key), self._bisect(key + b"\xff")
+
+    def postings(self, ordinal):
+        """ Returns (docId deltas, freqs) views of the postings of the term at `ordinal`. """
+        start = self.postings_offsets[ordinal]
+        end = self.postings_offsets[ordinal + 1]
+        return decode_postings(memoryview(self.postings_map)[start:end])
+
+    def skips(self, ordinal):
+        """ Returns the skip pointers of the term at `ordinal`, empty for short postings. """
+        start = self.postings_offsets[ordinal]
+        end = self.postings_offsets[ordinal + 1]
+        return decode_skips(
+            memoryview(self.postings_map)[start:end], self.skip_interval
+        )
+
+    def positions(self, ordinal):
+        """
+        Returns (block starts, positions) views of the positions of the term at `ordinal`
+        (see the positions record layout). The index must have positions.
+        """
+        start = self.positions_offsets[ordinal]
+        end = self.positions_offsets[ordinal + 1]
+        return decode_positions(memoryview(self.positions_map)[start:end])
+
+    def champions(self, ordinal):
+        """
+        Returns the champion list of the term at `ordinal` as a (highest frequency left
+        out, (docId deltas, freqs)) pair, None if the term has none.
+        """
+        if not self.has_champions:
+            return None
+        start = self.champions_offsets[ordinal]
+        end = self.champions_offsets[ordinal + 1]
+        if start == end:
+            return None
+        return decode_champions(memoryview(self.champions_map)[start:end])
+
+    def lookup(self, term):
+        """
+        Returns a (docIds, freqs) pair of sequences for `term`, both empty if the
+        term is absent in the index.
+        """
+        ordinal = self.find(term)
+        if ordinal == -1:
+            return [], []
+        deltas, freqs = self.postings(ordinal)
+        return list(accumulate(deltas)), freqs
+
+    def __iter__(self):
+        """ Yields (term, docIds, freqs) for every term in sorted order. """
+        for ordinal in range(self.no_terms):
+            deltas, freqs = self.postings(ordinal)
+            yield self.term(ordinal), list(accumulate(deltas)), freqs
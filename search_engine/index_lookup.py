@@ -1,17 +1,263 @@
-import shelve
+import os
+import threading
+from collections import OrderedDict
+from itertools import accumulate
+from .index_file import IndexFile, INDEX_DIR
+from .doc_store import DocStore, SegmentedDocStore, DOC_STORE_FILE
+from .manifest import load_manifest, manifest_path
+from .weighting import inverse_document_frequency, tf_idf_weight
+from .settings import POSTINGS_CACHE_SIZE, BATCH_CACHE_SIZE
+from . import metrics
 
 
-def lookup_term(term):
+class IndexSnapshot:
+    """ The segments of the index at one generation of the manifest. """
+
+    def __init__(self, index_dir):
+        manifest = load_manifest(index_dir)
+        if manifest is None:  # Index built before segments existed.
+            paths, deleted, generation, build = ["."], frozenset(), None, None
+        else:
+            paths = [segment["path"] for segment in manifest["segments"]]
+            deleted, generation = manifest["deleted"], manifest["generation"]
+            # Time of the build, None before it was saved.
+            build = manifest.get("build")
+        self.generation = generation
+        # Identifies the index, the generation alone restarts when it is built anew.
+        self.version = (build, generation)
+        self.paths = paths
+        self.segments = [IndexFile(os.path.join(index_dir, path)) for path in paths]
+        self.deleted = deleted
+        # Tombstones are only kept for documents still indexed in some segment.
+        self.no_docs = sum(segment.no_docs for segment in self.segments) - len(deleted)
+        self.doc_store = SegmentedDocStore(
+            [DocStore(os.path.join(index_dir, path, DOC_STORE_FILE)) for path in paths]
+        )
+        self.completions = None  # Completions of every segment, loaded by suggest.py.
+
+
+class IndexReader:
     """
-    Takes in a term ,looks it up in the index and returns a dict containing docId,freq
-    as key-value pairs. Returns an empty dictionary if the term is absent in the index.
+    Long lived reader of the index files. The files are memory mapped once, and
+    the reader can be shared between threads.
+
+    Decoded postings of recently looked up terms are kept in an LRU cache holding
+    at most `cache_size` postings in total (0 disables the cache).
+
+    Corpus statistics saved by the indexer (number of documents, idf of each term)
+    are read from the index instead of the corpus directory.
+
+    The index may be made of several segments (see segments.py), postings of all
+    segments are concatenated and deleted documents are left out. refresh() picks
+    up incremental updates. A reader given the `snapshot` of another reader shares
+    its memory maps.
     """
 
-    index_obj = shelve.open("./index_files/index.db")
-    try:
-        result = index_obj[term]
-    except KeyError:  # term not found in the index.
-        result = {}
-    finally:
-        index_obj.close()
+    # Weighted postings of the NumPy scoring (see vector_scoring.term_scores()) are
+    # computed per query, not cached.
+    cache_scores = False
+
+    def __init__(
+        self, index_dir=INDEX_DIR, cache_size=POSTINGS_CACHE_SIZE, snapshot=None
+    ):
+        self.index_dir = index_dir
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.cached_postings = 0
+        self.lock = threading.Lock()
+        self.manifest_stat = self._manifest_stat()
+        self.snapshot = IndexSnapshot(index_dir) if snapshot is None else snapshot
+
+    @property
+    def no_docs(self):
+        return self.snapshot.no_docs
+
+    @property
+    def doc_store(self):
+        """ Document store covering every segment of the index. """
+        return self.snapshot.doc_store
+
+    def _manifest_stat(self):
+        try:
+            stat = os.stat(manifest_path(self.index_dir))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def refresh(self):
+        """
+        Reopens the index if it changed since it was opened, returns True if it did.
+        Cheap enough to be called before every query.
+        """
+        stat = self._manifest_stat()
+        if stat == self.manifest_stat:
+            return False
+        with self.lock:
+            if stat == self.manifest_stat:
+                return False
+            snapshot = IndexSnapshot(self.index_dir)
+            self.manifest_stat = stat
+            if snapshot.version == self.snapshot.version:
+                return False
+            self.snapshot = snapshot
+            self.cache.clear()
+            self.cached_postings = 0
+        return True
+
+    def lookup(self, term):
+        """
+        Returns a (docIds, freqs) pair of sequences for `term`, sorted by docId.
+        Both are empty if the term is absent in the index.
+        """
+        docIds, freqs, _, _ = self.entry(term)
+        return docIds, freqs
+
+    def idf(self, term):
+        """
+        Returns the idf of `term`, 0 if the term is absent in the index. Postings are
+        only decoded when documents have been deleted.
+        """
+        snapshot = self.snapshot
+        if snapshot.deleted:
+            return self.entry(term)[2]
+        document_frequency = 0
+        for index in snapshot.segments:
+            ordinal = index.find(term)
+            if ordinal != -1:
+                if len(snapshot.segments) == 1:
+                    return index.idfs[ordinal]
+                document_frequency += index.document_frequencies[ordinal]
+        if not document_frequency:
+            return 0.0
+        return inverse_document_frequency(snapshot.no_docs, document_frequency)
+
+    def entry(self, term):
+        """
+        Returns a (docIds, freqs, idf, max score) tuple for `term`, where max score
+        is an upper bound of the tf-idf weight of the term in any document.
+        """
+        return self._cached(term, self._read_entry, term)
+
+    def _read_entry(self, snapshot, term):
+        # Reading the memory map needs no locking.
+        if len(snapshot.segments) == 1 and not snapshot.deleted:
+            result = self._single_segment_entry(snapshot.segments[0], term)
+        else:
+            result = self._segmented_entry(snapshot, term)
+        metrics.count("postings", len(result[0]))
+        return result
+
+    def _cached(self, key, read, term):
+        """
+        Returns the cached result of read(snapshot, term), a tuple whose first item
+        holds the postings of the term, reading and caching it on a miss.
+        """
+        snapshot = self.snapshot
+        if self.cache_size:
+            with self.lock:
+                if key in self.cache:
+                    self.cache.move_to_end(key)
+                    result = self.cache[key]
+                else:
+                    result = None
+            if result is not None:
+                metrics.count("postings_cache_hits")
+                return result
+            metrics.count("postings_cache_misses")
+
+        result = read(snapshot, term)
+
+        if self.cache_size and len(result[0]) <= self.cache_size:
+            with self.lock:
+                # Entries of an index replaced meanwhile by refresh() are not cached.
+                if key not in self.cache and snapshot is self.snapshot:
+                    self.cache[key] = result
+                    self.cached_postings += len(result[0])
+                    while self.cached_postings > self.cache_size:
+                        docIds = self.cache.popitem(last=False)[1][0]
+                        self.cached_postings -= len(docIds)
         return result
+
+    @staticmethod
+    def _single_segment_entry(index, term):
+        """ Postings and statistics precomputed by the indexer are used as is. """
+        ordinal = index.find(term)
+        if ordinal == -1:
+            return ([], [], 0.0, 0.0)
+        deltas, freqs = index.postings(ordinal)
+        idf = index.idfs[ordinal]
+        return (
+            list(accumulate(deltas)),
+            freqs,
+            idf,
+            tf_idf_weight(index.max_frequencies[ordinal], idf),
+        )
+
+    @staticmethod
+    def _segmented_entry(snapshot, term):
+        """ Concatenates the postings of the segments, the idf is over live documents. """
+        docIds = []
+        freqs = []
+        max_frequency = 0
+        for index in snapshot.segments:
+            ordinal = index.find(term)
+            if ordinal == -1:
+                continue
+            deltas, segment_freqs = index.postings(ordinal)
+            docIds.extend(accumulate(deltas))
+            freqs.extend(segment_freqs)
+            # May be the frequency in a deleted document, it is still an upper bound.
+            max_frequency = max(max_frequency, index.max_frequencies[ordinal])
+        if snapshot.deleted:
+            live = [
+                pos for pos, docId in enumerate(docIds) if docId not in snapshot.deleted
+            ]
+            docIds = [docIds[pos] for pos in live]
+            freqs = [freqs[pos] for pos in live]
+        if not docIds:
+            return ([], [], 0.0, 0.0)
+        idf = inverse_document_frequency(snapshot.no_docs, len(docIds))
+        return (docIds, freqs, idf, tf_idf_weight(max_frequency, idf))
+
+
+class BatchReader(IndexReader):
+    """
+    IndexReader for the queries of a batch (see helper.batch_search()). It shares the
+    index opened by `reader` without following its updates, so all queries of a batch
+    read the same index. Its cache holds up to `cache_size` postings, weighted postings
+    of the NumPy scoring included, so that the postings of terms shared by queries of
+    the batch are read once.
+    """
+
+    cache_scores = True
+
+    def __init__(self, reader, cache_size=BATCH_CACHE_SIZE):
+        super().__init__(reader.index_dir, cache_size, reader.snapshot)
+
+    def refresh(self):
+        return False
+
+
+_default_reader = None
+_default_reader_lock = threading.Lock()
+
+
+def get_default_reader():
+    """ Returns a process wide IndexReader over ./index_files, opened on first use. """
+    global _default_reader
+    with _default_reader_lock:
+        if _default_reader is None:
+            _default_reader = IndexReader()
+        return _default_reader
+
+
+def lookup_term(term, reader=None):
+    """
+    Takes in a term ,looks it up in the index and returns a (docIds, freqs) pair of
+    sequences, sorted by docId. Both are empty if the term is absent in the index.
+    Uses the process wide reader unless an IndexReader is given.
+    """
+
+    if reader is None:
+        reader = get_default_reader()
+    return reader.lookup(term)
@@ -0,0 +1,121 @@
+"""
+*Segment Manifest*
+
+The index is a list of segments, each a complete index (lexicon.bin, postings.bin,
+stats.bin and docs.bin) over a contiguous range of docIds. The full build writes the
+first segment straight into index_files, or one segment per shard under
+index_files/shards/<no> when it is sharded. Incremental updates add segments under
+index_files/segments/<no> (see segments.py).
+
+The manifest (segments.pkl) is a dictionary -
+
+    * generation --> increased on every change, readers reopen the index when it changes.
+    * build --> time of the full build of the index, identifies it with the generation.
+    * segments --> list of {"path": <dir relative to index_files>, "docIds": range,
+      "no_docs": <no. of documents indexed in the segment>} in increasing docId order.
+      Compacted segments do not index the documents deleted before compaction, so
+      no_docs can be less than the size of their docId range.
+    * deleted --> set of docIds removed from the corpus that are still present in
+      the postings of a segment (tombstones).
+    * next_docId --> docId given to the next added document.
+    * next_segment --> number of the next segment directory.
+    * shards --> number of shards of the full build, the first segments. Shards are
+      never merged with each other.
+
+The manifest is replaced atomically, so readers never see a partial update.
+"""
+
+import os
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+from .index_file import INDEX_DIR, LEXICON_FILE
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, updates are only locked within a process.
+    fcntl = None
+
+MANIFEST_FILE = "segments.pkl"
+LOCK_FILE = "segments.lock"
+SEGMENTS_DIR = "segments"
+SHARDS_DIR = "shards"
+
+_manifest_lock = threading.Lock()
+
+
+def manifest_path(index_dir=INDEX_DIR):
+    return os.path.join(index_dir, MANIFEST_FILE)
+
+
+def shard_ranges(no_docs, shards):
+    """ Splits docIds 1..no_docs into (at most) `shards` contiguous ranges of equal size. """
+    shard_size = max(1, -(-no_docs // shards))  # ceil division
+    return [
+        range(start, min(start + shard_size, no_docs + 1))
+        for start in range(1, no_docs + 1, shard_size)
+    ]
+
+
+def new_manifest(no_docs, generation=0, next_segment=1, shards=1):
+    """
+    Returns the manifest of a freshly built index over docIds 1..no_docs, made of a
+    single segment or of one segment per shard.
+    """
+    if shards > 1:
+        segments = [
+            {
+                "path": os.path.join(SHARDS_DIR, str(shard_no)),
+                "docIds": docIds,
+                "no_docs": len(docIds),
+            }
+            for shard_no, docIds in enumerate(shard_ranges(no_docs, shards), 1)
+        ]
+    else:
+        segments = [{"path": ".", "docIds": range(1, no_docs + 1), "no_docs": no_docs}]
+    return {
+        "generation": generation,
+        "build": time.time(),
+        "segments": segments,
+        "deleted": set(),
+        "next_docId": no_docs + 1,
+        "next_segment": next_segment,
+        "shards": len(segments),
+    }
+
+
+def load_manifest(index_dir=INDEX_DIR):
+    """ Returns the manifest of the index in `index_dir`, None if it has no manifest. """
+    try:
+        with open(manifest_path(index_dir), "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_manifest(manifest, index_dir=INDEX_DIR):
+    """ Atomically replaces the manifest of the index in `index_dir`. """
+    temp_path = manifest_path(index_dir) + ".tmp"
+    with open(temp_path, "wb") as f:
+        pickle.dump(manifest, f, pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, manifest_path(index_dir))
+
+
+@contextmanager
+def manifest_lock(index_dir=INDEX_DIR):
+    """ Serializes changes of the manifest between threads, and processes where supported. """
+    with _manifest_lock:
+        with open(os.path.join(index_dir, LOCK_FILE), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield  # The lock is released when the file is closed.
+
+
+def index_exists(index_dir=INDEX_DIR):
+    """ Checks whether an index has been built in `index_dir`. """
+    return os.path.exists(manifest_path(index_dir)) or os.path.exists(
+        os.path.join(index_dir, LEXICON_FILE)
+    )
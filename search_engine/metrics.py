@@ -0,0 +1,194 @@
+"""
+*Metrics*
+
+Instrumentation of the search hot path.
+
+    * stage(name) times a stage of a search into a histogram. The stages are
+      normalize, lookup (reading postings), score, merge (boolean operators) and
+      metadata (reading the document store). Autocompletion requests are timed as
+      the suggest stage, batch searches (as a whole) as the batch stage.
+    * count(name, n) adds to a counter, e.g. the number of postings read.
+    * render() returns all metrics in the Prometheus text format.
+    * Between start_breakdown() and end_breakdown() the stages of the current
+      thread are also summed per request, for debugging a single query.
+
+With METRICS_ENABLED off, stage() and count() do nothing unless a breakdown is
+being recorded. Metrics are kept per process.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from .settings import METRICS_ENABLED
+
+# Upper bounds (in seconds) of the histogram buckets.
+BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+STAGES = (
+    "normalize",
+    "lookup",
+    "score",
+    "merge",
+    "metadata",
+    "request",
+    "suggest",
+    "batch",
+)
+
+# (key of ResultCache.stats(), metric type) exported for every result cache.
+RESULT_CACHE_METRICS = (
+    ("hits", "counter"),
+    ("misses", "counter"),
+    ("entries", "gauge"),
+    ("bytes", "gauge"),
+)
+
+enabled = METRICS_ENABLED
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class Histogram:
+    """ Counts of observed durations per bucket, with their sum. """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # The last bucket is +Inf.
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+
+histograms = {name: Histogram() for name in STAGES}
+counters = {}
+
+
+class _Stage:
+    """ Context manager timing a stage. """
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        observe(self.name, time.perf_counter() - self.start)
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name):
+    """ Returns a context manager timing the stage `name` (one of STAGES). """
+    if enabled or getattr(_local, "breakdown", None) is not None:
+        return _Stage(name)
+    return _NO_STAGE
+
+
+def observe(name, seconds):
+    """ Records `seconds` spent in the stage `name`. """
+    if enabled:
+        with _lock:
+            histograms[name].observe(seconds)
+    breakdown = getattr(_local, "breakdown", None)
+    if breakdown is not None:
+        stages = breakdown["stages"]
+        stages[name] = stages.get(name, 0.0) + seconds
+
+
+def count(name, n=1):
+    """ Adds `n` to the counter `name`. """
+    if enabled:
+        with _lock:
+            counters[name] = counters.get(name, 0) + n
+    breakdown = getattr(_local, "breakdown", None)
+    if breakdown is not None:
+        breakdown["counts"][name] = breakdown["counts"].get(name, 0) + n
+
+
+def start_breakdown():
+    """ Starts recording the stages and counters of the current thread. """
+    _local.breakdown = {"stages": {}, "counts": {}}
+
+
+def end_breakdown():
+    """
+    Stops recording, returns {"stages": {stage: seconds}, "counts": {counter: n}}
+    recorded since start_breakdown().
+    """
+    breakdown = getattr(_local, "breakdown", None)
+    _local.breakdown = None
+    return breakdown
+
+
+def _format(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(result_caches=None):
+    """
+    Returns the metrics in the Prometheus text exposition format. `result_caches`
+    maps names to caches with a stats() method (see ResultCache), their hits, misses
+    and size are exported too.
+    """
+    lines = [
+        "# HELP meklet_stage_seconds Time spent in each stage of a search.",
+        "# TYPE meklet_stage_seconds histogram",
+    ]
+    with _lock:
+        snapshot = {name: (list(h.counts), h.sum) for name, h in histograms.items()}
+        counter_values = dict(counters)
+    for name, (counts, total) in snapshot.items():
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS + ("+Inf",), counts):
+            cumulative += bucket_count
+            labels = f'stage="{name}",le="{bound}"'
+            lines.append(f"meklet_stage_seconds_bucket{{{labels}}} {cumulative}")
+        lines.append(f'meklet_stage_seconds_sum{{stage="{name}"}} {_format(total)}')
+        lines.append(f'meklet_stage_seconds_count{{stage="{name}"}} {cumulative}')
+
+    for name, value in sorted(counter_values.items()):
+        lines.append(f"# TYPE meklet_{name}_total counter")
+        lines.append(f"meklet_{name}_total {value}")
+
+    if result_caches:
+        stats = {name: cache.stats() for name, cache in result_caches.items()}
+        for key, kind in RESULT_CACHE_METRICS:
+            metric = f"meklet_result_cache_{key}" + (
+                "_total" if kind == "counter" else ""
+            )
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, cache_stats in stats.items():
+                if cache_stats.get(key) is not None:
+                    lines.append(f'{metric}{{cache="{name}"}} {cache_stats[key]}')
+    return "\n".join(lines) + "\n"
@@ -1,15 +1,60 @@
-from nltk.stem import PorterStemmer
-from nltk.tokenize import sent_tokenize, word_tokenize
-from nltk.corpus import stopwords
-import nltk
+from collections import Counter
+from functools import lru_cache
+import re
+import threading
+from .settings import STEM_CACHE_SIZE
+from . import metrics
 
+# NLTK is imported on first use, it takes longer to import than the rest of the
+# package and processes that never normalize text (scatter-gather workers, the
+# segments command line) do not need it.
 
-def download_nltk_deps():
+
+def missing_nltk_deps():
+    """
+    Returns the NLTK packages needed by the normalizer that are not installed, looking
+    only at the local NLTK data directories.
+    """
+    from nltk.corpus import stopwords
+    from nltk.tokenize import word_tokenize
+
+    missing = []
+    try:
+        word_tokenize("a")
+    except LookupError:
+        # The tokenizer models are punkt_tab from NLTK 3.8.2 on, punkt before.
+        missing += ["punkt", "punkt_tab"]
+    try:
+        stopwords.words("english")
+    except LookupError:
+        missing.append("stopwords")
+    return missing
+
+
+def download_nltk_deps(offline=False):
     """
-    Downloads NLTK English language datasets. This function needs to be called only once in a lifetime.
+    Downloads the NLTK English language datasets that are not installed yet, nothing
+    is downloaded when they all are. With `offline`, missing datasets raise an
+    exception instead of being downloaded.
     """
-    nltk.download("punkt")
-    nltk.download("stopwords")
+    missing = missing_nltk_deps()
+    if missing and offline:
+        raise Exception(
+            "Error- NLTK data not found: "
+            + ", ".join(missing)
+            + ". Install it with python -m nltk.downloader "
+            + " ".join(missing)
+        )
+    if missing:
+        import nltk
+
+        for package in missing:
+            nltk.download(package, quiet=True)
+        missing = missing_nltk_deps()
+        if missing:
+            raise Exception(
+                "Error- Could not download NLTK data: " + ", ".join(missing)
+            )
 
 
 def tokenize(text):
@@ -18,6 +63,8 @@ def tokenize(text):
     representing the tokenized version of `text`, excluding punctuation
     like comma, question mark, whitespace, etc.
     """
+    from nltk.tokenize import word_tokenize
+
     assert type(text) == str
     tokenized_words = word_tokenize(text.lower())
 
@@ -30,11 +77,101 @@ def tokenize(text):
 # print(tokenize("was it raining yesterday night or i have been gaming! It can't be true?"))
 
 
+# Characters dropped from wildcard patterns.
+WILDCARD_CHARACTERS = re.compile(r"[^\w*]")
+
+
+class Normalizer:
+    """
+    Reusable normalization pipeline (tokenization, removal of stopwords and stemming).
+
+    The stopwords and the stemmer are loaded once, and the stems of the last
+    `cache_size` distinct words are memoized. A Normalizer can be shared between threads.
+    """
+
+    def __init__(self, cache_size=STEM_CACHE_SIZE):
+        from nltk.corpus import stopwords
+        from nltk.stem import PorterStemmer
+        from nltk.tokenize import word_tokenize
+
+        self.word_tokenize = word_tokenize
+        self.stop_words = frozenset(stopwords.words("english"))
+        self.stemmer = PorterStemmer()
+        self.stem_word = lru_cache(maxsize=cache_size)(self.stemmer.stem)
+
+    def normalize(self, text, wildcards=False):
+        """
+        Given a string, returns the list of its normalized terms, same as process_string().
+        [""] is returned when no term is left. With `wildcards`, words holding a "*" are
+        kept as lowercase patterns instead of being stemmed (see suggest.py).
+        """
+        if wildcards and "*" in text:
+            terms = []
+            for word in text.split():
+                if "*" in word:
+                    pattern = WILDCARD_CHARACTERS.sub("", word.lower())
+                    if pattern.strip("*"):
+                        terms.append(pattern)
+                else:
+                    terms.extend(term for term in self.normalize(word) if term)
+            return terms or [""]
+        stem_word = self.stem_word
+        stop_words = self.stop_words
+        terms = [
+            stem_word(word)
+            for word in self.word_tokenize(text.strip().lower())
+            if len(word) > 1 and word not in stop_words
+        ]
+        return terms or [""]
+
+    def normalize_many(self, texts, forms=None):
+        """
+        Given a list of strings, returns the list of normalized terms of each, like
+        normalize(). Every text is tokenized once, and every distinct word of the
+        batch is filtered and stemmed once. The words kept are counted in the `forms`
+        Counter, if given.
+        """
+        word_tokenize = self.word_tokenize
+        token_lists = [word_tokenize(text.strip().lower()) for text in texts]
+        stem_word = self.stem_word
+        stop_words = self.stop_words
+        # Maps every distinct word of the batch to its stem, None if it is dropped.
+        stems = {
+            word: stem_word(word) if len(word) > 1 and word not in stop_words else None
+            for word in set().union(*token_lists)
+        }
+        if forms is not None:
+            counts = Counter()
+            for tokens in token_lists:
+                counts.update(tokens)
+            for word, count in counts.items():
+                if stems[word] is not None:
+                    forms[word] += count
+        get_stem = stems.__getitem__
+        return [
+            [stem for stem in map(get_stem, tokens) if stem is not None] or [""]
+            for tokens in token_lists
+        ]
+
+
+_default_normalizer = None
+_default_normalizer_lock = threading.Lock()
+
+
+def get_normalizer():
+    """ Returns the process wide Normalizer, created on first use (after the NLTK data is downloaded). """
+    global _default_normalizer
+    with _default_normalizer_lock:
+        if _default_normalizer is None:
+            _default_normalizer = Normalizer()
+        return _default_normalizer
+
+
 def remove_stopwords(token_list):
     """
     Given a list of english words, removes stopwords from it ( such as he her was etc.).
     """
-    stop_words = set(stopwords.words("english"))
+    stop_words = get_normalizer().stop_words
     filtered_tokens = [w for w in token_list if not w in stop_words]
     return filtered_tokens
 
@@ -50,8 +187,8 @@ def stem(token_list):
     """
 
     assert type(token_list) == list
-    ps = PorterStemmer()
-    stemmed_words = list(map(lambda word: ps.stem(word), token_list))
+    stem_word = get_normalizer().stem_word
+    stemmed_words = list(map(stem_word, token_list))
     result = " ".join(map(str, stemmed_words))
     return result
 
@@ -60,6 +197,22 @@ def stem(token_list):
 # print(stem(tokenize("was it raining yesterday night OR i have been gaming! It can't be true?")))
 
 
+class SubQuery(list):
+    """
+    Normalized terms of a quoted sub-query of a boolean query. When the index has term
+    positions, the terms must appear in order with at most `slop` other terms between
+    consecutive ones (0 for an exact phrase). `"harry potter"~2` has a slop of 2.
+    """
+
+    def __init__(self, terms, slop=0):
+        super().__init__(terms)
+        self.slop = slop
+
+
+# Proximity written right after the closing quote of a sub-query.
+SLOP = re.compile(r"~(\d+)")
+
+
 def process_boolean_query(query):
     """
     Given a boolean search query as a string, splits it into individual queries and operators.
@@ -70,23 +223,28 @@ def process_boolean_query(query):
 
     Note: If the first operator is empty (`''`), it means the first sub-query does not have any operactor for itself.
 
+    Queries are SubQuery lists, a proximity like `"harry potter"~3` is saved as their slop.
+
     Queries are intended to be processed in LTR direction.
     """
     assert type(query) == str
     query = query.strip()
-    in_query = False
     pieces = query.split('"')
-    queries = []
     operators = []
 
-    for item in pieces:
-        disposable = item.strip()
-        if in_query:
-            disposable = process_string(disposable)
-            queries.append(disposable)
-        else:
-            operators.append(disposable)
-        in_query = not in_query
+    with metrics.stage("normalize"):
+        queries = [
+            SubQuery(terms) for terms in get_normalizer().normalize_many(pieces[1::2])
+        ]
+
+    # Sub-queries are at odd positions, operators in between.
+    for no, item in enumerate(pieces[::2]):
+        item = item.strip()
+        slop = SLOP.match(item)
+        if slop and no > 0:
+            queries[no - 1].slop = int(slop.group(1))
+            item = item[slop.end() :].strip()
+        operators.append(item)
     operators.pop()
     return queries, operators
 
@@ -101,14 +259,11 @@ def process_boolean_query(query):
 def process_string(query):
     """
     Given a query string, performs stemming, normalization, tokenization and removal of stopwords and returns
-    a list.
+    a list. Wildcard words like "pott*" are kept as patterns, see expand_wildcards().
     """
     assert type(query) == str
-    disposable = query.strip()
-    disposable = tokenize(disposable)
-    disposable = remove_stopwords(disposable)
-    disposable = stem(disposable)
-    return disposable.split(" ")
+    with metrics.stage("normalize"):
+        return get_normalizer().normalize(query, wildcards=True)
 
 
 # Uncomment below to test process_string
@@ -0,0 +1,48 @@
+"""
+*Ranked Lists*
+
+Cached results of paginated searches -
+
+    * A RankedList holds the best `depth` (docId, score) pairs of a query, deeper than
+      a page, so that the next pages are served without scoring the query again.
+    * DocIds and scores are kept in arrays, a result takes 16 bytes in memory (about
+      100 as a tuple of Python objects) and as many pickled in the result cache.
+    * A list that needs to be deeper for a page is replaced by one RANKED_LIST_GROWTH
+      times as deep (at least as deep as the page), up to MAX_RESULTS results.
+"""
+
+from array import array
+from .settings import RANKED_LIST_DEPTH, RANKED_LIST_GROWTH, MAX_RESULTS
+
+
+class RankedList:
+    """ The best `depth` results of a query, sorted by decreasing score. """
+
+    def __init__(self, results, depth):
+        self.docIds = array("q", [docId for docId, _ in results])
+        self.scores = array("d", [score for _, score in results])
+        self.depth = depth
+
+    def __len__(self):
+        return len(self.docIds)
+
+    def covers(self, stop):
+        """ Checks whether the results up to `stop` are all in the list. """
+        # A list shorter than its depth holds all results of the query.
+        return stop <= self.depth or len(self.docIds) < self.depth
+
+    def page(self, offset, limit):
+        """ Returns the (docId, score) pairs of the page starting at `offset`. """
+        stop = offset + limit
+        return list(zip(self.docIds[offset:stop], self.scores[offset:stop]))
+
+
+def list_depth(stop, ranked_list=None):
+    """
+    Returns the depth of the ranked list to compute for the results up to `stop`,
+    given the cached `ranked_list` of the query that is not deep enough, if any.
+    """
+    depth = max(stop, RANKED_LIST_DEPTH)
+    if ranked_list is not None:
+        depth = max(depth, ranked_list.depth * RANKED_LIST_GROWTH)
+    return min(depth, max(stop, MAX_RESULTS))
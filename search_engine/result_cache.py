@@ -0,0 +1,201 @@
+"""
+*Result Cache*
+
+Cache of query results shared by all processes serving the index, stored in a SQLite
+database next to the index (index_files/results.db).
+
+    * Keys are (index version, query) pairs, the version of an index being its
+      (build, generation) (see IndexSnapshot). Entries of older versions are dropped
+      when a result of a newer one is saved, so rebuilds and updates of the index
+      invalidate the cache by themselves, also when a rebuild restarts the generation.
+    * The cache holds at most `max_entries` results and `max_bytes` bytes of pickled
+      results, least recently used ones are evicted first.
+    * Results older than `ttl` seconds are not served.
+    * Hits only write down the time of use of an entry once it is older than
+      USE_REFRESH of the ttl, so most hits are read only.
+
+ResultCache has the interface of helper.LRUCache (get() returns -1 on a miss), so the
+app can use either.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from .index_file import INDEX_DIR
+from .settings import RESULT_CACHE_ENTRIES, RESULT_CACHE_BYTES, RESULT_CACHE_TTL
+
+RESULT_CACHE_FILE = "results.db"
+
+# Fraction of the ttl after which a hit updates the time of use of an entry.
+USE_REFRESH = 1 / 16
+
+# Increased on changes of the schema, databases of older versions are emptied.
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    build REAL NOT NULL,
+    generation INTEGER NOT NULL,
+    query TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    used REAL NOT NULL,
+    PRIMARY KEY (build, generation, query)
+);
+CREATE INDEX IF NOT EXISTS results_used ON results (used);
+"""
+
+
+class ResultCache:
+    """
+    LRU cache of query results in a SQLite database, safe to share between threads and
+    processes. `namespace` separates the results of different kinds of queries saved
+    in the same database.
+    """
+
+    def __init__(
+        self,
+        namespace="",
+        path=os.path.join(INDEX_DIR, RESULT_CACHE_FILE),
+        max_entries=RESULT_CACHE_ENTRIES,
+        max_bytes=RESULT_CACHE_BYTES,
+        ttl=RESULT_CACHE_TTL,
+    ):
+        self.namespace = namespace
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()  # Guards the counters.
+        self.local = threading.local()
+
+    def _connection(self):
+        """ Returns the connection of the current thread, opened after any fork. """
+        connection = getattr(self.local, "connection", None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            # A lost entry is only a miss, so durability is not needed.
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            if (
+                connection.execute("PRAGMA user_version").fetchone()[0]
+                != SCHEMA_VERSION
+            ):
+                connection.executescript(
+                    f"DROP TABLE IF EXISTS results; PRAGMA user_version = {SCHEMA_VERSION};"
+                )
+            connection.executescript(SCHEMA)
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+
+    def _split(self, key):
+        (build, generation), query = key
+        return (
+            0 if build is None else build,
+            -1 if generation is None else generation,
+            self.namespace + "\0" + query,
+        )
+
+    def _count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        """
+        Returns the result saved for the (version, query) `key`, -1 if there is none
+        or it is older than the ttl.
+        """
+        build, generation, query = self._split(key)
+        now = time.time()
+        try:
+            connection = self._connection()
+            row = connection.execute(
+                "SELECT value, used FROM results"
+                " WHERE build = ? AND generation = ? AND query = ? AND created >= ?",
+                (build, generation, query, now - self.ttl),
+            ).fetchone()
+            if row is not None and row[1] < now - self.ttl * USE_REFRESH:
+                connection.execute(
+                    "UPDATE results SET used = ? WHERE build = ? AND generation = ? AND query = ?",
+                    (now, build, generation, query),
+                )
+        except sqlite3.Error:
+            row = None  # Busy or unavailable, the query is evaluated instead.
+        self._count(row is not None)
+        if row is None:
+            return -1
+        return pickle.loads(row[0])
+
+    def put(self, key, value):
+        """ Saves the result of the (version, query) `key`, evicting entries over the bounds. """
+        build, generation, query = self._split(key)
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        try:
+            connection = self._connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (build, generation, query, value, len(value), now, now),
+            )
+            connection.execute(
+                "DELETE FROM results"
+                " WHERE build < ? OR (build = ? AND generation < ?) OR created < ?",
+                (build, build, generation, now - self.ttl),
+            )
+            self._evict(connection)
+        except sqlite3.Error:
+            pass
+
+    def _evict(self, connection):
+        """ Removes least recently used entries until the cache is within its bounds. """
+        entries, size = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+        if entries <= self.max_entries and size <= self.max_bytes:
+            return
+        evicted = []
+        for used, entry_size in connection.execute(
+            "SELECT used, size FROM results ORDER BY used"
+        ):
+            if entries <= self.max_entries and size <= self.max_bytes:
+                break
+            evicted.append(used)
+            entries -= 1
+            size -= entry_size
+        connection.execute("DELETE FROM results WHERE used <= ?", (evicted[-1],))
+
+    def clear(self):
+        """ Removes all results. """
+        try:
+            self._connection().execute("DELETE FROM results")
+        except sqlite3.Error:
+            pass
+
+    def stats(self):
+        """
+        Returns the hits and misses of this process, and the number of entries and
+        bytes in the database (of all namespaces).
+        """
+        try:
+            entries, size = (
+                self._connection()
+                .execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results")
+                .fetchone()
+            )
+        except sqlite3.Error:
+            entries, size = None, None
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "bytes": size,
+        }
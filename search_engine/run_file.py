@@ -0,0 +1,209 @@
+"""
+*Intermediate Run Files*
+
+    * Runs are sorted streams of (term, docId, freq) postings written by the indexer,
+      or (term, docId, freq, positions) postings when term positions are indexed.
+    * Postings are stored in blocks, so that each block is read and written with
+      a handful of calls instead of one pickle call per posting.
+    * Blocks are optionally compressed with zlib.
+
+Block layout (little endian):
+
+    <flags> <no. of distinct terms> <no. of postings> <length of term bytes>
+    <length of payload>                                   (uint8 + 4 x uint32)
+
+followed by the payload (zlib compressed if flags & COMPRESSED):
+
+    <distinct terms joined by "\\n", utf-8>
+    <postings per term>                                   (uint32 array)
+    <docIds>                                              (uint32 array)
+    <frequencies>                                         (uint32 array)
+    <positions of every posting, if flags & POSITIONS>    (uint32 array)
+
+"""
+
+import struct
+import sys
+import zlib
+from array import array
+from itertools import chain, repeat
+
+from .settings import RUN_BLOCK_BYTES, COMPRESS_RUNS
+
+HEADER = struct.Struct("<BIIII")
+COMPRESSED = 1
+POSITIONS = 2
+
+# Blocks are sized by the bytes of their numbers (4 per count, docId, frequency and
+# position) and, for every distinct term, by the memory of the term once decoded (a str
+# object and its slot in the list of terms), which exceeds its encoded size. A block
+# read back then takes at most about `block_bytes` in each of its raw, decompressed and
+# decoded forms (see RUN_READ_BYTES in index.py).
+POSTING_BYTES = 8
+POSITION_BYTES = 4
+TERM_SLOT_BYTES = 8 + 4  # Slot in the list of terms, and the count of postings.
+
+
+def decoded_term_bytes(term):
+    """ Returns the bytes counted for a distinct term of a block. """
+    return sys.getsizeof(term) + TERM_SLOT_BYTES
+
+
+def _to_bytes(values):
+    """ Returns the little endian uint32 representation of `values`. """
+    if isinstance(values, array) and sys.byteorder == "little":
+        return values.tobytes()
+    arr = array("I", values)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _from_bytes(data):
+    arr = array("I")
+    arr.frombytes(data)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+
+def encode_block(terms, counts, docIds, freqs, positions=None, compress=False):
+    """
+    Encodes a block of postings given as columns: the distinct terms in order, the
+    number of postings of each, and the docIds, frequencies and (if indexed) the
+    concatenated positions of the postings.
+    """
+    term_bytes = "\n".join(terms).encode("utf-8")
+    payload = b"".join(
+        [term_bytes, _to_bytes(counts), _to_bytes(docIds), _to_bytes(freqs)]
+    )
+    flags = 0
+    if positions is not None:
+        payload += _to_bytes(positions)
+        flags |= POSITIONS
+    if compress:
+        payload = zlib.compress(payload, 1)
+        flags |= COMPRESSED
+    header = HEADER.pack(flags, len(terms), len(docIds), len(term_bytes), len(payload))
+    return header + payload
+
+
+class RunWriter:
+    """
+    Buffers sorted postings and writes them to a run file in blocks of about
+    `block_bytes` bytes, counted as described above. Postings are buffered as columns
+    of uint32 arrays, so the buffer takes about as much memory as it counts.
+    """
+
+    def __init__(self, filename, block_bytes=RUN_BLOCK_BYTES, compress=COMPRESS_RUNS):
+        self.file = open(filename, "wb")
+        self.block_bytes = block_bytes
+        self.compress = compress
+        self._new_block()
+
+    def _new_block(self):
+        self.terms = []
+        self.counts = array("I")
+        self.docIds = array("I")
+        self.freqs = array("I")
+        self.positions = None  # array("I") once postings with positions are written.
+        self.buffer_bytes = 0
+
+    def write(self, postings):
+        """ Appends an iterable of sorted (term, docId, freq[, positions]) tuples to the run. """
+        for posting in postings:
+            term = posting[0]
+            if not self.terms or self.terms[-1] != term:
+                self.terms.append(term)
+                self.counts.append(1)
+                self.buffer_bytes += decoded_term_bytes(term) + POSTING_BYTES
+            else:
+                self.counts[-1] += 1
+                self.buffer_bytes += POSTING_BYTES
+            self.docIds.append(posting[1])
+            self.freqs.append(posting[2])
+            if len(posting) == 4:
+                if self.positions is None:
+                    self.positions = array("I")
+                self.positions.extend(posting[3])
+                self.buffer_bytes += POSITION_BYTES * len(posting[3])
+            if self.buffer_bytes >= self.block_bytes:
+                self.flush()
+
+    def flush(self):
+        if self.terms:
+            self.file.write(
+                encode_block(
+                    self.terms,
+                    self.counts,
+                    self.docIds,
+                    self.freqs,
+                    self.positions,
+                    self.compress,
+                )
+            )
+            self._new_block()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _split(positions, freqs):
+    """
+    Splits the concatenated positions of a block into the positions of each posting,
+    arrays like `positions` so that a decoded block stays as compact as its payload.
+    """
+    start = 0
+    for freq in freqs:
+        yield positions[start : start + freq]
+        start += freq
+
+
+def read_blocks(filename):
+    """
+    Yields the blocks of a run file as iterators of (term, docId, freq) tuples, or
+    (term, docId, freq, positions) tuples for runs with positions.
+    Only the current block is held in memory.
+    """
+    with open(filename, "rb") as run:
+        while True:
+            header = run.read(HEADER.size)
+            if not header:
+                break
+            flags, no_terms, no_postings, term_len, payload_len = HEADER.unpack(header)
+            payload = run.read(payload_len)
+            if flags & COMPRESSED:
+                payload = zlib.decompress(payload)
+            payload = memoryview(payload)
+            counts_end = term_len + 4 * no_terms
+            docIds_end = counts_end + 4 * no_postings
+            freqs_end = docIds_end + 4 * no_postings
+            terms = str(payload[:term_len], "utf-8").split("\n")
+            counts = _from_bytes(payload[term_len:counts_end])
+            docIds = _from_bytes(payload[counts_end:docIds_end])
+            freqs = _from_bytes(payload[docIds_end:freqs_end])
+            expanded_terms = chain.from_iterable(map(repeat, terms, counts))
+            if flags & POSITIONS:
+                positions = _split(_from_bytes(payload[freqs_end:]), freqs)
+                yield zip(expanded_terms, docIds, freqs, positions)
+            else:
+                yield zip(expanded_terms, docIds, freqs)
+
+
+def read_run(filename):
+    """ Yields the postings of a run file, reading one block at a time. """
+    for block in read_blocks(filename):
+        yield from block
+
+
+def write_run(filename, postings):
+    """ Writes sorted (term, docId, freq[, positions]) tuples to a new run file. """
+    with RunWriter(filename) as writer:
+        writer.write(postings)
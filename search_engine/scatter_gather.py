@@ -0,0 +1,153 @@
+"""
+*Scatter-Gather Queries*
+
+Evaluates regular queries over the shards (and other segments) of the index in
+parallel, in a pool of worker processes.
+
+    * The idf of every query term is computed over the whole index by the calling
+      process (global idf), so scores do not depend on how documents are partitioned.
+    * Every worker returns the top k documents of a segment, scored like
+      top_k_documents(). The best k of all segments are the best k of the index.
+    * Workers memory map the index themselves, tasks only carry the query and its idfs.
+    * Queries reading fewer than SCATTER_MIN_POSTINGS postings, or over an index of a
+      single segment, are evaluated in the calling process, where they are cheaper
+      than a round trip to the workers.
+"""
+
+import heapq
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from math import log10
+from .index_lookup import IndexReader
+from .index_file import INDEX_DIR
+from .top_k import top_k_documents
+from . import champions
+from .weighting import LOG_WEIGHTS
+from .settings import QUERY_WORKERS, SCATTER_MIN_POSTINGS
+from . import vector_scoring
+from . import metrics
+
+_worker_reader = None  # IndexReader of a worker process.
+
+
+def _result_order(result):
+    """ Sort key of (docId, score) results, by decreasing score then lower docId. """
+    return -result[1], result[0]
+
+
+def segment_top_k(index, query, idfs, deleted=(), k=10):
+    """
+    Returns the k (docId, tf-idf weight) pairs with highest weight among the documents
+    of one segment (an IndexFile) that are not `deleted`, with the given idfs.
+    """
+    if vector_scoring.available():
+        scores = vector_scoring.segment_scores(index, query, idfs, deleted)
+        return vector_scoring.top_k(scores, k)
+    scores = {}
+    for term, idf in zip(query, idfs):
+        ordinal = index.find(term)
+        if ordinal == -1:
+            continue
+        deltas, freqs = index.postings(ordinal)
+        docId = 0
+        for delta, freq in zip(deltas, freqs):
+            docId += delta
+            if docId in deleted:
+                continue
+            if freq < len(LOG_WEIGHTS):
+                weight = LOG_WEIGHTS[freq] * idf
+            else:
+                weight = (1 + log10(freq)) * idf
+            scores[docId] = scores.get(docId, 0.0) + weight
+    return heapq.nsmallest(k, scores.items(), key=_result_order)
+
+
+def _open_reader(index_dir):
+    global _worker_reader
+    _worker_reader = IndexReader(index_dir, cache_size=0)
+
+
+def _search_segment(version, path, query, idfs, k):
+    """ Task of a worker, None if its index is not at `version` (see IndexSnapshot). """
+    _worker_reader.refresh()
+    snapshot = _worker_reader.snapshot
+    if snapshot.version != version:
+        return None
+    index = snapshot.segments[snapshot.paths.index(path)]
+    return segment_top_k(index, query, idfs, snapshot.deleted, k)
+
+
+class ShardPool:
+    """
+    Pool of `workers` processes evaluating regular queries over the segments of the
+    index in `index_dir`. The processes are started on first use, so a pool can be
+    created before the server forks.
+    """
+
+    def __init__(
+        self,
+        workers=QUERY_WORKERS,
+        index_dir=INDEX_DIR,
+        min_postings=SCATTER_MIN_POSTINGS,
+    ):
+        self.workers = workers
+        self.index_dir = index_dir
+        self.min_postings = min_postings
+        self.executor = None
+
+    def _executor(self):
+        if self.executor is None:
+            # Workers are spawned, forking a threaded server is not safe.
+            self.executor = ProcessPoolExecutor(
+                self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_open_reader,
+                initargs=(self.index_dir,),
+            )
+        return self.executor
+
+    def top_k(self, query, reader, k=10):
+        """
+        Takes in a query (a list of words that is obtained after normalization) and
+        returns the k (docId, tf-idf weight) pairs with highest weight, like
+        top_k_documents(), evaluating every segment of `reader` in a worker.
+        """
+        snapshot = reader.snapshot
+        if self.workers < 2 or len(snapshot.segments) < 2:
+            return top_k_documents(query, reader, k)
+
+        # Segments holding postings of the query, with their number of postings.
+        postings = {}
+        for path, index in zip(snapshot.paths, snapshot.segments):
+            for term in query:
+                ordinal = index.find(term)
+                if ordinal != -1:
+                    document_frequency = index.document_frequencies[ordinal]
+                    postings[path] = postings.get(path, 0) + document_frequency
+        if sum(postings.values()) < self.min_postings:
+            return top_k_documents(query, reader, k)
+        results = champions.top_k(query, reader, k)
+        if results is not None:
+            return results
+
+        idfs = [reader.idf(term) for term in query]
+        executor = self._executor()
+        futures = [
+            executor.submit(_search_segment, snapshot.version, path, query, idfs, k)
+            for path in postings
+        ]
+        results = [future.result() for future in futures]
+        if any(result is None for result in results):
+            # Workers already opened a newer index, or not yet.
+            return top_k_documents(query, reader, k)
+        metrics.count("postings", sum(postings.values()))
+        with metrics.stage("merge"):
+            merged = (
+                result for segment_results in results for result in segment_results
+            )
+            return heapq.nsmallest(k, merged, key=_result_order)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
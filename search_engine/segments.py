@@ -0,0 +1,404 @@
+"""
+*Incremental Indexing*
+
+    * update_index() indexes the documents added to the corpus since the last update
+      into a new, small segment and marks removed documents with tombstones. It costs
+      time proportional to the number of changed documents.
+    * compact_segments() merges segments into one, dropping the postings of deleted
+      documents, so that queries do not slow down as segments pile up.
+    * Compactor runs compactions in a background thread of the server.
+
+Queries search all segments of the manifest (see manifest.py and IndexReader), and
+python -m search_engine.update runs updates and compactions from the command line.
+"""
+
+import heapq
+import os
+import pickle
+import shutil
+import threading
+from itertools import accumulate
+from .index import parse_docs, merge_indices, construct_index
+from .index_file import (
+    IndexFile,
+    IndexWriter,
+    write_stats,
+    INDEX_DIR,
+    LEXICON_FILE,
+    POSTINGS_FILE,
+    STATS_FILE,
+    POSITIONS_FILE,
+    CHAMPIONS_FILE,
+)
+from .doc_store import DocStore, DocStoreWriter, DOC_STORE_FILE
+from .corpus import open_corpus
+from .suggest import write_completions, merge_forms, COMPLETIONS_FILE
+from .manifest import (
+    load_manifest,
+    save_manifest,
+    new_manifest,
+    manifest_lock,
+    SEGMENTS_DIR,
+)
+from .weighting import inverse_document_frequency
+from .settings import (
+    MAX_SEGMENTS,
+    MAX_DELETED_RATIO,
+    COMPACTION_INTERVAL,
+    CHAMPION_LIST_SIZE,
+    CHAMPION_MIN_POSTINGS,
+)
+
+# A run of newer segments is merged with the next older segment while the older
+# segment holds at most MERGE_FACTOR times as many documents as the run.
+MERGE_FACTOR = 2
+
+
+def _current_manifest():
+    """ Returns the manifest, creating it for an index built before segments existed. """
+    manifest = load_manifest()
+    if manifest is None:
+        with open("./index_files/docId.pkl", "rb") as f:
+            id_dict = pickle.load(f)
+        manifest = new_manifest(max(id_dict, default=0))
+    return manifest
+
+
+def _save_id_dict(id_dict):
+    with open("./index_files/docId.pkl.tmp", "wb") as f:
+        pickle.dump(id_dict, f, pickle.HIGHEST_PROTOCOL)
+    os.replace("./index_files/docId.pkl.tmp", "./index_files/docId.pkl")
+
+
+def update_index(added=None, removed=None):
+    """
+    Updates the index with the documents (names in the corpus) added to and
+    removed from the corpus. A modified document is given in both lists.
+
+    When neither is given, the changes are found by comparing the corpus (see
+    corpus.py) with docId.pkl. New segments store term positions if the index
+    does, whatever STORE_POSITIONS is, so that queries keep their meaning.
+
+    Returns the number of (added, removed) documents.
+    """
+    with manifest_lock():
+        manifest = _current_manifest()
+        with open("./index_files/docId.pkl", "rb") as f:
+            id_dict = pickle.load(f)
+        name_to_id = {name: docId for docId, name in id_dict.items()}
+        corpus = open_corpus()
+        if added is None and removed is None:
+            names = corpus.names()
+            added = [name for name in names if name not in name_to_id]
+            removed = sorted(set(name_to_id).difference(names))
+        else:
+            added = corpus.sort(added or [])
+        removed = [name for name in removed or [] if name in name_to_id]
+        if not added and not removed:
+            return 0, 0
+
+        for name in removed:
+            docId = name_to_id.pop(name)
+            del id_dict[docId]
+            manifest["deleted"].add(docId)
+
+        if added:
+            first_docId = manifest["next_docId"]
+            id_items = list(enumerate(added, first_docId))
+            path = os.path.join(SEGMENTS_DIR, str(manifest["next_segment"]))
+            segment_dir = os.path.join(INDEX_DIR, path)
+            os.makedirs(segment_dir, exist_ok=True)
+            first_segment = os.path.join(INDEX_DIR, manifest["segments"][0]["path"])
+            store_positions = IndexFile(first_segment).has_positions
+            print(f"Indexing {len(added)} documents in segment {path}")
+            parse_docs(
+                workers=1,
+                index_dir=segment_dir,
+                id_items=id_items,
+                store_positions=store_positions,
+                corpus=corpus,
+            )
+            merge_indices(segment_dir)
+            construct_index(segment_dir, len(id_items), store_positions)
+            id_dict.update(id_items)
+            manifest["segments"].append(
+                {
+                    "path": path,
+                    "docIds": range(first_docId, first_docId + len(id_items)),
+                    "no_docs": len(id_items),
+                }
+            )
+            manifest["next_docId"] += len(id_items)
+            manifest["next_segment"] += 1
+
+        _save_id_dict(id_dict)
+        manifest["generation"] += 1
+        save_manifest(manifest)
+    return len(added), len(removed)
+
+
+def merge_segments(segments, deleted, segment_dir):
+    """
+    Merges the given segments (in docId order) into a new segment in `segment_dir`,
+    leaving out the postings of the `deleted` docIds.
+
+    Deleted documents keep an empty record in the document store, so that it
+    covers a contiguous range of docIds. Positions are kept if all segments have them.
+
+    Returns the number of documents indexed in the new segment.
+    """
+    indices = [
+        IndexFile(os.path.join(INDEX_DIR, segment["path"])) for segment in segments
+    ]
+    no_docs = sum(_segment_sizes(segments, deleted))
+    store_positions = all(index.has_positions for index in indices)
+
+    # k-way merge of the sorted term dictionaries.
+    def terms(segment_no):
+        index = indices[segment_no]
+        for ordinal in range(index.no_terms):
+            yield index.term(ordinal), segment_no, ordinal
+
+    merged = heapq.merge(*(terms(segment_no) for segment_no in range(len(indices))))
+    with IndexWriter(
+        segment_dir, store_positions, CHAMPION_LIST_SIZE, CHAMPION_MIN_POSTINGS
+    ) as index_obj:
+        curr_term = None
+        docIds = []
+        freqs = []
+        positions = []
+        for term, segment_no, ordinal in merged:
+            if term != curr_term:
+                if docIds:
+                    index_obj.add(curr_term, docIds, freqs, positions)
+                curr_term = term
+                docIds = []
+                freqs = []
+                positions = []
+            index = indices[segment_no]
+            deltas, segment_freqs = index.postings(ordinal)
+            if store_positions:
+                segment_positions = index.positions(ordinal)[1]
+            start = 0  # Index of the first position of the posting.
+            docId = 0
+            for delta, freq in zip(deltas, segment_freqs):
+                docId += delta
+                if docId not in deleted:
+                    docIds.append(docId)
+                    freqs.append(freq)
+                    if store_positions:
+                        positions.extend(
+                            accumulate(segment_positions[start : start + freq])
+                        )
+                start += freq
+        if docIds:
+            index_obj.add(curr_term, docIds, freqs, positions)
+    idfs = [
+        inverse_document_frequency(no_docs, document_frequency)
+        for document_frequency in index_obj.document_frequencies
+    ]
+    write_stats(
+        no_docs,
+        index_obj.document_frequencies,
+        index_obj.max_frequencies,
+        idfs,
+        segment_dir,
+    )
+    forms = merge_forms(
+        [os.path.join(INDEX_DIR, segment["path"]) for segment in segments]
+    )
+    write_completions(segment_dir, forms)
+
+    with DocStoreWriter(
+        os.path.join(segment_dir, DOC_STORE_FILE), segments[0]["docIds"].start
+    ) as writer:
+        for segment in segments:
+            store = DocStore(os.path.join(INDEX_DIR, segment["path"], DOC_STORE_FILE))
+            for docId in segment["docIds"]:
+                writer.add_record(b"" if docId in deleted else store.record(docId))
+            del store
+    return no_docs
+
+
+def _remove_segment(path):
+    if path == ".":
+        # The full build lives in index_files itself.
+        for filename in (
+            LEXICON_FILE,
+            POSTINGS_FILE,
+            STATS_FILE,
+            POSITIONS_FILE,
+            CHAMPIONS_FILE,
+            COMPLETIONS_FILE,
+            DOC_STORE_FILE,
+        ):
+            try:
+                os.remove(os.path.join(INDEX_DIR, filename))
+            except OSError:
+                pass  # Still open by a reader on this platform, or already removed.
+    else:
+        shutil.rmtree(os.path.join(INDEX_DIR, path), ignore_errors=True)
+
+
+def _segment_sizes(segments, deleted):
+    """ Returns the number of live documents of every segment. """
+    sizes = [segment["no_docs"] for segment in segments]
+    for docId in deleted:
+        for segment_no, segment in enumerate(segments):
+            if docId in segment["docIds"]:
+                sizes[segment_no] -= 1
+                break
+    return sizes
+
+
+def _merge_groups(manifest):
+    """
+    Returns the (start, stop) ranges of segments that can be merged together. Shards
+    are never merged with each other, newer segments are merged into the last shard.
+    """
+    last_shard = manifest.get("shards", 1) - 1
+    groups = [(shard, shard + 1) for shard in range(last_shard)]
+    return groups + [(last_shard, len(manifest["segments"]))]
+
+
+def _segments_to_merge(manifest, full=False):
+    """
+    Returns the (start, stop) range of segments that should be merged, None if no
+    compaction is needed.
+
+        * When too many documents of a group (see _merge_groups) are deleted, the
+          whole group is merged.
+        * Otherwise newer, smaller segments are merged once there are more than
+          MAX_SEGMENTS after the shards, so segment sizes grow geometrically and a
+          document is merged O(log(no. of documents)) times.
+        * With full=True, any group of several segments or with deleted documents.
+    """
+    segments = manifest["segments"]
+    sizes = _segment_sizes(segments, manifest["deleted"])
+    groups = _merge_groups(manifest)
+    for start, stop in groups:
+        total = sum(segment["no_docs"] for segment in segments[start:stop])
+        no_deleted = total - sum(sizes[start:stop])
+        if no_deleted > (0 if full else MAX_DELETED_RATIO * total):
+            return start, stop
+        if full and stop - start > 1:
+            return start, stop
+    if full:
+        return None
+    first = groups[-1][0]
+    if len(segments) - first <= MAX_SEGMENTS:
+        return None
+    start = len(segments) - 1
+    run_size = sizes[start]
+    while start > first and sizes[start - 1] <= MERGE_FACTOR * run_size:
+        start -= 1
+        run_size += sizes[start]
+    # Merge at least enough segments to get back to MAX_SEGMENTS.
+    return min(start, first + MAX_SEGMENTS - 1), len(segments)
+
+
+def compact_segments(full=False):
+    """
+    Merges segments of the index in the background of queries and updates, returns
+    True if segments were merged. With full=True all segments are merged into one
+    (one per shard), otherwise only when needed (see _segments_to_merge).
+    """
+    compacted = False
+    while _compact(full):
+        compacted = True
+        if not full:
+            break
+    return compacted
+
+
+def _merged_position(manifest, build, merged):
+    """
+    Returns the position of the `merged` segments in the manifest, None if another
+    compaction or a rebuild of the index (of another `build`) replaced them.
+    """
+    if manifest.get("build") != build or merged[0] not in manifest["segments"]:
+        return None
+    position = manifest["segments"].index(merged[0])
+    if manifest["segments"][position : position + len(merged)] != merged:
+        return None
+    return position
+
+
+def _compact(full):
+    """
+    Merges one range of segments, returns True if segments were merged. Documents
+    deleted while merging stay marked with tombstones. The merge is dropped if
+    another compaction (of another thread or process) merged the segments first.
+    """
+    with manifest_lock():
+        manifest = _current_manifest()
+        merge_range = _segments_to_merge(manifest, full)
+        if merge_range is None:
+            return False
+        merged = manifest["segments"][merge_range[0] : merge_range[1]]
+        deleted = set(manifest["deleted"])
+        build = manifest.get("build")
+        path = os.path.join(SEGMENTS_DIR, str(manifest["next_segment"]))
+        manifest["next_segment"] += 1
+        save_manifest(manifest)  # Reserve the segment number.
+
+    print(f"Merging {len(merged)} segments into {path}")
+    segment_dir = os.path.join(INDEX_DIR, path)
+    committed = False
+    try:
+        os.makedirs(segment_dir, exist_ok=True)
+        try:
+            no_docs = merge_segments(merged, deleted, segment_dir)
+        except Exception:
+            with manifest_lock():
+                if _merged_position(_current_manifest(), build, merged) is None:
+                    # The segments were removed by the compaction that won.
+                    print("Segments already merged")
+                    return False
+            raise
+        docIds = range(merged[0]["docIds"].start, merged[-1]["docIds"].stop)
+
+        with manifest_lock():
+            manifest = _current_manifest()
+            # Updates only append segments, only compactions replace them.
+            position = _merged_position(manifest, build, merged)
+            if position is None:
+                print("Segments already merged")
+                return False
+            manifest["segments"][position : position + len(merged)] = [
+                {"path": path, "docIds": docIds, "no_docs": no_docs}
+            ]
+            manifest["deleted"] = {
+                docId
+                for docId in manifest["deleted"]
+                if docId not in deleted or docId not in docIds
+            }
+            manifest["generation"] += 1
+            save_manifest(manifest)
+            committed = True
+    finally:
+        if not committed:
+            shutil.rmtree(segment_dir, ignore_errors=True)
+    for segment in merged:
+        _remove_segment(segment["path"])
+    print("Done merging segments")
+    return True
+
+
+class Compactor(threading.Thread):
+    """ Daemon thread compacting the index every COMPACTION_INTERVAL seconds when needed. """
+
+    def __init__(self, interval=COMPACTION_INTERVAL):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                compact_segments()
+            except Exception as e:
+                print("Error- Compaction failed:", e)
+
+    def stop(self):
+        self.stopped.set()
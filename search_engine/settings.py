@@ -1,5 +1,100 @@
 """ Constants for Index Construction and Match Scoring """
 
-# Block size= 200 records ~ 1 KB in development.
-# To be changed to a suitable value for production.
-BLOCK_SIZE = 10000000
+# Memory budget (in bytes) for index construction.
+# parse_docs spills its in-memory block to a run once the estimated size of the block
+# reaches the budget (split evenly between workers), and merge_indices limits the
+# number of runs merged in one pass so that their read buffers fit in it.
+INDEX_MEMORY_BUDGET = 512 * 1024 * 1024
+
+# Approximate size (in bytes) of a block of an intermediate run file. Runs are read
+# and written one block at a time.
+RUN_BLOCK_BYTES = 1024 * 1024
+
+# Compress the blocks of intermediate run files with zlib.
+# Trades CPU time for less temporary disk space and I/O.
+COMPRESS_RUNS = False
+
+# Save the position of every term occurrence in the index, needed by phrase and
+# proximity queries. This changes the meaning of advanced queries: without positions a
+# quoted sub-query like "harry potter" matches the documents containing any of its
+# terms, with positions only those containing them as a phrase (or with at most 2 terms
+# in between for "harry potter"~2). Positions also make the index larger.
+STORE_POSITIONS = False
+
+# Terms with more than CHAMPION_MIN_POSTINGS postings get a champion list, their (at
+# most) CHAMPION_LIST_SIZE postings of highest frequency, so that regular queries on
+# frequent terms mostly read those (see champions.py). 0 writes no champion lists.
+CHAMPION_LIST_SIZE = 1000
+CHAMPION_MIN_POSTINGS = 50000
+
+# Regular queries mixing terms of at least MAXSCORE_MIN_POSTINGS postings with terms of
+# higher score bounds are first evaluated without reading the postings of the former,
+# which are only probed for the documents of the others (see champions.py).
+MAXSCORE_MIN_POSTINGS = 10000
+
+# Maximum number of completions returned by /api/suggest, and of index terms matched by
+# a wildcard query term like "pott*" (see suggest.py).
+SUGGESTIONS = 10
+WILDCARD_TERMS = 32
+
+# Corpus to index (see corpus.py): a directory with one file per document, a bundle
+# file (.tar, .tar.gz, .jsonl, .jsonl.gz, ...) or a glob pattern of bundle files.
+CORPUS_PATH = "corpus"
+
+# Number of processes used to parse the corpus. 1 parses serially.
+PARSE_WORKERS = 1
+
+# Maximum number of postings kept in the in-process postings cache of an IndexReader.
+# 0 disables the cache.
+POSTINGS_CACHE_SIZE = 1000000
+
+# Maximum number of characters of the summary saved for every document.
+SUMMARY_LENGTH = 400
+
+# Incremental indexing (see segments.py).
+# The background compactor merges segments once there are more than MAX_SEGMENTS of
+# them, or once more than MAX_DELETED_RATIO of the indexed documents are deleted.
+# It checks every COMPACTION_INTERVAL seconds.
+MAX_SEGMENTS = 8
+MAX_DELETED_RATIO = 0.2
+COMPACTION_INTERVAL = 60
+
+# Number of distinct words whose stems are memoized by the query and document normalizer.
+STEM_CACHE_SIZE = 100000
+
+# Result cache shared by the processes of the server (see result_cache.py), bounded
+# by number of results and bytes. Results expire after RESULT_CACHE_TTL seconds.
+RESULT_CACHE_ENTRIES = 10000
+RESULT_CACHE_BYTES = 64 * 1024 * 1024
+RESULT_CACHE_TTL = 60 * 60
+
+# Record per-stage latency histograms and counters of searches, exported on /metrics
+# of the app (see metrics.py).
+METRICS_ENABLED = True
+
+# Number of shards the index is built in. Shards are document partitions built in
+# parallel, one process per shard (see index.py).
+SHARDS = 1
+
+# Number of processes evaluating regular queries over the shards (and segments) of
+# the index in parallel (see scatter_gather.py), 0 evaluates them in the server process.
+# Queries reading fewer than SCATTER_MIN_POSTINGS postings are never sent to workers.
+QUERY_WORKERS = 0
+SCATTER_MIN_POSTINGS = 200000
+
+# Batch searches (see helper.batch_search()) score their queries in BATCH_WORKERS
+# threads. Postings of their terms are read once and cached, up to BATCH_CACHE_SIZE
+# postings per batch. A request to /api/batch-search holds at most BATCH_MAX_QUERIES.
+BATCH_WORKERS = 4
+BATCH_CACHE_SIZE = 5000000
+BATCH_MAX_QUERIES = 50000
+
+# Searches return pages of RESULTS_PER_PAGE results by default, at most MAX_PAGE_SIZE,
+# and up to MAX_RESULTS results in total. The best RANKED_LIST_DEPTH results of a query
+# are computed and cached at once, grown RANKED_LIST_GROWTH times for deeper pages
+# (see ranked_list.py).
+RESULTS_PER_PAGE = 10
+MAX_PAGE_SIZE = 100
+MAX_RESULTS = 1000
+RANKED_LIST_DEPTH = 100
+RANKED_LIST_GROWTH = 4
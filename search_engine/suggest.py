@@ -0,0 +1,323 @@
+"""
+*Suggestions*
+
+Completions of term prefixes, for autocompletion and for wildcard query terms -
+
+    * The lexicon is sorted, so the terms starting with a prefix are a contiguous range
+      of it, found by binary search (see IndexFile.prefix_range()).
+    * For every prefix shared by more than SCAN_LIMIT terms, the indexer saves the
+      COMPLETIONS terms with the highest document frequency (completions.pkl, one per
+      segment). Completions of the other prefixes are found by scanning their range,
+      so any prefix is completed from memory in about SCAN_LIMIT steps at most.
+    * Over several segments, document frequencies of the completions of every segment
+      are added up.
+    * Index terms are stems, completions are shown as the word of the documents most
+      often stemmed to them (its surface form, "harri" -> "harry"), counted by the
+      indexer. Terms starting with the stem of the prefix are completed too, so that
+      whole words ("harry", "running") are completed.
+    * A query word holding a "*" is a wildcard, like "pott*" or "wom*n". It matches the
+      WILDCARD_TERMS index terms (stems) with highest document frequency that fit the
+      pattern. Patterns must start with a character other than "*", and only the first
+      WILDCARD_SCAN_LIMIT terms starting with their characters before the first "*"
+      are matched, a longer prefix narrows them down.
+"""
+
+import heapq
+import os
+import pickle
+import re
+from array import array
+from .index_file import IndexFile, INDEX_DIR
+from .index_lookup import get_default_reader
+from .query_processing import get_normalizer
+from .settings import SUGGESTIONS, WILDCARD_TERMS
+
+COMPLETIONS_FILE = "completions.pkl"
+
+# Counts of the words of the documents per stem, written while parsing.
+FORMS_FILE_PREFIX = "temp_forms"
+
+# Number of completions saved for a prefix.
+COMPLETIONS = max(SUGGESTIONS, WILDCARD_TERMS)
+
+# Prefixes of at most SCAN_LIMIT terms are completed by scanning the lexicon.
+SCAN_LIMIT = 256
+
+# Number of terms of the lexicon a wildcard pattern is matched against, per segment.
+WILDCARD_SCAN_LIMIT = 20000
+
+
+def is_forms_file(filename):
+    return filename.startswith(FORMS_FILE_PREFIX) and filename.endswith(".pkl")
+
+
+def write_form_counts(word_counts, index_dir=INDEX_DIR, part=""):
+    """
+    Saves the {word: count} of the words of a range of documents (see
+    Normalizer.normalize()) grouped by stem, for collect_forms().
+    """
+    stem_word = get_normalizer().stem_word
+    stems = {}
+    for word, count in word_counts.items():
+        stems.setdefault(stem_word(word), {})[word] = count
+    with open(os.path.join(index_dir, f"{FORMS_FILE_PREFIX}{part}.pkl"), "wb") as f:
+        pickle.dump(stems, f, pickle.HIGHEST_PROTOCOL)
+
+
+def remove_form_counts(index_dir=INDEX_DIR):
+    for filename in os.listdir(index_dir):
+        if is_forms_file(filename):
+            os.remove(os.path.join(index_dir, filename))
+
+
+def collect_forms(index_dir=INDEX_DIR):
+    """
+    Returns {stem: its most frequent word} from the counts saved in `index_dir` by
+    write_form_counts(), which are removed. Stems that are their own most frequent
+    word are left out.
+    """
+    totals = {}
+    for filename in sorted(os.listdir(index_dir)):
+        if not is_forms_file(filename):
+            continue
+        with open(os.path.join(index_dir, filename), "rb") as f:
+            stems = pickle.load(f)
+        for stem, words in stems.items():
+            counts = totals.setdefault(stem, {})
+            for word, count in words.items():
+                counts[word] = counts.get(word, 0) + count
+    remove_form_counts(index_dir)
+    forms = {}
+    for stem, counts in totals.items():
+        form = min(counts, key=lambda word: (-counts[word], word))
+        if form != stem:
+            forms[stem] = form
+    return forms
+
+
+def _best_form(indices, forms, term):
+    """
+    Returns the form of `term` in the segment (IndexFile) where it is in most
+    documents, given the forms of every segment.
+    """
+    best = None
+    best_frequency = 0
+    for index, segment_forms in zip(indices, forms):
+        ordinal = index.find(term)
+        if ordinal != -1 and index.document_frequencies[ordinal] > best_frequency:
+            best_frequency = index.document_frequencies[ordinal]
+            best = segment_forms.get(term, term)
+    return term if best is None else best
+
+
+def merge_forms(index_dirs):
+    """ Returns the forms of the segments in `index_dirs` merged into one. """
+    indices = [IndexFile(index_dir) for index_dir in index_dirs]
+    forms = [load_completions(index_dir)[1] for index_dir in index_dirs]
+    merged = {}
+    for term in set().union(*forms):
+        form = _best_form(indices, forms, term)
+        if form != term:
+            merged[term] = form
+    return merged
+
+
+def build_completions(index, completions=COMPLETIONS, scan_limit=SCAN_LIMIT):
+    """
+    Returns {prefix: ordinals of its `completions` terms with highest document
+    frequency} for the prefixes of more than `scan_limit` terms of an IndexFile.
+    """
+    terms = [index.term(ordinal) for ordinal in range(index.no_terms)]
+    document_frequencies = index.document_frequencies
+    table = {}
+    ranges = [(0, len(terms))]  # Ranges of the prefixes of the previous length.
+    length = 1
+    while ranges:
+        longer_ranges = []
+        for lo, hi in ranges:
+            start = lo
+            while start < hi:
+                if len(terms[start]) < length:
+                    start += 1  # The prefix of the range itself.
+                    continue
+                prefix = terms[start][:length]
+                stop = start + 1
+                while stop < hi and terms[stop].startswith(prefix):
+                    stop += 1
+                if stop - start > scan_limit:
+                    # Ties keep the lower ordinal, that is alphabetical order.
+                    best = heapq.nlargest(
+                        completions,
+                        range(start, stop),
+                        key=document_frequencies.__getitem__,
+                    )
+                    table[prefix] = array("I", best)
+                    longer_ranges.append((start, stop))
+                start = stop
+        ranges = longer_ranges
+        length += 1
+    return table
+
+
+def write_completions(index_dir=INDEX_DIR, forms=None):
+    """
+    Saves the completions of the prefixes of the index in `index_dir`, with the forms
+    of its terms (collected from the counts of the indexer by default).
+    """
+    table = build_completions(IndexFile(index_dir))
+    if forms is None:
+        forms = collect_forms(index_dir)
+    with open(os.path.join(index_dir, COMPLETIONS_FILE), "wb") as f:
+        pickle.dump((table, forms), f, pickle.HIGHEST_PROTOCOL)
+
+
+def load_completions(index_dir=INDEX_DIR):
+    """ Returns the saved (completions, forms) of an index, empty if it has none. """
+    try:
+        with open(os.path.join(index_dir, COMPLETIONS_FILE), "rb") as f:
+            completions = pickle.load(f)
+    except FileNotFoundError:
+        return {}, {}
+    if isinstance(completions, dict):  # Saved before forms were.
+        return completions, {}
+    return completions
+
+
+def _tables(reader, snapshot):
+    """
+    Returns the (completions, forms) of every segment of `snapshot`, loaded on first
+    use.
+    """
+    tables = snapshot.completions
+    if tables is None:
+        tables = [
+            load_completions(os.path.join(reader.index_dir, path))
+            for path in snapshot.paths
+        ]
+        snapshot.completions = tables
+    return tables
+
+
+def _best_terms(reader, matches, n):
+    """
+    Given a function returning the ordinals of the candidate terms of a segment
+    (IndexFile, completions), returns the `n` (term, document frequency) pairs with
+    highest document frequency over all segments of the index.
+    """
+    snapshot = reader.snapshot
+    frequencies = {}
+    for index, (table, _) in zip(snapshot.segments, _tables(reader, snapshot)):
+        for ordinal in matches(index, table):
+            term = index.term(ordinal)
+            frequencies[term] = (
+                frequencies.get(term, 0) + index.document_frequencies[ordinal]
+            )
+    return heapq.nsmallest(n, frequencies.items(), key=lambda item: (-item[1], item[0]))
+
+
+def _prefix_terms(reader, prefix, n):
+    """ Returns the `n` (term, document frequency) pairs of the terms starting with `prefix`. """
+
+    def matches(index, table):
+        ordinals = table.get(prefix)
+        if ordinals is not None and n <= len(ordinals):
+            return ordinals[:n]
+        start, stop = index.prefix_range(prefix)
+        return heapq.nlargest(
+            n, range(start, stop), key=index.document_frequencies.__getitem__
+        )
+
+    return _best_terms(reader, matches, n)
+
+
+def complete_terms(prefix, reader=None, n=SUGGESTIONS):
+    """
+    Returns the (at most) `n` index terms starting with `prefix` with highest document
+    frequency, in decreasing order of document frequency.
+    """
+    if reader is None:
+        reader = get_default_reader()
+    if not prefix:
+        return []
+    return [term for term, _ in _prefix_terms(reader, prefix, n)]
+
+
+def complete(prefix, reader=None, n=SUGGESTIONS):
+    """
+    Returns the (at most) `n` words completing `prefix` (lowercase), the surface forms
+    of the index terms starting with `prefix` or with its stem, in decreasing order of
+    document frequency of the terms.
+    """
+    if reader is None:
+        reader = get_default_reader()
+    if not prefix:
+        return []
+    stem = get_normalizer().stem_word(prefix)
+    # Terms whose form does not complete the prefix are dropped, so more are read.
+    size = max(n, COMPLETIONS)
+    frequencies = dict(_prefix_terms(reader, prefix, size))
+    if stem != prefix:
+        frequencies.update(_prefix_terms(reader, stem, size))
+    snapshot = reader.snapshot
+    forms = [forms for _, forms in _tables(reader, snapshot)]
+    completions = []
+    for term in sorted(frequencies, key=lambda term: (-frequencies[term], term)):
+        form = _best_form(snapshot.segments, forms, term)
+        if not form.startswith(prefix):
+            if term == stem:
+                form = prefix  # The word typed is a form of the term.
+            elif not term.startswith(prefix):
+                continue
+        if form not in completions:
+            completions.append(form)
+            if len(completions) == n:
+                break
+    return completions
+
+
+def is_wildcard(term):
+    return "*" in term
+
+
+def match_wildcard(pattern, reader=None, n=WILDCARD_TERMS):
+    """
+    Returns the (at most) `n` index terms matching the wildcard `pattern` with highest
+    document frequency, where "*" stands for any characters.
+    """
+    if reader is None:
+        reader = get_default_reader()
+    prefix, _, rest = pattern.partition("*")
+    if not prefix:
+        return []
+    if not rest.strip("*"):
+        return complete_terms(prefix, reader, n)
+    regex = re.compile(".*".join(re.escape(part) for part in pattern.split("*")))
+
+    def matches(index, table):
+        start, stop = index.prefix_range(prefix)
+        stop = min(stop, start + WILDCARD_SCAN_LIMIT)
+        ordinals = [
+            ordinal
+            for ordinal in range(start, stop)
+            if regex.fullmatch(index.term(ordinal))
+        ]
+        return heapq.nlargest(n, ordinals, key=index.document_frequencies.__getitem__)
+
+    return [term for term, _ in _best_terms(reader, matches, n)]
+
+
+def expand_wildcards(query, reader=None):
+    """
+    Takes in a query (a list of words that is obtained after normalization) and
+    replaces its wildcards by the index terms they match. [""] is returned when no
+    term is left, like process_string().
+    """
+    if not any(is_wildcard(term) for term in query):
+        return query
+    terms = []
+    for term in query:
+        if is_wildcard(term):
+            terms.extend(match_wildcard(term, reader))
+        elif term:
+            terms.append(term)
+    return terms or [""]
@@ -0,0 +1,174 @@
+"""
+*Top-k Retrieval*
+
+    * Finds the k best scoring documents for a query with the MaxScore algorithm.
+    * Every term has a precomputed upper bound on its score (see stats.bin). Terms are
+      ordered by that bound, the terms whose bounds add up to less than the current
+      k-th best score are "non-essential": a document matching only those can not
+      enter the top k, so their postings are never scanned, only probed (by binary
+      search) for candidates found in the essential terms.
+    * Scores are summed in query order, like calculate_query_tf_idf(), so results are
+      identical to sorting the full score list. Ties are broken by lower docId.
+    * When NumPy is installed, scoring every matching document with array operations
+      is faster than pruning in Python, so vector_scoring.py is used instead. Terms
+      of long postings and low bounds are still pruned as a whole by
+      champions.essential_top_k(), the postings of the other terms are scored.
+    * Queries on terms with champion lists are first answered from those (see
+      champions.py), the full postings are only scored when they do not settle the top k.
+
+"""
+
+import heapq
+from bisect import bisect_left
+from math import log10
+from .index_lookup import get_default_reader
+from .weighting import LOG_WEIGHTS
+from . import vector_scoring
+from . import champions
+from . import metrics
+
+# Relative slack on upper bounds, guards pruning against floating point rounding.
+BOUND_SLACK = 1e-9
+
+
+# Current docId of an exhausted cursor, greater than any docId.
+END = float("inf")
+
+
+class TermCursor:
+    """ Position in the postings of a query term. """
+
+    def __init__(self, docIds, freqs, idf, max_score):
+        self.docIds = docIds
+        self.freqs = freqs
+        self.idf = idf
+        self.max_score = max_score
+        self.count = 1  # Occurrences of the term in the query.
+        self.pos = 0
+        self.doc = docIds[0] if docIds else END  # Current docId.
+
+    @property
+    def upper_bound(self):
+        """ Upper bound of the term's contribution to a document's score. """
+        return self.max_score * self.count
+
+    def next(self):
+        """ Moves to the next posting. """
+        self.pos += 1
+        self.doc = self.docIds[self.pos] if self.pos < len(self.docIds) else END
+
+    def advance_to(self, docId):
+        """ Moves to the first posting with docId >= `docId`, returns its docId (END if none). """
+        if self.doc < docId:
+            self.pos = bisect_left(self.docIds, docId, self.pos + 1)
+            self.doc = self.docIds[self.pos] if self.pos < len(self.docIds) else END
+        return self.doc
+
+    def weight(self):
+        """ Returns the tf-idf weight of the term in the current document. """
+        freq = self.freqs[self.pos]
+        if freq < len(LOG_WEIGHTS):
+            return LOG_WEIGHTS[freq] * self.idf
+        return (1 + log10(freq)) * self.idf
+
+
+def _single_term_top_k(scored_terms, k):
+    """ The score of a single term is increasing in its frequency, no pruning is needed. """
+    cursor = scored_terms[0]
+    freqs = cursor.freqs
+    # nlargest is stable, so ties keep the lower docId first.
+    top_positions = heapq.nlargest(k, range(len(freqs)), key=freqs.__getitem__)
+    results = []
+    for pos in top_positions:
+        cursor.pos = pos
+        score = 0.0
+        for _ in scored_terms:
+            score += cursor.weight()
+        results.append((cursor.docIds[cursor.pos], score))
+    return results
+
+
+def top_k_documents(query, reader=None, k=10):
+    """
+    Takes in a query (a list of words that is obtained after normalization) and returns
+    the k (docId, tf-idf weight) pairs with highest weight, sorted by decreasing weight.
+    """
+    if reader is None:
+        reader = get_default_reader()
+    results = champions.top_k(query, reader, k)
+    if results is not None:
+        return results
+    if vector_scoring.available():
+        results = champions.essential_top_k(query, reader, k)
+        if results is not None:
+            return results
+        return vector_scoring.top_k(vector_scoring.query_scores(query, reader), k)
+
+    # One cursor per distinct term, a term repeated in the query counts once per occurrence.
+    cursors = {}
+    with metrics.stage("lookup"):
+        for term in query:
+            if term in cursors:
+                cursors[term].count += 1
+                continue
+            docIds, freqs, idf, max_score = reader.entry(term)
+            if docIds:
+                cursors[term] = TermCursor(docIds, freqs, idf, max_score)
+    scored_terms = [cursors[term] for term in query if term in cursors]
+    with metrics.stage("score"):
+        if len(cursors) == 1:
+            return _single_term_top_k(scored_terms, k)
+        return _max_score_top_k(cursors, scored_terms, k)
+
+
+def _max_score_top_k(cursors, scored_terms, k):
+    """ MaxScore over the cursors of the distinct terms, `scored_terms` are in query order. """
+    # Non-essential terms come first, sorted by increasing upper bound.
+    ordered = sorted(cursors.values(), key=lambda cursor: cursor.upper_bound)
+    bound_sums = [0.0]  # bound_sums[i] = sum of upper bounds of ordered[:i]
+    for cursor in ordered:
+        bound_sums.append(bound_sums[-1] + cursor.upper_bound)
+
+    heap = []  # (score, -docId) of the best k documents so far.
+    threshold = -END
+    first_essential = 0
+    non_essential = []
+    essential = ordered
+    while essential:
+        candidate = min([cursor.doc for cursor in essential])
+        if candidate == END:
+            break
+        matched = [cursor for cursor in essential if cursor.doc == candidate]
+
+        # Upper bound of the candidate's score: actual weights of the matched essential
+        # terms plus the bounds of the non-essential ones.
+        bound = bound_sums[first_essential]
+        for cursor in matched:
+            bound += cursor.weight() * cursor.count
+        if bound * (1 + BOUND_SLACK) > threshold:
+            for cursor in non_essential:
+                cursor.advance_to(candidate)
+            score = 0.0
+            for cursor in scored_terms:
+                if cursor.doc == candidate:
+                    score += cursor.weight()
+            entry = (score, -candidate)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+            if len(heap) == k and heap[0][0] > threshold:
+                threshold = heap[0][0]
+                # Documents seen later have higher docIds, so they lose ties.
+                while (
+                    first_essential < len(ordered)
+                    and bound_sums[first_essential + 1] * (1 + BOUND_SLACK) <= threshold
+                ):
+                    first_essential += 1
+                non_essential = ordered[:first_essential]
+                essential = ordered[first_essential:]
+
+        for cursor in matched:
+            cursor.next()
+
+    return [(-docId, score) for score, docId in sorted(heap, reverse=True)]
@@ -0,0 +1,35 @@
+"""
+Updates the index from the command line, without starting the server (see segments.py).
+
+Usage - python -m search_engine.update [update|compact|compact-full]
+
+    * update --> indexes the documents added to the corpus and removes the deleted ones.
+    * compact --> merges the small segments of updates, like the server does.
+    * compact-full --> merges all segments into one.
+"""
+
+import argparse
+import sys
+from .segments import update_index, compact_segments
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m search_engine.update", description=__doc__.split("\n")[1]
+    )
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="update",
+        choices=["update", "compact", "compact-full"],
+    )
+    args = parser.parse_args(argv)
+    if args.command == "update":
+        no_added, no_removed = update_index()
+        print(f"Added {no_added} and removed {no_removed} documents")
+    elif not compact_segments(full=args.command == "compact-full"):
+        print("Nothing to compact")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,194 @@
+"""
+*Vectorized Scoring*
+
+NumPy backend of query scoring, used when NumPy is installed.
+
+    * Postings are read from the memory mapped index straight into arrays, docIds are
+      decoded with a cumulative sum.
+    * Log frequency weights are looked up in a table and multiplied by the idf for a
+      whole postings list at once.
+    * Scores of all query terms are summed with np.bincount, in query order, so they
+      are identical to the ones of the pure Python path.
+    * The best k results are selected with np.argpartition.
+
+Results are (docIds, scores) pairs of arrays sorted by docId.
+"""
+
+from math import log10
+from .index_lookup import get_default_reader
+from .weighting import inverse_document_frequency, LOG_WEIGHTS
+from . import metrics
+
+try:
+    import numpy as np
+except ImportError:  # The pure Python scoring is used.
+    np = None
+
+if np is not None:
+    LOG_WEIGHT_TABLE = np.array(LOG_WEIGHTS)
+    EMPTY = (np.zeros(0, dtype=np.int64), np.zeros(0))
+
+# Scores are accumulated in an array indexed by docId when the query has at least one
+# posting per DENSE_RATIO documents, and in an array of the matching docIds otherwise.
+DENSE_RATIO = 16
+
+
+def available():
+    """ Checks whether NumPy is installed. """
+    return np is not None
+
+
+def _log_weights(freqs):
+    """ Returns 1 + log10(freq) of every frequency, computed like tf_idf_weight(). """
+    freqs = np.asarray(freqs)
+    if not len(freqs) or freqs.max() < len(LOG_WEIGHT_TABLE):
+        return LOG_WEIGHT_TABLE[freqs]
+    large = freqs >= len(LOG_WEIGHT_TABLE)
+    weights = LOG_WEIGHT_TABLE[np.where(large, 0, freqs)]
+    weights[large] = [1 + log10(freq) for freq in freqs[large].tolist()]
+    return weights
+
+
+def term_scores(term, reader=None):
+    """
+    Returns the (docIds, tf-idf weights) arrays of `term`, both empty if the term is
+    absent in the index. They are kept in the postings cache of readers with
+    cache_scores set (see BatchReader).
+    """
+    if reader is None:
+        reader = get_default_reader()
+    if reader.cache_scores:
+        return reader._cached(("scores", term), _read_term_scores, term)
+    return _read_term_scores(reader.snapshot, term)
+
+
+def _read_term_scores(snapshot, term):
+    docIds = []
+    freqs = []
+    idf = None
+    for index in snapshot.segments:
+        ordinal = index.find(term)
+        if ordinal == -1:
+            continue
+        deltas, segment_freqs = index.postings(ordinal)
+        docIds.append(np.cumsum(np.asarray(deltas), dtype=np.int64))
+        freqs.append(np.asarray(segment_freqs))
+        idf = index.idfs[ordinal]
+    if not docIds:
+        return EMPTY
+    docIds = np.concatenate(docIds) if len(docIds) > 1 else docIds[0]
+    metrics.count("postings", len(docIds))
+    freqs = np.concatenate(freqs) if len(freqs) > 1 else freqs[0]
+    if len(snapshot.segments) > 1 or snapshot.deleted:
+        # Same statistics as IndexReader.entry() over several segments.
+        if snapshot.deleted:
+            live = ~np.isin(docIds, np.fromiter(snapshot.deleted, dtype=np.int64))
+            docIds = docIds[live]
+            freqs = freqs[live]
+        if not len(docIds):
+            return EMPTY
+        idf = inverse_document_frequency(snapshot.no_docs, len(docIds))
+    return docIds, _log_weights(freqs) * idf
+
+
+def query_scores(query, reader=None):
+    """
+    Takes in a query (a list of words that is obtained after normalization) and returns
+    the (docIds, tf-idf weights) arrays of the matching documents, sorted by docId.
+    """
+    with metrics.stage("lookup"):
+        postings = [term_scores(term, reader) for term in query]
+    return combine_scores(postings)
+
+
+def segment_scores(index, query, idfs, deleted=()):
+    """
+    Returns the (docIds, tf-idf weights) arrays of the documents of one segment
+    (an IndexFile) matching `query`, with the given (global) idf of every query term.
+    """
+    postings = []
+    if deleted:
+        deleted = np.fromiter(deleted, dtype=np.int64)
+    for term, idf in zip(query, idfs):
+        ordinal = index.find(term)
+        if ordinal == -1:
+            continue
+        deltas, freqs = index.postings(ordinal)
+        docIds = np.cumsum(np.asarray(deltas), dtype=np.int64)
+        weights = _log_weights(freqs) * idf
+        if len(deleted):
+            live = ~np.isin(docIds, deleted)
+            docIds = docIds[live]
+            weights = weights[live]
+        postings.append((docIds, weights))
+    return combine_scores(postings)
+
+
+def combine_scores(postings):
+    """
+    Sums the (docIds, weights) postings of the terms of a query (in query order) into
+    the (docIds, scores) of the matching documents, sorted by docId.
+    """
+    postings = [(docIds, weights) for docIds, weights in postings if len(docIds)]
+    if not postings:
+        return EMPTY
+    if len(postings) == 1:
+        return postings[0]
+    with metrics.stage("score"):
+        docIds = np.concatenate([docIds for docIds, _ in postings])
+        weights = np.concatenate([weights for _, weights in postings])
+        # bincount adds the weights in their order, that is query order.
+        size = int(docIds.max()) + 1
+        if len(docIds) * DENSE_RATIO >= size:
+            scores = np.bincount(docIds, weights, minlength=size)
+            matched = np.bincount(docIds, minlength=size).nonzero()[0]
+            return matched, scores[matched]
+        matched, positions = np.unique(docIds, return_inverse=True)
+        return matched, np.bincount(positions.ravel(), weights, minlength=len(matched))
+
+
+def merge_scores(result_a, result_b, operator="and"):
+    """
+    Merges two (docIds, scores) results. Scores are added for "and", the highest is
+    taken for "or", and "not" keeps the documents of `result_a` missing in `result_b`.
+    """
+    docIds_a, scores_a = result_a
+    docIds_b, scores_b = result_b
+    if operator == "not":
+        kept = ~np.isin(docIds_a, docIds_b, assume_unique=True)
+        return docIds_a[kept], scores_a[kept]
+    if operator == "and":
+        docIds, pos_a, pos_b = np.intersect1d(
+            docIds_a, docIds_b, assume_unique=True, return_indices=True
+        )
+        return docIds, scores_a[pos_a] + scores_b[pos_b]
+    docIds = np.concatenate((docIds_a, docIds_b))
+    scores = np.concatenate((scores_a, scores_b))
+    order = np.argsort(docIds, kind="stable")
+    docIds = docIds[order]
+    scores = scores[order]
+    starts = (
+        np.flatnonzero(np.r_[True, docIds[1:] != docIds[:-1]]) if len(docIds) else []
+    )
+    if len(starts) == len(docIds):
+        return docIds, scores
+    return docIds[starts], np.maximum.reduceat(scores, starts)
+
+
+def top_k(result, k=10):
+    """
+    Returns the k (docId, score) pairs of a (docIds, scores) result with the highest
+    score, sorted by decreasing score. Ties are broken by lower docId.
+    """
+    docIds, scores = result
+    if k <= 0:
+        return []
+    with metrics.stage("score"):
+        if len(scores) > k:
+            # Every document scoring at least the k-th best score, ties included.
+            kth_score = scores[np.argpartition(-scores, k - 1)[k - 1]]
+            candidates = np.flatnonzero(scores >= kth_score)
+            docIds = docIds[candidates]
+            scores = scores[candidates]
+        order = np.lexsort((docIds, -scores))[:k]
+        return list(zip(docIds[order].tolist(), scores[order].tolist()))
@@ -0,0 +1,24 @@
+""" Term weighting formulas, shared by the indexer and the query side. """
+
+from math import log10
+
+
+def inverse_document_frequency(total_number_of_docs, document_frequency):
+    """
+    Returns the idf of a term, it is precomputed for every term by the indexer
+    and saved with the corpus statistics.
+    """
+    # use (total_number_of_docs + 2) as numerator to handle cases when document_frequency = total_number_of_docs
+    # use (1 + document_frequency) as denominator to handle cases when document_frequency comes out to be zero
+    return log10((total_number_of_docs + 2) / (1 + document_frequency))
+
+
+# Log frequency weights (1 + log10(freq)) of small frequencies, same values as
+# tf_idf_weight() computes. Index 0 is unused.
+LOG_WEIGHTS = [0.0] + [1 + log10(freq) for freq in range(1, 1024)]
+
+
+def tf_idf_weight(freq, idf):
+    """ Returns the tf-idf weight of a term occurring `freq` times in a document. """
+    log_frequency_weight = 1 + log10(freq)
+    return log_frequency_weight * idf
@@ -0,0 +1,8 @@
+"""
+Tests of the search engine, run from the root of the project with -
+
+    $ python -m unittest
+
+Every test case indexes a small synthetic corpus (see benchmarks/corpus.py) in a
+temporary directory, the NLTK data must be installed.
+"""
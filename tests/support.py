@@ -0,0 +1,160 @@
+""" Corpus, index builds and reference results shared by the tests. """
+
+import contextlib
+import io
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+from unittest import mock
+from benchmarks.corpus import generate_corpus
+from search_engine import index, query_processing
+from search_engine.index_file import INDEX_DIR
+from search_engine.index_lookup import IndexReader
+from search_engine.corpus import open_corpus
+from search_engine.settings import STORE_POSITIONS
+from search_engine.tf_idf_calculation import calculate_term_tf_idf
+
+# Files of an index that builds must write identically.
+INDEX_FILES = (
+    "lexicon.bin",
+    "postings.bin",
+    "positions.bin",
+    "stats.bin",
+    "champions.bin",
+    "docs.bin",
+)
+
+
+def quiet():
+    """ Silences the progress printed by the indexer. """
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def build_index(
+    workers=1,
+    shards=1,
+    memory_budget=None,
+    champions=None,
+    store_positions=STORE_POSITIONS,
+):
+    """
+    Builds the index of ./corpus in ./index_files, parsed by `workers` processes or as
+    `shards` shards. `memory_budget` overrides INDEX_MEMORY_BUDGET, and `champions` the
+    (CHAMPION_LIST_SIZE, CHAMPION_MIN_POSTINGS) settings.
+    """
+    patches = []
+    if memory_budget is not None:
+        patches.append(mock.patch.object(index, "INDEX_MEMORY_BUDGET", memory_budget))
+    if champions is not None:
+        patches.append(mock.patch.object(index, "CHAMPION_LIST_SIZE", champions[0]))
+        patches.append(mock.patch.object(index, "CHAMPION_MIN_POSTINGS", champions[1]))
+    with contextlib.ExitStack() as stack:
+        for patch in patches:
+            stack.enter_context(patch)
+        stack.enter_context(quiet())
+        corpus = index.assign_docId()
+        if shards > 1:
+            index.build_shards(shards, store_positions=store_positions, corpus=corpus)
+        else:
+            index.parse_docs(workers, store_positions=store_positions, corpus=corpus)
+            index.merge_indices()
+            index.construct_index(store_positions=store_positions)
+        index.reset_segments(shards)
+
+
+def doc_names(index_dir=INDEX_DIR):
+    """ Returns the {docId: name} of the documents of the index in `index_dir`. """
+    with open(os.path.join(index_dir, "docId.pkl"), "rb") as f:
+        return pickle.load(f)
+
+
+def document_terms():
+    """ Returns the {docId: normalized terms} of the documents of the index. """
+    normalize = query_processing.get_normalizer().normalize
+    names = doc_names()
+    corpus = open_corpus()
+    return {
+        docId: normalize(text.replace("\n", " "))
+        for docId, (_, text) in zip(names, corpus.read(names.values()))
+    }
+
+
+def exhaustive_top_k(query, reader, k=10):
+    """ Returns the k best (docId, tf-idf weight) pairs of a query, scoring all postings. """
+    scores = {}
+    for term in query:
+        for docId, weight in calculate_term_tf_idf(term, reader):
+            scores[docId] = scores.get(docId, 0.0) + weight
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+
+class IndexTestCase(unittest.TestCase):
+    """
+    Runs its tests in a temporary directory holding a synthetic corpus of DOCS
+    documents, in ./corpus.
+    """
+
+    DOCS = 150
+    VOCABULARY = 400
+    DOC_LENGTH = 80
+    SEED = 1
+
+    @classmethod
+    def setUpClass(cls):
+        missing = query_processing.missing_nltk_deps()
+        if missing:
+            raise unittest.SkipTest("NLTK data not installed: " + ", ".join(missing))
+        cls.cwd = os.getcwd()
+        cls.work_dir = tempfile.mkdtemp(prefix="meklet_test_")
+        os.chdir(cls.work_dir)
+        with quiet():
+            generate_corpus(
+                "corpus", cls.DOCS, cls.VOCABULARY, cls.DOC_LENGTH, cls.SEED
+            )
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.cwd)
+        shutil.rmtree(cls.work_dir, ignore_errors=True)
+
+    def assertSameResults(self, results, expected):
+        """ Checks that two lists of (docId, score) pairs hold the same documents and scores. """
+        self.assertEqual(
+            [docId for docId, _ in results], [docId for docId, _ in expected]
+        )
+        for (_, score), (_, expected_score) in zip(results, expected):
+            self.assertAlmostEqual(score, expected_score, places=9)
+
+
+class AppTestCase(IndexTestCase):
+    """
+    Serves the index of the synthetic corpus with the Flask app, its results cached
+    in LRU caches. `words` are the most frequent words of the documents, stopwords
+    aside, for queries.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Imported here, the app is not needed by the other tests.
+        from app import create_app
+        from helper import LRUCache
+
+        build_index()
+        cls.reader = IndexReader()
+        cls.app = create_app(cls.reader, cache=LRUCache(100), adv_cache=LRUCache(100))
+        cls.client = cls.app.test_client()
+        stop_words = query_processing.get_normalizer().stop_words
+        corpus = open_corpus()
+        counts = Counter()
+        for _, text in corpus.read(corpus.names()):
+            counts.update(word.strip(".") for word in text.split("\n\n", 2)[2].split())
+        cls.words = [word for word, _ in counts.most_common() if word not in stop_words]
+
+    def with_metadata(self, results):
+        """ Returns (docId, score) results as served, with their title, link and summary. """
+        doc_store = self.reader.snapshot.doc_store
+        return [[docId, score, *doc_store.get(docId)] for docId, score in results]
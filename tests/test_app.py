@@ -0,0 +1,106 @@
+""" Routes of the Flask app serve the results of the search functions of helper.py. """
+
+import helper
+import search_engine
+from search_engine.settings import MAX_PAGE_SIZE, MAX_RESULTS, RESULTS_PER_PAGE
+from .support import AppTestCase
+
+
+class TestRoutes(AppTestCase):
+    def search(self, query, advanced=False, **params):
+        params.update(query=query, advanced="true" if advanced else "false")
+        return self.client.get("/api/search-results", query_string=params)
+
+    def expected(self, query, advanced=False, offset=0, limit=RESULTS_PER_PAGE):
+        k = offset + limit
+        if advanced:
+            results = helper.advanced_search(
+                *search_engine.process_boolean_query(query), self.reader, k
+            )
+        else:
+            results = helper.regular_search(
+                search_engine.process_string(query), self.reader, k=k
+            )
+        return self.with_metadata(results[offset:])
+
+    def test_home(self):
+        response = self.client.get("/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"<html", response.data)
+
+    def test_search(self):
+        queries = [
+            (" ".join(self.words[:2]), False),
+            (self.words[7] + " " + self.words[30], False),
+            (self.words[3][:3] + "*", False),
+            ("absentword", False),
+            (f'"{self.words[0]}" and "{self.words[1]}"', True),
+            (f'"{self.words[0]}" and not "{self.words[2]}"', True),
+        ]
+        for query, advanced in queries:
+            with self.subTest(query=query):
+                response = self.search(query, advanced)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.get_json(), self.expected(query, advanced))
+        self.assertTrue(self.search(queries[0][0]).get_json())
+
+    def test_pages(self):
+        query = self.words[0]
+        for offset, limit in ((0, 5), (5, 5), (10, 30), (0, MAX_PAGE_SIZE)):
+            with self.subTest(offset=offset, limit=limit):
+                response = self.search(query, offset=offset, limit=limit)
+                self.assertEqual(
+                    response.get_json(), self.expected(query, False, offset, limit)
+                )
+
+    def test_debug(self):
+        query = self.words[5] + " " + self.words[6]
+        breakdowns = [self.search(query, debug="true").get_json() for _ in range(2)]
+        for breakdown in breakdowns:
+            self.assertEqual(breakdown["results"], self.expected(query))
+            self.assertIn("request", breakdown["debug"]["stages"])
+        self.assertEqual(
+            [breakdown["debug"]["cached"] for breakdown in breakdowns], [False, True]
+        )
+        self.assertIn("normalize", breakdowns[0]["debug"]["stages"])
+
+    def test_invalid_search(self):
+        invalid = [
+            {"advanced": "maybe"},
+            {"offset": -1},
+            {"offset": "first"},
+            {"limit": 0},
+            {"limit": MAX_PAGE_SIZE + 1},
+            {"offset": MAX_RESULTS, "limit": 1},
+        ]
+        for params in invalid:
+            with self.subTest(params=params):
+                params = dict({"query": self.words[0], "advanced": "false"}, **params)
+                response = self.client.get("/api/search-results", query_string=params)
+                self.assertEqual(response.status_code, 400)
+        response = self.client.get("/api/search-results", query_string={"query": "x"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_suggest(self):
+        word = self.words[0]
+        for query in ("", "  ", word + " "):
+            with self.subTest(query=query):
+                response = self.client.get(
+                    "/api/suggest", query_string={"query": query}
+                )
+                self.assertEqual(response.get_json(), [])
+        for query in (word[:2], "The " + word[:3].upper()):
+            with self.subTest(query=query):
+                prefix = query.split()[-1]
+                head = query[: len(query) - len(prefix)]
+                expected = [
+                    head + completion
+                    for completion in search_engine.complete(
+                        prefix.lower(), self.reader
+                    )
+                ]
+                self.assertTrue(expected)
+                response = self.client.get(
+                    "/api/suggest", query_string={"query": query}
+                )
+                self.assertEqual(response.get_json(), expected)
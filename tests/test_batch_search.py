@@ -0,0 +1,140 @@
+""" Batch searches return the results of searching each query on its own. """
+
+import json
+from unittest import mock
+import app
+import helper
+import search_engine
+from search_engine.settings import MAX_PAGE_SIZE, RESULTS_PER_PAGE
+from .support import AppTestCase
+
+
+class TestBatchSearch(AppTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        words = cls.words
+        cls.queries = [
+            (words[0], False),
+            (f"{words[1]} {words[2]}", False),
+            (f'"{words[0]}" and not "{words[3]}"', True),
+            (words[0].upper() + " the", False),  # Same normalized query as the first.
+            (words[4][:3] + "*", False),
+            ("absentword", False),
+            (f'"{words[1]}" or "{words[5]}"', True),
+            (words[0], False),
+        ]
+
+    def expected(self, query, advanced, offset=0, limit=RESULTS_PER_PAGE):
+        k = offset + limit
+        if advanced:
+            results = helper.advanced_search(
+                *search_engine.process_boolean_query(query), self.reader, k
+            )
+        else:
+            results = helper.regular_search(
+                search_engine.process_string(query), self.reader, k=k
+            )
+        return results[offset:]
+
+    def check(self, results, offset=0, limit=RESULTS_PER_PAGE):
+        results = dict(results)
+        self.assertEqual(sorted(results), list(range(len(self.queries))))
+        for position, (query, advanced) in enumerate(self.queries):
+            with self.subTest(query=query):
+                self.assertSameResults(
+                    results[position], self.expected(query, advanced, offset, limit)
+                )
+
+    def test_batch_search(self):
+        for workers in (1, 4):
+            for caches in (
+                None,
+                {"regular": helper.LRUCache(10), "advanced": helper.LRUCache(10)},
+            ):
+                with self.subTest(workers=workers, caches=caches is not None):
+                    self.check(
+                        helper.batch_search(
+                            self.queries, self.reader, caches=caches, workers=workers
+                        )
+                    )
+        self.check(
+            helper.batch_search(self.queries, self.reader, offset=5, limit=20), 5, 20
+        )
+
+    def test_duplicates(self):
+        with mock.patch.object(
+            helper, "regular_search", wraps=helper.regular_search
+        ) as search:
+            results = list(helper.batch_search(self.queries, self.reader, workers=1))
+        self.check(results)
+        # The 4th and last queries are evaluated with the first.
+        regular = [query for query, advanced in self.queries if not advanced]
+        self.assertEqual(search.call_count, len(regular) - 2)
+
+    def test_stop_early(self):
+        # Queries are not evaluated after the caller stops reading results.
+        with mock.patch.object(
+            helper, "regular_search", wraps=helper.regular_search
+        ) as search:
+            results = helper.batch_search(self.queries, self.reader, workers=1)
+            next(results)
+            results.close()
+        self.assertEqual(search.call_count, 1)
+        results = helper.batch_search(self.queries, self.reader, workers=2)
+        position, _ = next(results)
+        results.close()
+        self.assertIn(position, range(len(self.queries)))
+
+    def post(self, body):
+        return self.client.post("/api/batch-search", json=body)
+
+    def test_route(self):
+        body = {
+            "queries": [
+                {"query": query, "advanced": advanced}
+                for query, advanced in self.queries
+            ]
+        }
+        del body["queries"][0]["advanced"]
+        for page in ({}, {"offset": 3, "limit": 4}):
+            with self.subTest(page=page):
+                response = self.post(dict(body, **page))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.mimetype, "application/x-ndjson")
+                lines = [
+                    json.loads(line)
+                    for line in response.get_data(as_text=True).splitlines()
+                ]
+                results = {line["id"]: line["results"] for line in lines}
+                self.assertEqual(len(results), len(lines))
+                for position, (query, advanced) in enumerate(self.queries):
+                    expected = self.expected(
+                        query,
+                        advanced,
+                        page.get("offset", 0),
+                        page.get("limit", RESULTS_PER_PAGE),
+                    )
+                    self.assertEqual(results[position], self.with_metadata(expected))
+        self.assertEqual(self.post({"queries": []}).get_data(as_text=True), "")
+
+    def test_invalid_route(self):
+        invalid = [
+            None,
+            [],
+            {},
+            {"queries": "query"},
+            {"queries": ["query"]},
+            {"queries": [{"query": 1}]},
+            {"queries": [{"query": "query", "advanced": "true"}]},
+            {"queries": [{"query": "query"}], "offset": -1},
+            {"queries": [{"query": "query"}], "offset": "0"},
+            {"queries": [{"query": "query"}], "limit": MAX_PAGE_SIZE + 1},
+        ]
+        for body in invalid:
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body).status_code, 400)
+        with mock.patch.object(app, "BATCH_MAX_QUERIES", 2):
+            self.assertEqual(
+                self.post({"queries": [{"query": "query"}] * 3}).status_code, 400
+            )
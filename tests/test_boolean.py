@@ -0,0 +1,118 @@
+""" Boolean queries with "not", phrases and proximity match the documents they should. """
+
+import random
+from search_engine.boolean_query import boolean_search
+from search_engine.index_lookup import IndexReader
+from search_engine.query_processing import SubQuery, process_boolean_query
+from search_engine.tf_idf_calculation import calculate_term_tf_idf
+from .support import IndexTestCase, build_index, document_terms
+
+
+def phrase_matches(terms, query, slop=0):
+    """ Checks whether `query` appears in `terms` in order, with at most `slop` terms between. """
+    reachable = [position for position, term in enumerate(terms) if term == query[0]]
+    for word in query[1:]:
+        reachable = [
+            position
+            for position, term in enumerate(terms)
+            if term == word
+            and any(0 < position - start <= slop + 1 for start in reachable)
+        ]
+    return bool(reachable)
+
+
+class TestBooleanQueries(IndexTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        build_index(store_positions=True)
+        cls.reader = IndexReader(cache_size=0)
+        cls.terms = document_terms()
+        rng = random.Random(1)
+        words = sorted({term for terms in cls.terms.values() for term in terms if term})
+        # Frequent words, and (pair of words, number of words between them) in some document.
+        counts = {
+            word: sum(word in terms for terms in cls.terms.values()) for word in words
+        }
+        cls.frequent = sorted(words, key=lambda word: (-counts[word], word))[:30]
+        cls.pairs = []
+        for terms in rng.sample(list(cls.terms.values()), 20):
+            start = rng.randrange(len(terms) - 2)
+            cls.pairs.append((terms[start : start + 2], 0))
+            cls.pairs.append((terms[start : start + 3 : 2], 1))
+
+    def scores(self, query, slop=0):
+        """
+        Returns {docId: score} of the documents matching a sub-query, a phrase when it
+        has several terms.
+        """
+        scores = {}
+        for term in query:
+            for docId, weight in calculate_term_tf_idf(term, self.reader):
+                scores[docId] = scores.get(docId, 0.0) + weight
+        if len(query) > 1:
+            scores = {
+                docId: score
+                for docId, score in scores.items()
+                if phrase_matches(self.terms[docId], query, slop)
+            }
+        return scores
+
+    def search(self, queries, operators):
+        return boolean_search(queries, operators, self.reader, k=self.DOCS)
+
+    def ranked(self, scores):
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def test_not(self):
+        rng = random.Random(2)
+        for _ in range(30):
+            a, b, c = (
+                SubQuery(rng.sample(self.frequent, rng.randint(1, 2))) for _ in range(3)
+            )
+            with self.subTest(a=a, b=b, c=c):
+                left, right, other = self.scores(a), self.scores(b), self.scores(c)
+                expected = {
+                    docId: score for docId, score in left.items() if docId not in right
+                }
+                self.assertSameResults(
+                    self.search([a, b], ["", "not"]), self.ranked(expected)
+                )
+                self.assertSameResults(
+                    self.search([a, b], ["", "and not"]), self.ranked(expected)
+                )
+                # "not" is evaluated before "or".
+                union = dict(other)
+                for docId, score in expected.items():
+                    union[docId] = max(score, union.get(docId, 0.0))
+                self.assertSameResults(
+                    self.search([c, a, b], ["", "or", "not"]), self.ranked(union)
+                )
+
+    def test_phrases(self):
+        for pair, gap in self.pairs:
+            for slop in (0, 1, 3):
+                with self.subTest(phrase=pair, slop=slop):
+                    expected = self.scores(pair, slop)
+                    if slop >= gap:
+                        self.assertTrue(expected)
+                    results = self.search([SubQuery(pair, slop)], [""])
+                    self.assertSameResults(results, self.ranked(expected))
+
+    def test_phrase_not(self):
+        for (pair, _), word in zip(self.pairs, self.frequent):
+            with self.subTest(phrase=pair, word=word):
+                excluded = self.scores([word])
+                expected = {
+                    docId: score
+                    for docId, score in self.scores(pair).items()
+                    if docId not in excluded
+                }
+                results = self.search([SubQuery(pair), SubQuery([word])], ["", "not"])
+                self.assertSameResults(results, self.ranked(expected))
+
+    def test_parse_proximity(self):
+        queries, operators = process_boolean_query('"harry potter"~2 and not "wizard"')
+        self.assertEqual(queries, [["harri", "potter"], ["wizard"]])
+        self.assertEqual([query.slop for query in queries], [2, 0])
+        self.assertEqual(operators, ["", "and not"])
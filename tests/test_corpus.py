@@ -0,0 +1,110 @@
+""" Bundle corpora read the same documents as the directory they were packed from. """
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from benchmarks.corpus import generate_corpus, write_bundle
+from search_engine.corpus import BundleCorpus, DirectoryCorpus, open_corpus
+from .support import quiet
+
+BUNDLES = ("corpus.tar", "corpus.tar.gz", "corpus.jsonl", "corpus.jsonl.gz")
+
+
+class TestBundles(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.work_dir = tempfile.mkdtemp(prefix="meklet_test_")
+        cls.corpus_dir = os.path.join(cls.work_dir, "corpus")
+        with quiet():
+            generate_corpus(cls.corpus_dir, 40, 200, 30)
+        directory = open_corpus(cls.corpus_dir)
+        cls.names = sorted(directory.names())
+        cls.texts = dict(directory.read(cls.names))
+        for bundle in BUNDLES:
+            write_bundle(cls.corpus_dir, os.path.join(cls.work_dir, bundle))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.work_dir, ignore_errors=True)
+
+    def bundles(self):
+        for bundle in BUNDLES:
+            with self.subTest(bundle=bundle):
+                yield open_corpus(os.path.join(self.work_dir, bundle))
+
+    def test_open_corpus(self):
+        self.assertIsInstance(open_corpus(self.corpus_dir), DirectoryCorpus)
+        corpus = open_corpus(os.path.join(self.work_dir, "corpus.jsonl*"))
+        self.assertIsInstance(corpus, BundleCorpus)
+        self.assertEqual(len(corpus.paths), 2)
+        with self.assertRaises(Exception):
+            open_corpus(os.path.join(self.work_dir, "missing.jsonl"))
+        with self.assertRaises(Exception):
+            BundleCorpus([os.path.join(self.work_dir, "corpus.zip")])
+
+    def test_read(self):
+        for corpus in self.bundles():
+            self.assertEqual(corpus.names(), self.names)
+            self.assertEqual(list(corpus.read(self.names)), list(self.texts.items()))
+
+    def test_seek(self):
+        names = self.names[3:30:4]
+        for corpus in self.bundles():
+            corpus.names()
+            self.assertEqual(
+                list(corpus.read(names)), [(name, self.texts[name]) for name in names]
+            )
+            # Without the locations of the documents, bundles are read from the start.
+            fresh = BundleCorpus(corpus.paths)
+            self.assertEqual(
+                list(fresh.read(names)), [(name, self.texts[name]) for name in names]
+            )
+            self.assertEqual(list(corpus.read([])), [])
+
+    def test_subset(self):
+        names = self.names[5:15]
+        for corpus in self.bundles():
+            corpus.names()
+            subset = corpus.subset(names + ["missing.txt"])
+            self.assertEqual(set(subset.locations), set(names))
+            self.assertEqual(
+                list(subset.read(names)), [(name, self.texts[name]) for name in names]
+            )
+
+    def test_sort(self):
+        for corpus in self.bundles():
+            names = self.names[::-3] + ["missing.txt"]
+            self.assertEqual(
+                corpus.sort(names),
+                sorted(names[:-1], key=self.names.index) + ["missing.txt"],
+            )
+
+    def test_several_bundles(self):
+        # A name found in an earlier bundle hides the same name in later ones.
+        path = os.path.join(self.work_dir, "extra.jsonl")
+        with open(path, "w") as f:
+            f.write(json.dumps({"name": self.names[0], "text": "duplicate"}) + "\n\n")
+            record = {
+                "title": 'Quoted "title"',
+                "url": "https://x.org/Q",
+                "text": "Body.",
+            }
+            f.write(json.dumps(record) + "\n")
+        try:
+            corpus = BundleCorpus([os.path.join(self.work_dir, "corpus.tar"), path])
+            names = corpus.names()
+            self.assertEqual(names, self.names + ['Quoted_"title".txt'])
+            self.assertEqual(
+                list(corpus.read([self.names[0], names[-1]])),
+                [
+                    (self.names[0], self.texts[self.names[0]]),
+                    (
+                        'Quoted_"title".txt',
+                        'https://x.org/Q\n\nQuoted "title"\n\nBody.',
+                    ),
+                ],
+            )
+        finally:
+            os.remove(path)
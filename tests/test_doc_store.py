@@ -0,0 +1,85 @@
+""" Document stores return the metadata of every document, alone or as segments. """
+
+import os
+import shutil
+import tempfile
+import unittest
+from search_engine.doc_store import (
+    DocStore,
+    DocStoreWriter,
+    SegmentedDocStore,
+    concatenate_stores,
+    document_metadata,
+)
+
+DOCUMENTS = [
+    (
+        "Harry Potter",
+        "https://en.wikipedia.org/wiki/Harry_Potter",
+        "A series of novels.",
+    ),
+    ("Null\0title", "https://en.wikipedia.org/wiki/Null", "Summary\0with\0NULs."),
+    ("", "https://en.wikipedia.org/wiki/Empty", ""),
+    ("Ünïcode", "https://en.wikipedia.org/wiki/Unicode", "Ωmega ✓"),
+]
+
+
+class TestDocStore(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="meklet_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def write(self, name, documents, first_docId=1):
+        filename = os.path.join(self.work_dir, name)
+        with DocStoreWriter(filename, first_docId) as writer:
+            for document in documents:
+                writer.add(*document)
+        return filename
+
+    def assertStored(self, store, documents, first_docId=1):
+        for docId, document in enumerate(documents, first_docId):
+            self.assertIn(docId, store)
+            self.assertEqual(
+                store.get(docId), tuple(field.replace("\0", "") for field in document)
+            )
+
+    def test_get(self):
+        store = DocStore(self.write("docs.bin", DOCUMENTS, 5))
+        self.assertEqual(len(store), len(DOCUMENTS))
+        self.assertNotIn(4, store)
+        self.assertNotIn(5 + len(DOCUMENTS), store)
+        self.assertStored(store, DOCUMENTS, 5)
+
+    def test_segments(self):
+        stores = [
+            DocStore(self.write("1.bin", DOCUMENTS[:1], 1)),
+            DocStore(self.write("2.bin", DOCUMENTS[1:], 2)),
+        ]
+        segmented = SegmentedDocStore(stores)
+        self.assertEqual(len(segmented), len(DOCUMENTS))
+        self.assertStored(segmented, DOCUMENTS)
+        with self.assertRaises(KeyError):
+            segmented.get(len(DOCUMENTS) + 1)
+
+    def test_concatenate(self):
+        parts = [
+            self.write("1.bin", DOCUMENTS[:2], 3),
+            self.write("2.bin", DOCUMENTS[2:], 5),
+        ]
+        filename = os.path.join(self.work_dir, "docs.bin")
+        concatenate_stores(parts, filename)
+        self.assertStored(DocStore(filename), DOCUMENTS, 3)
+        self.assertFalse(any(os.path.exists(part) for part in parts))
+
+    def test_document_metadata(self):
+        text = (
+            "Harry Potter\nhttps://en.wikipedia.org/wiki/Harry_Potter\nHarry Potter\n\n"
+        )
+        title, link, summary = document_metadata(
+            "Harry_Potter.txt", text + "A  series\nof novels."
+        )
+        self.assertEqual(title, "Harry Potter")
+        self.assertEqual(link, "https://en.wikipedia.org/wiki/Harry_Potter")
+        self.assertEqual(summary, "A series of novels.")
@@ -0,0 +1,84 @@
+""" Parallel, memory bounded and sharded builds write the same index as a serial build. """
+
+import os
+import shutil
+from unittest import mock
+from search_engine.index_file import IndexFile, INDEX_DIR
+from search_engine.manifest import SHARDS_DIR
+from search_engine.run_file import RunWriter
+from search_engine.settings import RUN_BLOCK_BYTES
+from search_engine.suggest import load_completions
+from .support import IndexTestCase, build_index, INDEX_FILES
+
+# Champion lists are written for the most frequent terms of the test corpus.
+CHAMPIONS = (10, 30)
+
+
+def read_files(index_dir=INDEX_DIR):
+    files = {}
+    for filename in INDEX_FILES:
+        with open(os.path.join(index_dir, filename), "rb") as f:
+            files[filename] = f.read()
+    return files
+
+
+def read_postings(index_dir=INDEX_DIR):
+    """ Returns {term: [(docId, freq), ...]} of the index in `index_dir`. """
+    return {
+        term: list(zip(docIds, freqs)) for term, docIds, freqs in IndexFile(index_dir)
+    }
+
+
+class TestBuilds(IndexTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        build_index(champions=CHAMPIONS, store_positions=True)
+        cls.serial_dir = os.path.join(cls.work_dir, "serial")
+        shutil.copytree(INDEX_DIR, cls.serial_dir)
+
+    def tearDown(self):
+        shutil.rmtree(INDEX_DIR, ignore_errors=True)
+
+    def assertSameIndex(self):
+        self.assertEqual(read_files(), read_files(self.serial_dir))
+        self.assertEqual(load_completions(), load_completions(self.serial_dir))
+        self.assertFalse(
+            [name for name in os.listdir(INDEX_DIR) if name.startswith("temp")]
+        )
+
+    def test_parallel_build(self):
+        build_index(workers=3, champions=CHAMPIONS, store_positions=True)
+        self.assertSameIndex()
+
+    def test_memory_budgeted_build(self):
+        # Blocks are spilled every few documents, and runs are merged over several passes.
+        build_index(
+            workers=2,
+            memory_budget=64 * 1024,
+            champions=CHAMPIONS,
+            store_positions=True,
+        )
+        self.assertSameIndex()
+
+    def test_compressed_runs(self):
+        # COMPRESS_RUNS is the default of every RunWriter.
+        with mock.patch.object(
+            RunWriter.__init__, "__defaults__", (RUN_BLOCK_BYTES, True)
+        ):
+            build_index(
+                workers=2,
+                memory_budget=64 * 1024,
+                champions=CHAMPIONS,
+                store_positions=True,
+            )
+        self.assertSameIndex()
+
+    def test_sharded_build(self):
+        build_index(shards=3, champions=CHAMPIONS, store_positions=True)
+        postings = {}
+        for shard_no in range(1, 4):
+            shard_dir = os.path.join(INDEX_DIR, SHARDS_DIR, str(shard_no))
+            for term, shard_postings in read_postings(shard_dir).items():
+                postings.setdefault(term, []).extend(shard_postings)
+        self.assertEqual(postings, read_postings(self.serial_dir))
@@ -0,0 +1,141 @@
+""" Stages and counters of searches are recorded, and exported at /metrics. """
+
+import re
+import threading
+import unittest
+from unittest import mock
+from search_engine import metrics
+from search_engine.metrics import BUCKETS, STAGES
+from .support import AppTestCase
+
+SAMPLE = re.compile(r"^(\w+)(?:\{(.*)\})? (\S+)$")
+
+
+def parse(text):
+    """ Returns {(metric, labels): value} of the samples of a Prometheus text export. """
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        name, labels, value = SAMPLE.match(line).groups()
+        samples[name, labels or ""] = float(value)
+    return samples
+
+
+class FreshMetrics(unittest.TestCase):
+    """ Records the metrics of each test from zero. """
+
+    def setUp(self):
+        patches = [
+            mock.patch.object(
+                metrics, "histograms", {name: metrics.Histogram() for name in STAGES}
+            ),
+            mock.patch.object(metrics, "counters", {}),
+            mock.patch.object(metrics, "enabled", True),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+
+class TestMetrics(FreshMetrics):
+    def test_stage(self):
+        with metrics.stage("score"):
+            pass
+        for seconds in (0.00005, 0.0003, 0.0003, 3.0):
+            metrics.observe("lookup", seconds)
+        self.assertEqual(sum(metrics.histograms["score"].counts), 1)
+        histogram = metrics.histograms["lookup"]
+        self.assertEqual(histogram.counts[0], 1)
+        self.assertEqual(histogram.counts[BUCKETS.index(0.0005)], 2)
+        self.assertEqual(histogram.counts[-1], 1)
+        self.assertAlmostEqual(histogram.sum, 3.00065)
+
+    def test_count(self):
+        metrics.count("postings", 5)
+        metrics.count("postings", 7)
+        metrics.count("probes")
+        self.assertEqual(metrics.counters, {"postings": 12, "probes": 1})
+
+    def test_disabled(self):
+        metrics.enabled = False
+        with metrics.stage("score"):
+            metrics.count("postings", 5)
+        self.assertEqual(metrics.counters, {})
+        self.assertEqual(sum(metrics.histograms["score"].counts), 0)
+
+    def test_breakdown(self):
+        metrics.enabled = False
+        metrics.start_breakdown()
+        with metrics.stage("score"):
+            metrics.count("postings", 5)
+        metrics.observe("score", 1.0)
+
+        # Other threads are not recorded.
+        thread = threading.Thread(target=metrics.count, args=("postings", 100))
+        thread.start()
+        thread.join()
+        breakdown = metrics.end_breakdown()
+        self.assertEqual(breakdown["counts"], {"postings": 5})
+        self.assertGreaterEqual(breakdown["stages"]["score"], 1.0)
+        self.assertIsNone(metrics.end_breakdown())
+        self.assertEqual(metrics.counters, {})
+
+    def test_render(self):
+        for seconds in (0.00005, 0.0003, 3.0):
+            metrics.observe("lookup", seconds)
+        metrics.count("postings", 12)
+        cache = mock.Mock()
+        cache.stats.return_value = {"hits": 3, "misses": 4, "entries": 2, "bytes": None}
+        samples = parse(metrics.render({"regular": cache}))
+        bucket = 'stage="lookup",le="{}"'
+        self.assertEqual(
+            samples["meklet_stage_seconds_bucket", bucket.format(0.0001)], 1
+        )
+        self.assertEqual(
+            samples["meklet_stage_seconds_bucket", bucket.format(0.0005)], 2
+        )
+        self.assertEqual(samples["meklet_stage_seconds_bucket", bucket.format(2.5)], 2)
+        self.assertEqual(
+            samples["meklet_stage_seconds_bucket", bucket.format("+Inf")], 3
+        )
+        self.assertEqual(samples["meklet_stage_seconds_count", 'stage="lookup"'], 3)
+        self.assertAlmostEqual(
+            samples["meklet_stage_seconds_sum", 'stage="lookup"'], 3.00035
+        )
+        self.assertEqual(samples["meklet_stage_seconds_count", 'stage="score"'], 0)
+        self.assertEqual(samples["meklet_postings_total", ""], 12)
+        self.assertEqual(
+            samples["meklet_result_cache_hits_total", 'cache="regular"'], 3
+        )
+        self.assertEqual(samples["meklet_result_cache_entries", 'cache="regular"'], 2)
+        self.assertNotIn(("meklet_result_cache_bytes", 'cache="regular"'), samples)
+
+
+class TestMetricsRoute(AppTestCase, FreshMetrics):
+    def test_metrics(self):
+        query = {"query": " ".join(self.words[:3]), "advanced": "false"}
+        for _ in range(2):
+            self.client.get("/api/search-results", query_string=query)
+        self.client.get("/api/suggest", query_string={"query": self.words[0][:2]})
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        samples = parse(response.get_data(as_text=True))
+        for stage, count in (
+            ("request", 2),
+            ("normalize", 2),
+            ("metadata", 2),
+            ("suggest", 1),
+        ):
+            with self.subTest(stage=stage):
+                self.assertEqual(
+                    samples["meklet_stage_seconds_count", f'stage="{stage}"'], count
+                )
+        self.assertGreater(samples["meklet_postings_total", ""], 0)
+        self.assertEqual(
+            samples["meklet_result_cache_misses_total", 'cache="regular"'], 1
+        )
+        self.assertEqual(
+            samples["meklet_result_cache_hits_total", 'cache="regular"'], 1
+        )
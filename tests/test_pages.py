@@ -0,0 +1,75 @@
+""" Pages of results served from cached ranked lists concatenate to the top results. """
+
+import os
+import helper
+from search_engine.index_lookup import IndexReader
+from search_engine.query_processing import SubQuery
+from search_engine.result_cache import ResultCache
+from search_engine.settings import RANKED_LIST_DEPTH
+from .support import IndexTestCase, build_index
+
+
+class TestPages(IndexTestCase):
+    # Deeper than the first ranked list of a query, so that it grows.
+    RESULTS = RANKED_LIST_DEPTH + 50
+    DOCS = RANKED_LIST_DEPTH + 100
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        build_index()
+        cls.reader = IndexReader()
+        index = cls.reader.snapshot.segments[0]
+        terms = sorted(
+            (index.term(ordinal) for ordinal in range(index.no_terms)),
+            key=lambda term: -len(cls.reader.entry(term)[0]),
+        )
+        cls.regular = [terms[:1], terms[5:7], terms[20:24], ["absentterm"]]
+        cls.advanced = [
+            ([SubQuery(terms[:1]), SubQuery(terms[10:11])], ["", "or"]),
+            ([SubQuery(terms[:1]), SubQuery(terms[3:4])], ["", "not"]),
+            ([SubQuery(terms[2:3]), SubQuery(terms[4:5])], ["", "and"]),
+        ]
+
+    def searches(self):
+        """ Yields (cache key, search(k)) of every query. """
+        version = self.reader.snapshot.version
+        for query in self.regular:
+            yield (version, helper.reconstruct(query)), (
+                lambda k, query=query: helper.regular_search(query, self.reader, k=k)
+            )
+        for separated_query, operators in self.advanced:
+            yield (version, helper.reconstruct(separated_query, operators)), (
+                lambda k, query=separated_query, operators=operators: helper.advanced_search(
+                    query, operators, self.reader, k
+                )
+            )
+
+    def check_pages(self, cache):
+        for key, search in self.searches():
+            expected = search(self.RESULTS)
+            for limit in (1, 7, 10, 30):
+                with self.subTest(query=key[1], limit=limit):
+                    cache.clear()
+                    pages = []
+                    cached = []
+                    for offset in range(0, self.RESULTS, limit):
+                        page, hit = helper.search_page(
+                            search, cache, key, offset, limit
+                        )
+                        pages.extend(page)
+                        cached.append(hit)
+                    self.assertSameResults(pages[: self.RESULTS], expected)
+                    # Every ranked list serves the pages up to its depth.
+                    if len(cached) > 1:
+                        self.assertGreater(cached.count(True), cached.count(False))
+                    # Later reads are all served from the cache.
+                    page, hit = helper.search_page(search, cache, key, 0, limit)
+                    self.assertTrue(hit)
+                    self.assertEqual(page, pages[:limit])
+
+    def test_lru_cache(self):
+        self.check_pages(helper.LRUCache(100))
+
+    def test_result_cache(self):
+        self.check_pages(ResultCache("test", os.path.join(self.work_dir, "results.db")))
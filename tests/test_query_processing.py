@@ -0,0 +1,89 @@
+""" The Normalizer returns the terms of the original process_string() pipeline. """
+
+import random
+import unittest
+from collections import Counter
+from benchmarks.corpus import STOPWORDS, make_vocabulary
+from search_engine import query_processing
+from search_engine.query_processing import (
+    Normalizer,
+    process_boolean_query,
+    process_string,
+)
+
+TEXTS = [
+    "",
+    "   ",
+    "the and of",
+    "Harry Potter",
+    "  Harry POTTER and the Philosopher's Stone  ",
+    "was it raining yesterday night OR i have been gaming! It can't be true?",
+    "i want to be sleeping right now and he is bothering me",
+    "Running runners ran; connected, connections - connecting...",
+    "U.S. e-mail 3.14 co-operate o'clock a b c",
+    "Ünïcode naïve café, résumé",
+]
+
+
+def original_process_string(query):
+    """ process_string() as it was before the Normalizer, one NLTK pass per step. """
+    from nltk.corpus import stopwords
+    from nltk.stem import PorterStemmer
+    from nltk.tokenize import word_tokenize
+
+    words = [word for word in word_tokenize(query.strip().lower()) if len(word) > 1]
+    stop_words = set(stopwords.words("english"))
+    words = [word for word in words if word not in stop_words]
+    stemmer = PorterStemmer()
+    return " ".join(stemmer.stem(word) for word in words).split(" ")
+
+
+class TestNormalizer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        missing = query_processing.missing_nltk_deps()
+        if missing:
+            raise unittest.SkipTest("NLTK data not installed: " + ", ".join(missing))
+        rng = random.Random(1)
+        vocabulary = make_vocabulary(300, rng) + STOPWORDS
+        cls.texts = TEXTS + [
+            " ".join(rng.choice(vocabulary) for _ in range(rng.randint(1, 30)))
+            for _ in range(200)
+        ]
+
+    def test_normalize(self):
+        normalizer = Normalizer(cache_size=16)
+        for text in self.texts:
+            with self.subTest(text=text):
+                self.assertEqual(
+                    normalizer.normalize(text), original_process_string(text)
+                )
+
+    def test_normalize_many(self):
+        normalizer = Normalizer()
+        forms = Counter()
+        terms = normalizer.normalize_many(self.texts, forms)
+        self.assertEqual(terms, [original_process_string(text) for text in self.texts])
+        expected = Counter()
+        for text in self.texts:
+            expected.update(
+                word
+                for word in normalizer.word_tokenize(text.strip().lower())
+                if len(word) > 1 and word not in normalizer.stop_words
+            )
+        self.assertEqual(forms, expected)
+        self.assertEqual(normalizer.normalize_many([]), [])
+
+    def test_process_string(self):
+        for text in TEXTS:
+            with self.subTest(text=text):
+                self.assertEqual(process_string(text), original_process_string(text))
+        self.assertEqual(process_string("harry pott*"), ["harri", "pott*"])
+        self.assertEqual(process_string("the *"), [""])
+
+    def test_process_boolean_query(self):
+        queries, operators = process_boolean_query(
+            '"Harry Potter" and "the" or not "Sleeping"'
+        )
+        self.assertEqual(queries, [["harri", "potter"], [""], ["sleep"]])
+        self.assertEqual(operators, ["", "and", "or not"])
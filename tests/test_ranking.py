@@ -0,0 +1,107 @@
+"""
+Top-k algorithms (MaxScore, NumPy, champion lists, MaxScore over whole terms and
+scatter-gather over shards)
+return the same results as scoring every posting.
+"""
+
+import random
+import unittest
+from unittest import mock
+from search_engine import champions, vector_scoring
+from search_engine.index_lookup import IndexReader
+from search_engine.scatter_gather import ShardPool
+from search_engine.top_k import top_k_documents
+from .support import IndexTestCase, build_index, exhaustive_top_k
+
+K_VALUES = (1, 10, 40)
+
+
+def sample_queries(reader, count=40, seed=1):
+    """ Returns queries of 1 to 4 terms, mostly frequent ones, some repeated or absent. """
+    rng = random.Random(seed)
+    index = reader.snapshot.segments[0]
+    terms = sorted(
+        (index.term(ordinal) for ordinal in range(index.no_terms)),
+        key=lambda term: -len(reader.entry(term)[0]),
+    )
+    queries = []
+    for _ in range(count):
+        pool = terms[: rng.choice((10, 50, len(terms)))]
+        query = [rng.choice(pool) for _ in range(rng.randint(1, 4))]
+        if rng.random() < 0.1:
+            query.append(query[0])
+        if rng.random() < 0.1:
+            query.append("absentterm")
+        queries.append(query)
+    return queries
+
+
+class TestTopK(IndexTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Shards are searched as segments of one index, frequent terms get champion lists.
+        build_index(shards=3, champions=(10, 30))
+        cls.reader = IndexReader(cache_size=0)
+        cls.queries = sample_queries(cls.reader)
+
+    def check(self, top_k):
+        for query in self.queries:
+            for k in K_VALUES:
+                with self.subTest(query=query, k=k):
+                    self.assertSameResults(
+                        top_k(query, self.reader, k),
+                        exhaustive_top_k(query, self.reader, k),
+                    )
+
+    def test_max_score(self):
+        with mock.patch.object(vector_scoring, "np", None), mock.patch.object(
+            champions, "top_k", return_value=None
+        ):
+            self.check(top_k_documents)
+
+    @unittest.skipUnless(vector_scoring.available(), "NumPy is not installed")
+    def test_vector_scoring(self):
+        with mock.patch.object(champions, "top_k", return_value=None):
+            self.check(top_k_documents)
+
+    def test_champion_lists(self):
+        settled = []
+
+        def top_k(query, reader, k):
+            results = champions.top_k(query, reader, k)
+            settled.append(results is not None)
+            return exhaustive_top_k(query, reader, k) if results is None else results
+
+        with mock.patch.object(vector_scoring, "np", None):
+            self.check(top_k)
+        self.check(top_k)
+        self.assertTrue(any(settled))
+
+    def test_essential_terms(self):
+        settled = []
+
+        def top_k(query, reader, k):
+            results = champions.essential_top_k(query, reader, k)
+            settled.append(results is not None)
+            return exhaustive_top_k(query, reader, k) if results is None else results
+
+        # Postings of the test corpus are short, any term of several postings is left
+        # out and probed whatever the number of candidates.
+        with mock.patch.object(
+            champions, "MAXSCORE_MIN_POSTINGS", 20
+        ), mock.patch.object(champions, "PROBE_COST", 0):
+            with mock.patch.object(vector_scoring, "np", None):
+                self.check(top_k)
+            self.check(top_k)
+            with mock.patch.object(champions, "top_k", return_value=None):
+                self.check(top_k_documents)
+        self.assertTrue(any(settled))
+
+    def test_scatter_gather(self):
+        pool = ShardPool(workers=2, min_postings=0)
+        try:
+            with mock.patch.object(champions, "top_k", return_value=None):
+                self.check(pool.top_k)
+        finally:
+            pool.close()
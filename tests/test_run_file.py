@@ -0,0 +1,102 @@
+""" Intermediate runs read back their postings, in blocks of bounded size. """
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from search_engine.run_file import (
+    HEADER,
+    RunWriter,
+    decoded_term_bytes,
+    read_blocks,
+    read_run,
+    write_run,
+)
+
+BLOCK_BYTES = 4096
+
+
+def sample_postings(positions, count=3000, seed=1):
+    """ Returns sorted (term, docId, freq[, positions]) tuples. """
+    rng = random.Random(seed)
+    terms = sorted(
+        {"".join(rng.choices("abcdefgh", k=rng.randint(1, 12))) for _ in range(400)}
+    )
+    postings = set()
+    while len(postings) < count:
+        postings.add((rng.choice(terms), rng.randint(1, 10 ** 6)))
+    result = []
+    for term, docId in sorted(postings):
+        freq = rng.choice((1, 1, 2, 3, 40))
+        if positions:
+            result.append((term, docId, freq, sorted(rng.sample(range(10 ** 5), freq))))
+        else:
+            result.append((term, docId, freq))
+    return result
+
+
+def block_sizes(filename):
+    """ Yields the (payload bytes, no. of postings) of every block of a run file. """
+    with open(filename, "rb") as run:
+        while True:
+            header = run.read(HEADER.size)
+            if not header:
+                break
+            _, _, no_postings, _, payload_len = HEADER.unpack(header)
+            run.seek(payload_len, os.SEEK_CUR)
+            yield payload_len, no_postings
+
+
+class TestRunFiles(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="meklet_test_")
+        self.filename = os.path.join(self.work_dir, "temp_index1.run")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def read(self):
+        return [
+            posting[:3] + (list(posting[3]),) if len(posting) == 4 else posting
+            for posting in read_run(self.filename)
+        ]
+
+    def test_round_trip(self):
+        for positions in (False, True):
+            for compress in (False, True):
+                with self.subTest(positions=positions, compress=compress):
+                    postings = sample_postings(positions)
+                    with RunWriter(self.filename, BLOCK_BYTES, compress) as writer:
+                        writer.write(postings[:1000])
+                        writer.write(iter(postings[1000:]))
+                    self.assertEqual(
+                        self.read(), [tuple(posting) for posting in postings]
+                    )
+
+    def test_block_bytes(self):
+        for positions in (False, True):
+            with self.subTest(positions=positions):
+                postings = sample_postings(positions)
+                with RunWriter(self.filename, BLOCK_BYTES) as writer:
+                    writer.write(postings)
+                sizes = list(block_sizes(self.filename))
+                self.assertGreater(len(sizes), 2)
+                # A block is flushed by the posting that reaches the block size.
+                largest = max(
+                    decoded_term_bytes(posting[0])
+                    + 8
+                    + (4 * posting[2] if positions else 0)
+                    for posting in postings
+                )
+                for payload_bytes, _ in sizes[:-1]:
+                    self.assertLess(payload_bytes, BLOCK_BYTES + largest)
+                for block in read_blocks(self.filename):
+                    for posting in block:
+                        if positions:
+                            self.assertEqual(len(posting[3]), posting[2])
+
+    def test_empty_run(self):
+        write_run(self.filename, [])
+        self.assertEqual(os.path.getsize(self.filename), 0)
+        self.assertEqual(list(read_run(self.filename)), [])
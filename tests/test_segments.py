@@ -0,0 +1,168 @@
+"""
+An index updated with added and removed documents, before and after compaction,
+holds and ranks the same documents as an index built from scratch.
+"""
+
+import os
+import random
+import shutil
+from unittest import mock
+from benchmarks.corpus import generate_corpus
+from search_engine.boolean_query import boolean_search
+from search_engine.index_file import INDEX_DIR
+from search_engine import segments
+from search_engine.index_lookup import IndexReader
+from search_engine.manifest import load_manifest, SEGMENTS_DIR
+from search_engine.query_processing import SubQuery
+from search_engine.segments import update_index, compact_segments
+from search_engine.top_k import top_k_documents
+from .support import IndexTestCase, build_index, doc_names, document_terms, quiet
+
+
+def all_terms(reader):
+    terms = set()
+    for index in reader.snapshot.segments:
+        terms.update(index.term(ordinal) for ordinal in range(index.no_terms))
+    return terms
+
+
+class UpdatedCorpusTestCase(IndexTestCase):
+    """ Index of the corpus, and a fresh index of the corpus after documents changed. """
+
+    ADDED = 40
+    REMOVED = 25
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        build_index(store_positions=True)
+        rng = random.Random(1)
+        for name in rng.sample(sorted(os.listdir("corpus")), cls.REMOVED):
+            os.remove(os.path.join("corpus", name))
+        with quiet():
+            generate_corpus("added", cls.ADDED, cls.VOCABULARY, cls.DOC_LENGTH, seed=2)
+        for name in os.listdir("added"):
+            os.rename(
+                os.path.join("added", name), os.path.join("corpus", "New_" + name)
+            )
+
+        # The same corpus, indexed from scratch.
+        cls.fresh_dir = os.path.join(cls.work_dir, "fresh")
+        shutil.copytree("corpus", os.path.join(cls.fresh_dir, "corpus"))
+        os.chdir(cls.fresh_dir)
+        try:
+            build_index(store_positions=True)
+            cls.terms = list(document_terms().values())
+        finally:
+            os.chdir(cls.work_dir)
+        cls.fresh = IndexReader(os.path.join(cls.fresh_dir, INDEX_DIR), cache_size=0)
+        cls.fresh_names = doc_names(os.path.join(cls.fresh_dir, INDEX_DIR))
+
+    def assertSameDocuments(self, results, names, expected):
+        """ Checks that results of the index and of the fresh one hold the same documents. """
+        results = {names[docId]: score for docId, score in results}
+        expected = {self.fresh_names[docId]: score for docId, score in expected}
+        self.assertEqual(results.keys(), expected.keys())
+        for name, score in results.items():
+            self.assertAlmostEqual(score, expected[name], places=9)
+
+    def assertSameIndex(self, reader):
+        names = doc_names()
+        self.assertEqual(len(names), self.DOCS - self.REMOVED + self.ADDED)
+        self.assertEqual(reader.no_docs, self.fresh.no_docs)
+        terms = all_terms(self.fresh)
+        # Terms of removed documents only are left in the segments until they are merged.
+        self.assertTrue(terms <= all_terms(reader))
+        for term in all_terms(reader):
+            docIds, freqs, idf, _ = reader.entry(term)
+            fresh_docIds, fresh_freqs, fresh_idf, _ = self.fresh.entry(term)
+            self.assertEqual(
+                dict(zip(map(names.get, docIds), freqs)),
+                dict(zip(map(self.fresh_names.get, fresh_docIds), fresh_freqs)),
+            )
+            self.assertAlmostEqual(idf, fresh_idf, places=12)
+
+        rng = random.Random(2)
+        frequent = sorted(terms, key=lambda term: -len(self.fresh.entry(term)[0]))[:40]
+        k = self.DOCS + self.ADDED
+        for _ in range(20):
+            query = rng.sample(frequent, rng.randint(1, 3))
+            words = self.terms[rng.randrange(len(self.terms))]
+            start = rng.randrange(len(words) - 1)
+            phrase = SubQuery(words[start : start + 2])
+            boolean_queries = [
+                ([phrase], [""]),
+                (
+                    [SubQuery(query[:1]), SubQuery(query[1:] or frequent[:1])],
+                    ["", "not"],
+                ),
+            ]
+            with self.subTest(query=query, phrase=phrase):
+                self.assertSameDocuments(
+                    top_k_documents(query, reader, k),
+                    names,
+                    top_k_documents(query, self.fresh, k),
+                )
+                for separated_query, operators in boolean_queries:
+                    self.assertSameDocuments(
+                        boolean_search(separated_query, operators, reader, k),
+                        names,
+                        boolean_search(separated_query, operators, self.fresh, k),
+                    )
+
+
+class TestUpdates(UpdatedCorpusTestCase):
+    def test_update_and_compaction(self):
+        with quiet():
+            self.assertEqual(update_index(), (self.ADDED, self.REMOVED))
+        reader = IndexReader(cache_size=0)
+        self.assertEqual(len(reader.snapshot.segments), 2)
+        self.assertEqual(len(reader.snapshot.deleted), self.REMOVED)
+        self.assertSameIndex(reader)
+
+        with quiet():
+            self.assertTrue(compact_segments(full=True))
+        reader = IndexReader(cache_size=0)
+        self.assertEqual(len(reader.snapshot.segments), 1)
+        self.assertFalse(reader.snapshot.deleted)
+        self.assertSameIndex(reader)
+
+
+class TestConcurrentCompactions(UpdatedCorpusTestCase):
+    def test_lost_compaction_is_dropped(self):
+        with quiet():
+            update_index()
+        merge_segments = segments.merge_segments
+        compacted = []
+
+        def racing_merge(*args):
+            # Another compactor merges the same segments while this one is merging.
+            if not compacted:
+                compacted.append(None)
+                compacted[0] = compact_segments(full=True)
+            return merge_segments(*args)
+
+        with quiet(), mock.patch.object(segments, "merge_segments", racing_merge):
+            self.assertFalse(compact_segments(full=True))
+        self.assertEqual(compacted, [True])
+        manifest = load_manifest()
+        self.assertEqual(len(manifest["segments"]), 1)
+        # The segment of the lost compaction is removed.
+        self.assertEqual(
+            os.listdir(os.path.join(INDEX_DIR, SEGMENTS_DIR)),
+            [os.path.basename(manifest["segments"][0]["path"])],
+        )
+        self.assertSameIndex(IndexReader(cache_size=0))
+
+
+class TestRebuilds(IndexTestCase):
+    def test_reader_reopens_rebuilt_index(self):
+        build_index()
+        reader = IndexReader(cache_size=0)
+        shutil.rmtree(INDEX_DIR)
+        os.remove(os.path.join("corpus", sorted(os.listdir("corpus"))[0]))
+        build_index()
+        # The generation of the new manifest restarts from the same number.
+        self.assertEqual(load_manifest()["generation"], reader.snapshot.generation)
+        self.assertTrue(reader.refresh())
+        self.assertEqual(reader.no_docs, self.DOCS - 1)
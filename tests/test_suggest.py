@@ -0,0 +1,127 @@
+""" Completions and wildcard terms match a scan of the whole lexicon. """
+
+import re
+from collections import Counter
+from unittest import mock
+from search_engine import suggest
+from search_engine.index_lookup import IndexReader
+from search_engine.query_processing import get_normalizer
+from search_engine.settings import SUGGESTIONS, WILDCARD_TERMS
+from search_engine.suggest import (
+    COMPLETIONS,
+    build_completions,
+    complete,
+    complete_terms,
+    expand_wildcards,
+    load_completions,
+    match_wildcard,
+)
+from .support import IndexTestCase, build_index
+
+
+class TestSuggestions(IndexTestCase):
+    DOCS = 300
+    VOCABULARY = 2000
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        build_index()
+        cls.reader = IndexReader()
+        cls.index = cls.reader.snapshot.segments[0]
+        cls.frequencies = {
+            cls.index.term(ordinal): cls.index.document_frequencies[ordinal]
+            for ordinal in range(cls.index.no_terms)
+        }
+        cls.forms = load_completions()[1]
+
+    def best(self, match, n):
+        """ Returns the `n` terms for which `match` is true, scanning the whole lexicon. """
+        terms = [term for term in self.frequencies if match(term)]
+        return sorted(terms, key=lambda term: (-self.frequencies[term], term))[:n]
+
+    def prefixes(self):
+        terms = sorted(self.frequencies)
+        prefixes = {term[:length] for term in terms[::37] for length in (1, 2, 4)}
+        return sorted(prefixes) + ["absentterm"]
+
+    def test_complete_terms(self):
+        # Small scan limits save completions for the prefixes of 1 and 2 characters.
+        tables = [
+            (build_completions(self.index, COMPLETIONS, scan_limit=5), self.forms)
+        ]
+        reader = IndexReader()
+        for small_scan_limit in (False, True):
+            if small_scan_limit:
+                reader.snapshot.completions = tables
+            for prefix in self.prefixes():
+                with self.subTest(prefix=prefix, small_scan_limit=small_scan_limit):
+                    expected = self.best(
+                        lambda term: term.startswith(prefix), SUGGESTIONS
+                    )
+                    self.assertEqual(complete_terms(prefix, reader), expected)
+        self.assertEqual(complete_terms("", reader), [])
+
+    def test_forms(self):
+        stem_word = get_normalizer().stem_word
+        self.assertTrue(self.forms)
+        for term, form in self.forms.items():
+            self.assertIn(term, self.frequencies)
+            self.assertNotEqual(form, term)
+            self.assertEqual(stem_word(form), term)
+
+    def test_complete(self):
+        words = set(self.forms.values())
+        for prefix in self.prefixes():
+            with self.subTest(prefix=prefix):
+                completions = complete(prefix, self.reader)
+                self.assertLessEqual(len(completions), SUGGESTIONS)
+                self.assertEqual(len(set(completions)), len(completions))
+                for completion in completions:
+                    self.assertTrue(completion.startswith(prefix))
+                    self.assertTrue(
+                        completion in words
+                        or completion not in self.forms
+                        or completion == prefix
+                    )
+        # A whole word is completed by itself, though its term is its stem.
+        for word in sorted(words)[:20]:
+            with self.subTest(word=word):
+                self.assertIn(word, complete(word, self.reader))
+        self.assertEqual(complete("", self.reader), [])
+
+    def test_match_wildcard(self):
+        terms = sorted(self.frequencies)
+        patterns = set()
+        for term in terms[::53]:
+            patterns.update(
+                (term[:2] + "*", term[:1] + "*" + term[-2:], term[:2] + "*e*")
+            )
+        for pattern in sorted(patterns):
+            with self.subTest(pattern=pattern):
+                regex = re.compile(".*".join(map(re.escape, pattern.split("*"))))
+                expected = self.best(regex.fullmatch, WILDCARD_TERMS)
+                self.assertEqual(match_wildcard(pattern, self.reader), expected)
+        self.assertEqual(match_wildcard("*" + terms[0], self.reader), [])
+
+    def test_wildcard_scan_limit(self):
+        # Only the first 10 terms starting with the prefix of the pattern are matched.
+        prefix = Counter(term[0] for term in self.frequencies).most_common(1)[0][0]
+        pattern = prefix + "*e*"
+        first = sorted(term for term in self.frequencies if term.startswith(prefix))[
+            :10
+        ]
+        with mock.patch.object(suggest, "WILDCARD_SCAN_LIMIT", 10):
+            matches = match_wildcard(pattern, self.reader)
+        self.assertTrue(matches)
+        self.assertLessEqual(set(matches), set(first))
+        self.assertFalse(set(match_wildcard(pattern, self.reader)) <= set(first))
+
+    def test_expand_wildcards(self):
+        term = sorted(self.frequencies)[0]
+        self.assertEqual(
+            expand_wildcards([term, "other"], self.reader), [term, "other"]
+        )
+        expanded = expand_wildcards([term, term[:2] + "*"], self.reader)
+        self.assertEqual(expanded, [term] + match_wildcard(term[:2] + "*", self.reader))
+        self.assertEqual(expand_wildcards(["", "qqqq*"], self.reader), [""])
@@ -0,0 +1,32 @@
+"""
+WSGI entry point of the Meklet Search Engine Web Client, for production servers.
+
+    $ gunicorn wsgi:app
+
+gunicorn reads gunicorn.conf.py, which runs one worker process per core. The app is
+created before the workers are forked (preload), so the memory mapped index is
+opened once and its pages are shared read-only by all workers.
+
+The index must be built beforehand, by running app.py.
+
+Environment variables -
+    * MEKLET_OFFLINE=1 - never download NLTK data, fail if it is not installed.
+    * MEKLET_WARM_UP=<file> - replay the queries of the file (see app.warm_up) before
+      the workers are forked, so they start with warm caches.
+"""
+
+import os
+import search_engine
+from app import create_app, warm_up, load_warm_up_queries
+
+# Download Required Dependencies, if they are not installed yet.
+search_engine.download_nltk_deps(offline=os.environ.get("MEKLET_OFFLINE") == "1")
+
+if not search_engine.index_exists():
+    raise Exception(
+        "Error- No index found in ./index_files, build it by running app.py"
+    )
+
+app = create_app()
+if os.environ.get("MEKLET_WARM_UP"):
+    warm_up(app, load_warm_up_queries(os.environ["MEKLET_WARM_UP"]))